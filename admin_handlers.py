@@ -1,8 +1,13 @@
+import html
 import logging
 from telegram import Update
 from telegram.ext import ContextTypes, CallbackQueryHandler
 from core.database import db
 from core.config import config, states
+from core.profiling import profiler
+from services import broadcast
+from services.notifications import notifier
+from services.media import media_pipeline
 
 logger = logging.getLogger(__name__)
 
@@ -18,10 +23,99 @@ async def backup_database(context: ContextTypes.DEFAULT_TYPE):
     except Exception as e:
         logger.error(f"Ошибка при создании резервной копии: {e}")
 
-def cleanup_attachments(max_age_days=30):
-    now = datetime.now()
-    for filename in os.listdir("support_attachments"):
-        file_path = os.path.join("support_attachments", filename)
-        file_time = datetime.fromtimestamp(os.path.getmtime(file_path))
-        if (now - file_time).days > max_age_days:
-            os.remove(file_path)
\ No newline at end of file
+async def broadcast_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """/broadcast <текст> — рассылка всем клиентам, когда-либо оформлявшим заказ"""
+    user = update.effective_user
+    if user.id not in config.ADMIN_IDS:
+        await update.message.reply_text("⛔️ Команда доступна только администраторам")
+        return
+    
+    # Текст может начинаться с новой строки: "/broadcast\n<текст>"
+    parts = update.message.text.split(None, 1)
+    text = parts[1].strip() if len(parts) > 1 else ""
+    if not text:
+        await update.message.reply_text("Использование: /broadcast <текст сообщения>")
+        return
+    
+    campaign_id = db.create_broadcast(text, user.id)
+    progress = await update.message.reply_text(f"📣 Рассылка #{campaign_id} запущена...")
+    db.set_broadcast_progress_message(campaign_id, progress.chat_id, progress.message_id)
+    broadcast.start_broadcast(context.application, campaign_id)
+    logger.info(f"Broadcast {campaign_id} created by admin {user.id}")
+
+async def replay_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """/replay [id|all] — повторная отправка уведомлений из dead-letter; без аргумента — список"""
+    user = update.effective_user
+    if user.id not in config.ADMIN_IDS:
+        await update.message.reply_text("⛔️ Команда доступна только администраторам")
+        return
+    
+    arg = update.message.text.partition(' ')[2].strip()
+    if not arg:
+        letters = notifier.dead_letters()
+        if not letters:
+            await update.message.reply_text("📭 Недоставленных уведомлений нет")
+            return
+        lines = [
+            f"#{l['id']} {l['channel']} → {l['user_id']}: {l['last_error']} ({l['attempts']} попыток)"
+            for l in letters
+        ]
+        await update.message.reply_text(
+            "📮 Недоставленные уведомления:\n" + "\n".join(lines) +
+            "\n\nИспользование: /replay <id> или /replay all"
+        )
+        return
+    
+    if arg != "all" and not arg.isdigit():
+        await update.message.reply_text("Использование: /replay <id> или /replay all")
+        return
+    replayed = notifier.replay(None if arg == "all" else int(arg))
+    await update.message.reply_text(f"🔁 Повторно поставлено в очередь: {replayed}")
+    logger.info(f"Admin {user.id} replayed {replayed} dead-lettered notifications ({arg})")
+
+async def sqltop_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """/sqltop [N] [total|avg|count|max] — самые дорогие SQL-запросы; /sqltop reset — сброс"""
+    user = update.effective_user
+    if user.id not in config.ADMIN_IDS:
+        await update.message.reply_text("⛔️ Команда доступна только администраторам")
+        return
+    
+    args = update.message.text.split()[1:]
+    if args == ["reset"]:
+        profiler.reset()
+        await update.message.reply_text("🧹 Статистика SQL сброшена")
+        return
+    limit = next((int(a) for a in args if a.isdigit()), 10)
+    order_by = next((a for a in args if a in ("total", "avg", "count", "max")), "total")
+    
+    rows = profiler.top(limit, order_by)
+    if not rows:
+        await update.message.reply_text("📭 Запросов еще не было")
+        return
+    blocks = []
+    for i, row in enumerate(rows, 1):
+        block = (
+            f"<b>{i}.</b> {row['count']}× — всего {row['total_ms']:.0f} мс, "
+            f"ср. {row['avg_ms']:.2f} мс, макс. {row['max_ms']:.1f} мс, медленных {row['slow']}\n"
+            f"<code>{html.escape(row['statement'][:400])}</code>"
+        )
+        if row['full_scans']:
+            block += f"\n⚠️ {html.escape(', '.join(row['full_scans']))}"
+        blocks.append(block)
+    
+    # Разбиваем по пределу длины сообщения Telegram
+    message = f"🗄 Топ SQL по {order_by}:"
+    for block in blocks:
+        if len(message) + len(block) + 2 > 4096:
+            await update.message.reply_text(message, parse_mode="HTML")
+            message = ""
+        message = f"{message}\n\n{block}" if message else block
+    await update.message.reply_text(message, parse_mode="HTML")
+
+async def cleanup_attachments(context: ContextTypes.DEFAULT_TYPE, max_age_days: int = 30):
+    """Сборка мусора во вложениях поддержки по таблице attachments (без обхода каталога)"""
+    try:
+        removed = await media_pipeline.collect_garbage(max_age_days)
+        logger.info(f"Удалено неиспользуемых вложений: {removed}")
+    except Exception as e:
+        logger.error(f"Ошибка очистки вложений: {e}")
@@ -0,0 +1,40 @@
+import logging
+from typing import Optional, Tuple
+from core.database import db, ANY_PERFORMER, SlotUnavailableError
+
+logger = logging.getLogger(__name__)
+
+
+def pick_performers(date: str, time: str, program: str = None):
+    """
+    Свободные исполнители на слот, от наименее загруженного (по часам предстоящих шоу).
+    Проверка каждого исполнителя — O(log n) по индексу интервалов.
+    """
+    db._ensure_schedule()
+    return db.schedule.least_loaded_free(db.get_assignable_performers(), date, time, program)
+
+
+def save_order_with_assignment(order_data: dict, reservation_id: int = None) -> Tuple[int, Optional[str]]:
+    """
+    Сохраняет заказ; для «Любой свободный» подбирает исполнителя и бронирует слот за ним.
+    Возвращает (order_id, назначенный исполнитель или None).
+    """
+    if order_data.get('order_performers') != ANY_PERFORMER:
+        return db.save_order(order_data, reservation_id=reservation_id), None
+
+    for performer in pick_performers(order_data['order_date'], order_data['order_time'],
+                                     order_data.get('order_program')):
+        try:
+            # save_order повторно проверяет слот под блокировкой, поэтому гонка с другим
+            # клиентом лишь переводит нас к следующему кандидату
+            order_id = db.save_order({**order_data, 'order_performers': performer})
+            order_data['order_performers'] = performer
+            logger.info(f"Order {order_id} auto-assigned to {performer}")
+            return order_id, performer
+        except SlotUnavailableError:
+            continue
+
+    logger.warning(
+        f"No free performer for {order_data['order_date']} {order_data['order_time']}, saving unassigned"
+    )
+    return db.save_order(order_data), None
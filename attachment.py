@@ -0,0 +1,13 @@
+from core.base import Base
+from sqlalchemy import Column, Integer, String, DateTime
+import datetime
+
+class Attachment(Base):
+    __tablename__ = 'attachments'
+    sha256 = Column(String(64), primary_key=True)
+    storage = Column(String, nullable=False)  # local / s3
+    location = Column(String, nullable=False)  # путь на диске или ключ S3
+    size = Column(Integer)
+    refcount = Column(Integer, nullable=False, default=0)
+    created_at = Column(DateTime, default=datetime.datetime.utcnow)
+    orphaned_at = Column(DateTime, index=True)  # когда refcount стал 0; NULL — используется
@@ -0,0 +1,265 @@
+import hashlib
+import logging
+import os
+import shutil
+import threading
+import time
+from datetime import datetime, timedelta
+from typing import Callable, Optional, Tuple
+from sqlalchemy.exc import IntegrityError
+from core.database import db
+from models.attachment import Attachment
+from models.support_ticket import SupportTicket
+
+logger = logging.getLogger(__name__)
+
+ATTACHMENTS_DIR = "support_attachments"
+CHUNK_SIZE = 1024 * 1024
+LOCK_STRIPES = 64
+# Ключи S3 скриншотов, сохраненных до хранилища по хешу
+LEGACY_S3_PREFIX = "support/"
+
+
+def sha256_file(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(CHUNK_SIZE), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def shard_key(sha256: str, ext: str = "jpg") -> str:
+    """ab/cd/abcd....jpg — не больше 65536 каталогов, файлы распределены равномерно"""
+    return f"{sha256[:2]}/{sha256[2:4]}/{sha256}.{ext}"
+
+
+class AttachmentStore:
+    """
+    Хранилище вложений с адресацией по SHA-256 и счетчиком ссылок в БД.
+    Одинаковые файлы хранятся один раз; сборщик мусора работает по таблице
+    attachments и не обходит каталог.
+    Все методы синхронные и рассчитаны на запуск в пуле потоков.
+    """
+
+    def __init__(self, root: str = ATTACHMENTS_DIR):
+        self.root = root
+        # Блокировка по хешу: сборщик мусора не удаляет файл, который acquire сейчас сохраняет заново
+        self._locks = [threading.Lock() for _ in range(LOCK_STRIPES)]
+
+    def _lock_for(self, sha256: str) -> threading.Lock:
+        return self._locks[int(sha256[:4], 16) % LOCK_STRIPES]
+
+    def local_path(self, sha256: str) -> str:
+        return os.path.join(self.root, *shard_key(sha256).split('/'))
+
+    def _store_local(self, src_path: str, sha256: str) -> str:
+        dst_path = self.local_path(sha256)
+        os.makedirs(os.path.dirname(dst_path), exist_ok=True)
+        # Содержимое совпадает по определению, поэтому гонка двух replace безопасна
+        shutil.move(src_path, dst_path)
+        return dst_path
+
+    def _increment(self, sha256: str) -> Optional[str]:
+        with db.session_scope() as session:
+            attachment = session.get(Attachment, sha256)
+            if not attachment:
+                return None
+            attachment.refcount += 1
+            attachment.orphaned_at = None
+            return attachment.location
+
+    def acquire(self, src_path: str, upload: Callable[[str, str], str] = None) -> Tuple[str, str]:
+        """
+        Добавляет файл в хранилище (или увеличивает счетчик ссылок, если такой уже есть).
+        upload(path, key) -> location позволяет хранить содержимое во внешнем хранилище (S3).
+        Возвращает (sha256, location).
+        """
+        sha256 = sha256_file(src_path)
+        with self._lock_for(sha256):
+            location = self._increment(sha256)
+            if location:
+                logger.info(f"Attachment {sha256[:12]} deduplicated")
+                return sha256, location
+
+            size = os.path.getsize(src_path)
+            if upload:
+                storage, location = 's3', upload(src_path, f"support/{shard_key(sha256)}")
+            else:
+                storage, location = 'local', self._store_local(src_path, sha256)
+
+            try:
+                with db.session_scope() as session:
+                    session.add(Attachment(
+                        sha256=sha256, storage=storage, location=location, size=size, refcount=1
+                    ))
+            except IntegrityError:
+                # Тот же файл параллельно добавил другой процесс
+                location = self._increment(sha256)
+        return sha256, location
+
+    def release(self, sha256: str):
+        """Уменьшает счетчик ссылок; при нуле вложение становится кандидатом на удаление"""
+        with db.session_scope() as session:
+            attachment = session.get(Attachment, sha256)
+            if attachment and attachment.refcount > 0:
+                attachment.refcount -= 1
+                if attachment.refcount == 0:
+                    attachment.orphaned_at = datetime.utcnow()
+
+    def release_tickets_older_than(self, max_age_days: int, batch_size: int = 500) -> int:
+        """Отвязывает вложения от старых тикетов (по индексу created_at)"""
+        cutoff = datetime.utcnow() - timedelta(days=max_age_days)
+        released = 0
+        while True:
+            with db.session_scope() as session:
+                tickets = (
+                    session.query(SupportTicket)
+                    .filter(SupportTicket.created_at < cutoff, SupportTicket.photo_sha256.isnot(None))
+                    .limit(batch_size)
+                    .all()
+                )
+                if not tickets:
+                    return released
+                for ticket in tickets:
+                    attachment = session.get(Attachment, ticket.photo_sha256)
+                    if attachment and attachment.refcount > 0:
+                        attachment.refcount -= 1
+                        if attachment.refcount == 0:
+                            attachment.orphaned_at = datetime.utcnow()
+                    ticket.photo_sha256 = None
+                    ticket.photo_path = None
+                released += len(tickets)
+
+    @staticmethod
+    def _claim(sha256: str, cutoff: datetime) -> bool:
+        """
+        Удаляет строку, только если вложение все еще без ссылок и осиротело до cutoff.
+        True — строка удалена этим вызовом и файл можно удалять.
+        """
+        with db.session_scope() as session:
+            claimed = session.query(Attachment).filter(
+                Attachment.sha256 == sha256,
+                Attachment.refcount == 0,
+                Attachment.orphaned_at.isnot(None),
+                Attachment.orphaned_at < cutoff,
+            ).delete(synchronize_session=False)
+        return claimed == 1
+
+    def collect_garbage(self, grace_period: timedelta = timedelta(hours=1),
+                        delete_remote: Callable[[str], None] = None, batch_size: int = 500) -> int:
+        """
+        Удаляет вложения без ссылок, осиротевшие дольше grace_period.
+        Кандидаты выбираются по индексу orphaned_at — объем работы пропорционален
+        числу удаляемых файлов, а не размеру каталога. Каждая строка сначала
+        забирается условным DELETE: если acquire успел снова сослаться на
+        вложение, строка и файл остаются.
+        """
+        cutoff = datetime.utcnow() - grace_period
+        removed = 0
+        while True:
+            with db.session_scope() as session:
+                candidates = [
+                    {
+                        "sha256": a.sha256, "storage": a.storage, "location": a.location,
+                        "size": a.size, "created_at": a.created_at, "orphaned_at": a.orphaned_at,
+                    }
+                    for a in session.query(Attachment)
+                    .filter(Attachment.orphaned_at.isnot(None), Attachment.orphaned_at < cutoff)
+                    .limit(batch_size)
+                ]
+            if not candidates:
+                return removed
+            batch_removed = 0
+            for candidate in candidates:
+                if candidate["storage"] == 's3' and not delete_remote:
+                    continue  # S3 сейчас не настроен — удалим позже
+                with self._lock_for(candidate["sha256"]):
+                    if not self._claim(candidate["sha256"], cutoff):
+                        continue
+                    try:
+                        if candidate["storage"] == 's3':
+                            delete_remote(candidate["location"])
+                        elif os.path.exists(candidate["location"]):
+                            os.remove(candidate["location"])
+                    except Exception as e:
+                        logger.error(f"Failed to delete attachment {candidate['sha256']}: {e}")
+                        # Строка возвращается, чтобы удаление повторилось при следующей сборке
+                        with db.session_scope() as session:
+                            session.add(Attachment(refcount=0, **candidate))
+                        continue
+                batch_removed += 1
+            removed += batch_removed
+            if len(candidates) < batch_size or not batch_removed:
+                return removed
+
+    def sweep_legacy(self, max_age_days: int, delete_remote: Callable[[str], None] = None,
+                     batch_size: int = 500) -> int:
+        """
+        Скриншоты, сохраненные до хранилища по хешу (photo_path без photo_sha256:
+        {ticket_id}.jpg в корне каталога или ключ support/... в S3), удаляются
+        по возрасту тикета, как раньше. Файлы старого формата без тикета удаляются
+        по времени изменения; просматривается только верхний уровень каталога.
+        """
+        cutoff = datetime.utcnow() - timedelta(days=max_age_days)
+        removed = 0
+        last_id = 0
+        while True:
+            with db.session_scope() as session:
+                rows = (
+                    session.query(SupportTicket.id, SupportTicket.photo_path)
+                    .filter(
+                        SupportTicket.photo_sha256.is_(None),
+                        SupportTicket.photo_path.isnot(None),
+                        SupportTicket.created_at < cutoff,
+                        SupportTicket.id > last_id,
+                    )
+                    .order_by(SupportTicket.id)
+                    .limit(batch_size)
+                    .all()
+                )
+            if not rows:
+                break
+            cleared = []
+            for ticket_id, path in rows:
+                try:
+                    if path.startswith(LEGACY_S3_PREFIX):
+                        if not delete_remote:
+                            continue
+                        delete_remote(path)
+                    elif os.path.exists(path):
+                        os.remove(path)
+                except Exception as e:
+                    logger.error(f"Failed to delete legacy attachment {path}: {e}")
+                    continue
+                cleared.append(ticket_id)
+            if cleared:
+                with db.session_scope() as session:
+                    session.query(SupportTicket).filter(SupportTicket.id.in_(cleared)).update(
+                        {SupportTicket.photo_path: None}, synchronize_session=False
+                    )
+            removed += len(cleared)
+            last_id = rows[-1][0]
+
+        if not os.path.isdir(self.root):
+            return removed
+        with db.session_scope() as session:
+            referenced = {
+                os.path.abspath(path) for (path,) in session.query(SupportTicket.photo_path).filter(
+                    SupportTicket.photo_sha256.is_(None), SupportTicket.photo_path.isnot(None)
+                )
+            }
+        threshold = time.time() - max_age_days * 86400
+        for entry in os.scandir(self.root):
+            # Шардированные вложения лежат в подкаталогах и сюда не попадают
+            if not entry.is_file() or os.path.abspath(entry.path) in referenced:
+                continue
+            try:
+                if entry.stat().st_mtime < threshold:
+                    os.remove(entry.path)
+                    removed += 1
+            except OSError as e:
+                logger.error(f"Failed to delete legacy attachment {entry.path}: {e}")
+        return removed
+
+
+attachment_store = AttachmentStore()
@@ -2,6 +2,9 @@ from telegram import Update
 from telegram.ext import ContextTypes, ConversationHandler
 from core.config import config, states
 from core.utils import main_menu_keyboard
+from core.database import db
+from core import metrics
+import html
 import logging
 
 logger = logging.getLogger(__name__)
@@ -36,6 +39,7 @@ async def help_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
         "ℹ️ *Доступные команды:*\n"
         "/start - начать работу\n"
         "/order - создать заказ\n"
+        "/quickorder - создать заказ через форму\n"
         "/support - связаться с поддержкой\n"
         "/cancel - отменить текущую операцию\n"
         "/help - показать справку",
@@ -44,12 +48,68 @@ async def help_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
 async def cancel(update: Update, context: ContextTypes.DEFAULT_TYPE):
     user = update.effective_user
-    await update.message.reply_text(
+    if update.callback_query:
+        await update.callback_query.answer()
+    await update.effective_message.reply_text(
         "❌ Операция отменена.",
         reply_markup=main_menu_keyboard(user.id in config.ADMIN_IDS)
     )
+    # Освобождаем слот, удерживаемый незавершенным заказом
+    reservation_id = context.user_data.get('reservation_id')
+    if reservation_id:
+        db.release_hold(reservation_id)
     context.user_data.clear()
     return ConversationHandler.END
 
 async def system_status(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    await update.message.reply_text("✅ Бот работает в штатном режиме")
\ No newline at end of file
+    """/status — для администраторов сводка метрик (то же, что отдает /metrics)"""
+    if update.effective_user.id not in config.ADMIN_IDS:
+        await update.message.reply_text("✅ Бот работает в штатном режиме")
+        return
+    
+    stats = metrics.snapshot()
+    process = stats['process']
+    hours, rest = divmod(int(stats['uptime_seconds']), 3600)
+    lines = [
+        "✅ <b>Бот работает</b>",
+        f"⏱ Аптайм: {hours} ч {rest // 60} мин",
+        f"💾 RSS: {process['rss_bytes'] / 2**20:.1f} МБ, CPU: {process['cpu_percent']:.1f}%, потоков: {process['threads']}",
+        "",
+        f"📨 Обновлений: {int(stats['updates'])}, ошибок: {int(stats['handler_errors'])}",
+    ]
+    for row in stats['handlers'][:5]:
+        lines.append(f"  • {html.escape(row['handler'])}: {row['count']}, ср. {row['avg_ms']:.0f} мс, p95 ≤ {row['p95_ms']:.0f} мс")
+    
+    slowest = sorted(stats['states'].items(), key=lambda item: item[1]['p95'], reverse=True)[:5]
+    if slowest:
+        lines += ["", "🐢 Шаги диалогов (p50 / p95 / p99):"]
+        for state, row in slowest:
+            lines.append(
+                f"  • {html.escape(state)}: {row['p50'] * 1000:.0f} / {row['p95'] * 1000:.0f} / "
+                f"{row['p99'] * 1000:.0f} мс ({row['count']})"
+            )
+    if stats['slow_updates']:
+        last = stats['slow_updates'][-1]
+        lines.append(
+            f"  Последнее медленное: {html.escape(last['state'])} {last['total_ms']:.0f} мс "
+            f"(API {last['api_ms']:.0f}, БД {last['db_ms']:.0f}, прочее {last['other_ms']:.0f})"
+        )
+    
+    db_rows = stats['db']
+    if db_rows:
+        total = sum(row['count'] for row in db_rows)
+        lines += ["", f"🗄 SQL-запросов: {total}"]
+        for row in db_rows[:4]:
+            lines.append(f"  • {row['operation']}: {row['count']}, ср. {row['avg_ms']:.2f} мс, p95 ≤ {row['p95_ms']:.1f} мс")
+    
+    lines += ["", "🧠 Кэши (попадания):"]
+    for name, ratio in stats['caches'].items():
+        lines.append(f"  • {name}: {'—' if ratio is None else f'{ratio:.0%}'}")
+    
+    outbound = stats['outbound']
+    lines += [
+        "",
+        f"📤 Исходящие: {int(outbound.get('ok', 0))} отправлено, {int(outbound.get('error', 0))} ошибок, "
+        f"{int(outbound.get('retry_after', 0))} повторов (≈{stats['outbound_per_minute']:.1f}/мин)"
+    ]
+    await update.message.reply_text("\n".join(lines), parse_mode="HTML")
\ No newline at end of file
@@ -0,0 +1,165 @@
+# bench_calendar_clients.py
+# Сколько HTTP-запросов к Google экономит CalendarClientCache по сравнению
+# с прежним SERVICE_CACHE (словарь без вытеснения и без сохранения токенов).
+# Google заменяется локальным сервером: /token (OAuth) и /calendar/v3 (API).
+import json
+import os
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+os.environ.setdefault("DATABASE_NAME", os.path.join(tempfile.mkdtemp(), "bench_calendar.db"))
+
+from cachetools import LRUCache
+from google.oauth2.credentials import Credentials
+from googleapiclient.discovery import build
+
+from core.database import db
+from models.performer import Performer
+from services.google_calendar import CalendarClientCache
+
+PERFORMERS = 20
+REQUESTS_PER_RUN = 400
+CACHE_SIZE = 5
+BURST_THREADS = 8
+
+
+class Counters:
+    def __init__(self):
+        self.token = 0
+        self.api = 0
+        self.lock = threading.Lock()
+
+
+counters = Counters()
+
+
+class Handler(BaseHTTPRequestHandler):
+    def log_message(self, *args):
+        pass
+
+    def _reply(self, payload):
+        data = json.dumps(payload).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        with counters.lock:
+            counters.token += 1
+            token = f"access-{counters.token}"
+        self._reply({"access_token": token, "expires_in": 3600, "token_type": "Bearer"})
+
+    def do_GET(self):
+        with counters.lock:
+            counters.api += 1
+        self._reply({"items": []})
+
+
+server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+threading.Thread(target=server.serve_forever, daemon=True).start()
+BASE_URL = f"http://127.0.0.1:{server.server_port}"
+
+
+def load_credentials(info: dict) -> Credentials:
+    return Credentials.from_authorized_user_info(info).with_token_uri(f"{BASE_URL}/token")
+
+
+def build_service(creds: Credentials):
+    return build(
+        "calendar", "v3",
+        credentials=creds,
+        static_discovery=True,
+        client_options={"api_endpoint": f"{BASE_URL}/calendar/v3/"}
+    )
+
+
+def reset_tokens():
+    """Сохраненные токены исполнителей с истекшим access token"""
+    expired = json.dumps({
+        "refresh_token": "refresh", "client_id": "client", "client_secret": "secret",
+        "expiry": "2000-01-01T00:00:00Z",
+    })
+    with db.session_scope() as session:
+        for i in range(PERFORMERS):
+            performer = session.query(Performer).filter_by(telegram_user_id=10_000 + i).first()
+            if not performer:
+                performer = Performer(performer_name=f"Bench {i}", telegram_user_id=10_000 + i)
+                session.add(performer)
+            performer.google_tokens = expired
+
+
+def legacy_factory(cache):
+    """Прежний get_calendar_service: сервис из сохраненных токенов, токен не сохраняется"""
+    def get(user_id):
+        if user_id in cache:
+            return cache[user_id]
+        tokens = json.loads(db.get_performer_by_user_id(user_id)["google_tokens"])
+        service = cache[user_id] = build_service(load_credentials(tokens))
+        return service
+    return get
+
+
+def run_lifetime(get_service):
+    """Один запуск бота: всплеск одновременных обращений, затем поток операций"""
+    with ThreadPoolExecutor(max_workers=BURST_THREADS) as pool:
+        list(pool.map(lambda _: get_service(10_000), range(BURST_THREADS)))
+    for i in range(REQUESTS_PER_RUN):
+        service = get_service(10_000 + i % PERFORMERS)
+        service.events().list(calendarId="primary").execute()
+
+
+def measure(name, make_getter, lifetimes=2):
+    reset_tokens()
+    token_before, api_before = counters.token, counters.api
+    getter = None
+    for _ in range(lifetimes):
+        getter = make_getter()  # перезапуск: кэш в памяти пуст
+        run_lifetime(getter)
+    return name, {
+        "token_requests": counters.token - token_before,
+        "api_requests": counters.api - api_before,
+    }, getter
+
+
+def main():
+    results = {}
+    name, stats, _ = measure("legacy_dict", lambda: legacy_factory({}))
+    results[name] = stats
+    name, stats, _ = measure("bounded_dict_without_persistence", lambda: legacy_factory(LRUCache(maxsize=CACHE_SIZE)))
+    results[name] = stats
+
+    caches = []
+
+    def make_cache():
+        cache = CalendarClientCache(
+            maxsize=CACHE_SIZE, credentials_loader=load_credentials, service_builder=build_service
+        )
+        caches.append(cache)
+        return cache.get
+
+    name, stats, _ = measure("client_cache", make_cache)
+    stats["cache_stats"] = [cache.stats for cache in caches]
+    results[name] = stats
+
+    baseline = results["bounded_dict_without_persistence"]["token_requests"]
+    results["token_requests_saved_vs_bounded"] = baseline - results["client_cache"]["token_requests"]
+    results["token_requests_saved_vs_legacy"] = (
+        results["legacy_dict"]["token_requests"] - results["client_cache"]["token_requests"]
+    )
+    print(json.dumps({
+        "performers": PERFORMERS,
+        "requests_per_lifetime": REQUESTS_PER_RUN,
+        "lifetimes": 2,
+        "cache_size": CACHE_SIZE,
+        **results,
+    }, indent=2))
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,306 @@
+# bench_conversations.py
+# Сквозная нагрузка на диалоги: тысячи синтетических пользователей проходят
+# заказ и обращение в поддержку через обработчики из main.register_handlers.
+# Bot API подменен в процессе (BaseRequest с задержкой ответа), поэтому
+# работают настоящие Update, CallbackQuery и сериализация запросов PTB.
+# Пользователь отвечает на то, что бот ему показал: нажимает кнопки последней
+# клавиатуры и вводит текст на последний вопрос.
+# Результат — JSON в stdout для сравнения прогонов; нужен .env, как для main.py.
+import asyncio
+import json
+import logging
+import os
+import random
+import resource
+import sys
+import tempfile
+import time
+from collections import Counter
+from itertools import count
+from typing import Dict, List
+
+_tmp = tempfile.mkdtemp()
+os.environ.setdefault("DATABASE_NAME", os.path.join(_tmp, "bench_conversations.db"))
+
+from sqlalchemy import event
+from telegram import Update
+from telegram.ext import ApplicationBuilder
+from telegram.request import BaseRequest
+
+import main
+from core import logging_setup
+from core.config import config
+from core.database import db
+from core.tracing import tracer
+from services.notifications import notifier
+from services.outbound import outbound
+
+ORDER_USERS = 2000
+SUPPORT_USERS = 2000
+CONCURRENCY = 200  # пользователей в диалоге одновременно
+API_LATENCY = 0.02  # ответ Bot API, сек
+MAX_STEPS = 40  # пользователь бросает диалог, если не уложился
+SEED = 1
+BOT_ID = 1
+
+
+class FakeTelegram(BaseRequest):
+    """Bot API в процессе: отвечает как сервер Telegram и помнит последнее сообщение бота в каждом чате"""
+
+    def __init__(self, latency: float = 0.0):
+        self.latency = latency
+        self.calls: Counter = Counter()
+        self.last: Dict[int, dict] = {}
+        self._message_ids = count(1_000_000)
+
+    @property
+    def read_timeout(self):
+        return None
+
+    async def initialize(self):
+        pass
+
+    async def shutdown(self):
+        pass
+
+    async def do_request(self, url, method, request_data=None, read_timeout=None,
+                         write_timeout=None, connect_timeout=None, pool_timeout=None):
+        api_method = url.rsplit("/", 1)[-1]
+        self.calls[api_method] += 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        result = self._result(api_method, request_data.parameters if request_data else {})
+        return 200, json.dumps({"ok": True, "result": result}).encode()
+
+    def _result(self, api_method: str, params: dict):
+        if api_method == "getMe":
+            return {"id": BOT_ID, "is_bot": True, "first_name": "Bench", "username": "bench_bot"}
+        if not api_method.startswith(("send", "edit")):
+            return True
+        chat_id = int(params["chat_id"])
+        message_id = params.get("message_id") or next(self._message_ids)
+        keyboard = (params.get("reply_markup") or {}).get("inline_keyboard")
+        text = params.get("text") or params.get("caption") or ""
+        self.last[chat_id] = {"message_id": message_id, "text": text, "keyboard": keyboard}
+        message = {
+            "message_id": message_id,
+            "date": int(time.time()),
+            "chat": {"id": chat_id, "type": "private"},
+            "from": {"id": BOT_ID, "is_bot": True, "first_name": "Bench"},
+            "text": text,
+        }
+        if keyboard:
+            message["reply_markup"] = {"inline_keyboard": keyboard}
+        return message
+
+
+class Phase:
+    """Счетчики одного этапа прогона"""
+
+    def __init__(self):
+        self.latencies: List[float] = []
+        self.outcomes: Counter = Counter()
+        self.queries = 0
+
+
+class SimulatedUser:
+    _update_ids = count(1)
+    _message_ids = count(1)
+
+    def __init__(self, user_id: int, application, api: FakeTelegram, run: Phase, rng: random.Random):
+        self.user_id = user_id
+        self.application = application
+        self.api = api
+        self.run = run
+        self.rng = rng
+        self.chat = {"id": user_id, "type": "private", "first_name": f"User{user_id}"}
+        self.user = {"id": user_id, "is_bot": False, "first_name": f"User{user_id}", "username": f"user{user_id}"}
+
+    async def _process(self, payload: dict):
+        update = Update.de_json({"update_id": next(self._update_ids), **payload}, self.application.bot)
+        started = time.perf_counter()
+        await self.application.process_update(update)
+        self.run.latencies.append(time.perf_counter() - started)
+
+    async def say(self, text: str):
+        message = {
+            "message_id": next(self._message_ids), "date": int(time.time()),
+            "chat": self.chat, "from": self.user, "text": text,
+        }
+        if text.startswith("/"):
+            message["entities"] = [{"type": "bot_command", "offset": 0, "length": len(text.split()[0])}]
+        await self._process({"message": message})
+
+    async def press(self, data: str):
+        last = self.api.last[self.user_id]
+        await self._process({"callback_query": {
+            "id": str(next(self._update_ids)), "from": self.user, "chat_instance": str(self.user_id),
+            "data": data,
+            "message": {
+                "message_id": last["message_id"], "date": int(time.time()), "chat": self.chat,
+                "from": {"id": BOT_ID, "is_bot": True, "first_name": "Bench"}, "text": last["text"],
+            },
+        }})
+
+    @property
+    def shown(self) -> dict:
+        return self.api.last.get(self.user_id) or {"text": "", "keyboard": None}
+
+    def buttons(self, prefix: str) -> List[str]:
+        keyboard = self.shown["keyboard"] or []
+        return [button["callback_data"] for row in keyboard for button in row
+                if button.get("callback_data", "").startswith(prefix)]
+
+    def choices(self) -> List[str]:
+        """Варианты выбора на шагах времени, исполнителя и программы (без «Назад»)"""
+        for prefix in ("time_", "performer_", "subprogram_", "program_"):
+            if self.buttons(prefix):
+                return self.buttons(prefix)
+        return []
+
+    async def order(self) -> str:
+        await self.say("/order")
+        for _ in range(MAX_STEPS):
+            text = self.shown["text"]
+            if "Заказ успешно создан" in text:
+                return "completed"
+            if "уже занят" in text and not self.shown["keyboard"]:
+                return "slot_taken"
+            if "Неверное время" in text:
+                await self.press("back")
+            elif self.buttons(config.CALENDAR_SELECT_DAY_PREFIX + "_"):
+                await self.press(self.rng.choice(self.buttons(config.CALENDAR_SELECT_DAY_PREFIX + "_")))
+            elif self.buttons(config.CALENDAR_NEXT_MONTH_PREFIX + "_"):
+                await self.press(self.buttons(config.CALENDAR_NEXT_MONTH_PREFIX + "_")[0])
+            elif self.buttons("confirm_order"):
+                await self.press("confirm_order")
+            elif self.choices():
+                await self.press(self.rng.choice(self.choices()))
+            elif "место проведения" in text:
+                await self.say(f"Москва, ул. Тестовая, д. {self.rng.randint(1, 200)}")
+            elif "сумму заказа" in text:
+                await self.say(str(self.rng.choice((5000, 7500, 12000, 20000))))
+            elif "детали" in text:
+                await self.say("Детский праздник, 15 гостей")
+            else:
+                return "stuck"
+        return "abandoned"
+
+    async def support(self) -> str:
+        await self.say("/support")
+        if "Опишите" not in self.shown["text"]:
+            return "stuck"
+        await self.say(f"Не приходит подтверждение заказа, пользователь {self.user_id}")
+        if not self.buttons("support_attach_no"):
+            return "stuck"
+        await self.press("support_attach_no")
+        return "completed" if "передан в поддержку" in self.shown["text"] else "stuck"
+
+
+def percentiles(samples: List[float]) -> dict:
+    ordered = sorted(samples)
+    if not ordered:
+        return {}
+    pick = lambda q: ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+    return {
+        "p50_ms": round(pick(0.50) * 1000, 2),
+        "p95_ms": round(pick(0.95) * 1000, 2),
+        "p99_ms": round(pick(0.99) * 1000, 2),
+        "max_ms": round(ordered[-1] * 1000, 2),
+    }
+
+
+async def run_phase(application, api: FakeTelegram, flow: str, users: int, first_user_id: int) -> dict:
+    run = Phase()
+    rng = random.Random(SEED)
+    semaphore = asyncio.Semaphore(CONCURRENCY)
+
+    def on_query(*args):
+        run.queries += 1
+
+    async def one(user_id: int):
+        async with semaphore:
+            user = SimulatedUser(user_id, application, api, run, random.Random(rng.random()))
+            run.outcomes[await getattr(user, flow)()] += 1
+
+    event.listen(db.engine, "before_cursor_execute", on_query)
+    started = time.perf_counter()
+    try:
+        await asyncio.gather(*[one(first_user_id + i) for i in range(users)])
+    finally:
+        elapsed = time.perf_counter() - started
+        event.remove(db.engine, "before_cursor_execute", on_query)
+
+    completed = run.outcomes["completed"]
+    return {
+        "users": users,
+        "outcomes": dict(run.outcomes),
+        "updates": len(run.latencies),
+        "seconds": round(elapsed, 3),
+        "updates_per_second": round(len(run.latencies) / elapsed, 1),
+        "latency": percentiles(run.latencies),
+        "db_queries": run.queries,
+        "db_queries_per_completed": round(run.queries / completed, 1) if completed else None,
+    }
+
+
+def peak_rss_mb() -> float:
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux отдает килобайты, macOS — байты
+    return round(peak / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+
+async def bench() -> dict:
+    api = FakeTelegram(API_LATENCY)
+    application = (
+        ApplicationBuilder()
+        .token(config.BOT_TOKEN)
+        .request(api)
+        .get_updates_request(FakeTelegram())
+        .build()
+    )
+    main.register_handlers(application)
+    # Все обновления прогона попадают в перцентили состояний
+    tracer.window = (ORDER_USERS + SUPPORT_USERS) * MAX_STEPS
+
+    await application.initialize()
+    outbound.start()
+    try:
+        order = await run_phase(application, api, "order", ORDER_USERS, 100_000)
+        support = await run_phase(application, api, "support", SUPPORT_USERS, 200_000)
+        await notifier.digest.flush_all()
+    finally:
+        await outbound.stop()
+        await notifier.stop()
+        await application.shutdown()
+
+    states = {
+        tag: {
+            "count": stats["count"],
+            "p50_ms": round(stats["p50"] * 1000, 2),
+            "p95_ms": round(stats["p95"] * 1000, 2),
+            "p99_ms": round(stats["p99"] * 1000, 2),
+        }
+        for tag, stats in sorted(tracer.percentiles().items())
+    }
+    return {
+        "concurrency": CONCURRENCY,
+        "api_latency_s": API_LATENCY,
+        "order": order,
+        "support": support,
+        "states": states,
+        "api_calls": dict(api.calls),
+        "peak_rss_mb": peak_rss_mb(),
+    }
+
+
+def run():
+    # Журнал прогона — в файл рядом с базой, чтобы stdout оставался чистым JSON
+    logging_setup.setup_logging(handlers=[logging.FileHandler(os.path.join(_tmp, "bench.log"), encoding="utf-8")])
+    result = asyncio.run(bench())
+    logging_setup.stop_logging()
+    print(json.dumps(result, indent=2, ensure_ascii=False))
+
+
+if __name__ == "__main__":
+    run()
@@ -0,0 +1,93 @@
+# bench_email.py
+# Писем в секунду: прежняя отправка (новое SMTP-соединение, EHLO и вход на каждое письмо)
+# против EmailTransport (пул сессий и пачки). Сервер — локальный aiosmtpd
+# (pip install -r requirements-dev.txt).
+import asyncio
+import json
+import smtplib
+import socket
+import time
+from concurrent.futures import ThreadPoolExecutor
+from email.mime.text import MIMEText
+
+from aiosmtpd.controller import Controller
+
+from services.email_transport import EmailTransport
+
+MESSAGES = 1000
+POOL_SIZE = 2
+BATCH_SIZE = 20
+
+
+class Sink:
+    def __init__(self):
+        self.count = 0
+
+    async def handle_DATA(self, server, session, envelope):
+        self.count += 1
+        return "250 OK"
+
+
+def make_message(i: int) -> MIMEText:
+    msg = MIMEText(f"<b>Напоминание о заказе #{i}</b>", "html")
+    msg["Subject"] = f"Заказ #{i}"
+    msg["From"] = "bot@example.com"
+    msg["To"] = f"client{i}@example.com"
+    return msg
+
+
+def legacy_send(port: int, msg):
+    """Прежний NotificationManager._sync_send_email (без STARTTLS — сервер локальный)"""
+    with smtplib.SMTP("127.0.0.1", port) as server:
+        server.ehlo()
+        server.send_message(msg)
+
+
+async def run_legacy(port: int, messages) -> float:
+    loop = asyncio.get_running_loop()
+    with ThreadPoolExecutor(max_workers=POOL_SIZE) as executor:
+        started = time.perf_counter()
+        await asyncio.gather(*(loop.run_in_executor(executor, legacy_send, port, msg) for msg in messages))
+        return time.perf_counter() - started
+
+
+async def run_pooled(transport: EmailTransport, messages) -> float:
+    started = time.perf_counter()
+    results = await asyncio.gather(*(transport.send(msg) for msg in messages))
+    elapsed = time.perf_counter() - started
+    await transport.stop()
+    assert all(results)
+    return elapsed
+
+
+def main():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        port = sock.getsockname()[1]
+    controller = Controller(Sink(), hostname="127.0.0.1", port=port, auth_require_tls=False)
+    controller.start()
+    messages = [make_message(i) for i in range(MESSAGES)]
+    try:
+        legacy = asyncio.run(run_legacy(port, messages))
+        transport = EmailTransport(
+            host="127.0.0.1", port=port, user="", password="", pool_size=POOL_SIZE, batch_size=BATCH_SIZE
+        )
+        pooled = asyncio.run(run_pooled(transport, messages))
+    finally:
+        controller.stop()
+    assert controller.handler.count == 2 * MESSAGES
+    print(json.dumps({
+        "messages": MESSAGES,
+        "pool_size": POOL_SIZE,
+        "batch_size": BATCH_SIZE,
+        "connect_per_message": {"messages_per_second": round(MESSAGES / legacy), "connections": MESSAGES},
+        "pooled_transport": {
+            "messages_per_second": round(MESSAGES / pooled),
+            "connections": transport.pool.connects,
+        },
+        "speedup": round(legacy / pooled, 2),
+    }, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,105 @@
+# bench_media.py
+# Замер простоя event loop при 20 одновременных загрузках скриншотов:
+# старая обработка в обработчике против services.media.MediaPipeline.
+import asyncio
+import io
+import json
+import os
+import tempfile
+import time
+
+from services import attachment_store
+from services.media import MediaPipeline, compress_image
+
+CONCURRENT_UPLOADS = 20
+
+
+def make_screenshot() -> bytes:
+    from PIL import Image
+    img = Image.effect_noise((2560, 1440), 64).convert("RGB")
+    buffer = io.BytesIO()
+    img.save(buffer, format="PNG")
+    return buffer.getvalue()
+
+
+class FakeFile:
+    """Имитация telegram.File"""
+
+    def __init__(self, payload: bytes):
+        self.payload = payload
+
+    async def download_as_bytearray(self):
+        return bytearray(self.payload)
+
+    async def download_to_drive(self, custom_path):
+        with open(custom_path, "wb") as f:
+            f.write(self.payload)
+
+
+async def inline_upload(file, name: str):
+    """Прежняя логика handle_support_confirm: все на потоке event loop"""
+    photo_bytes = await file.download_as_bytearray()
+    src = os.path.join(tempfile.gettempdir(), f"inline-{name}")
+    with open(src, "wb") as f:
+        f.write(photo_bytes)
+    result = compress_image(src)
+    with open(result, "rb") as f, open(os.path.join(attachment_store.attachment_store.root, name), "wb") as out:
+        out.write(f.read())
+    for path in {src, result}:
+        os.remove(path)
+
+
+async def measure(coro_factory) -> dict:
+    """Запускает нагрузку и параллельно меряет задержки тиков event loop"""
+    stalls = []
+    stop = asyncio.Event()
+
+    async def ticker():
+        interval = 0.005
+        loop = asyncio.get_running_loop()
+        while not stop.is_set():
+            expected = loop.time() + interval
+            await asyncio.sleep(interval)
+            stalls.append(max(0.0, loop.time() - expected))
+
+    tick_task = asyncio.create_task(ticker())
+    started = time.perf_counter()
+    await asyncio.gather(*[coro_factory(i) for i in range(CONCURRENT_UPLOADS)])
+    elapsed = time.perf_counter() - started
+    stop.set()
+    await tick_task
+
+    stalls.sort()
+    return {
+        "wall_s": round(elapsed, 3),
+        "max_stall_ms": round(stalls[-1] * 1000, 1),
+        "p99_stall_ms": round(stalls[int(len(stalls) * 0.99) - 1] * 1000, 1),
+        "total_stall_ms": round(sum(stalls) * 1000, 1),
+    }
+
+
+async def main():
+    # У каждой загрузки свой скриншот: одинаковые байты хранилище дедуплицирует
+    # по хэшу, и конвейер мерил бы одно сжатие вместо двадцати
+    payloads = [make_screenshot() for _ in range(CONCURRENT_UPLOADS)]
+    workdir = tempfile.mkdtemp(prefix="bench-media-")
+    attachment_store.attachment_store.root = workdir
+
+    inline = await measure(lambda i: inline_upload(FakeFile(payloads[i]), f"inline-{i}.jpg"))
+
+    pipeline = MediaPipeline(max_concurrency=8, compress_workers=os.cpu_count() or 2, upload_workers=8)
+    # Пул процессов создается лениво, прогреваем его заранее
+    await asyncio.get_running_loop().run_in_executor(pipeline.process_pool, os.getpid)
+    offloop = await measure(lambda i: pipeline.process_telegram_file(FakeFile(payloads[i])))
+    pipeline.shutdown()
+
+    print(json.dumps({
+        "concurrent_uploads": CONCURRENT_UPLOADS,
+        "payload_bytes": sum(map(len, payloads)) // len(payloads),
+        "inline": inline,
+        "pipeline": offloop,
+    }, indent=2))
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
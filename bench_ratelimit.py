@@ -0,0 +1,89 @@
+# bench_ratelimit.py
+# 1 000 000 разных получателей через ограничитель частоты уведомлений:
+# прежний список отметок времени на ключ против GCRA (core.ratelimit.RateLimiter).
+# Время моделируется, поэтому «сутки» проходят за секунды.
+import gc
+import json
+import time
+import tracemalloc
+
+from core.ratelimit import RateLimiter
+
+RECIPIENTS = 1_000_000
+LIMIT, PERIOD = 5, 3600  # 5 сообщений в час, как у sms/email по умолчанию
+
+
+class LegacyLimiter:
+    """Прежний NotificationManager._check_rate_limit"""
+
+    def __init__(self):
+        self.rate_limit_cache = {}
+
+    def acquire(self, key, now):
+        last_sent = self.rate_limit_cache.get(key, [])
+        recent_sent = [t for t in last_sent if now - t < PERIOD]
+        if len(recent_sent) >= LIMIT:
+            return False
+        recent_sent.append(now)
+        self.rate_limit_cache[key] = recent_sent
+        return True
+
+    def __len__(self):
+        return len(self.rate_limit_cache)
+
+
+class Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def run(make_limiter, span_seconds: float, trace_memory: bool):
+    clock = Clock()
+    limiter = make_limiter(clock)
+    step = span_seconds / RECIPIENTS
+    gc.collect()
+    if trace_memory:
+        tracemalloc.start()
+    started = time.perf_counter()
+    for i in range(RECIPIENTS):
+        clock.now = i * step
+        limiter.acquire(f"email:user{i}@example.com", clock.now)
+    elapsed = time.perf_counter() - started
+    result = {"keys_retained": len(limiter)}
+    if trace_memory:
+        current, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        result.update({"memory_mb": round(current / 2**20, 1), "peak_memory_mb": round(peak / 2**20, 1)})
+    else:
+        result["ops_per_second"] = round(RECIPIENTS / elapsed)
+    return result
+
+
+def legacy(clock):
+    return LegacyLimiter()
+
+
+def gcra(clock):
+    return RateLimiter(LIMIT, PERIOD, clock=clock)
+
+
+def main():
+    scenarios = {
+        "spread_over_24h": 24 * 3600,  # ~11.6 новых получателей в секунду
+        "burst_in_1min": 60,
+    }
+    results = {}
+    for scenario, span in scenarios.items():
+        results[scenario] = {}
+        for name, factory in (("legacy_list", legacy), ("gcra", gcra)):
+            stats = run(factory, span, trace_memory=False)
+            stats.update(run(factory, span, trace_memory=True))
+            results[scenario][name] = stats
+    print(json.dumps({"recipients": RECIPIENTS, "limit": f"{LIMIT}/{PERIOD}s", **results}, indent=2))
+
+
+if __name__ == "__main__":
+    main()
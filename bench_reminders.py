@@ -0,0 +1,82 @@
+# bench_reminders.py
+# 50 000 будущих напоминаний на 60 дней вперед. Сравнение: прежний подход
+# (просмотр всех заказов на каждом тике) против ReminderScheduler (индекс
+# (status, due_at) и куча только на ближайшее окно).
+import heapq
+import json
+import os
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+os.environ.setdefault("DATABASE_NAME", os.path.join(tempfile.mkdtemp(), "bench_reminders.db"))
+
+from core.database import db
+from models.reminder import Reminder
+from services.reminders import ReminderScheduler
+
+REMINDERS = 50_000
+HORIZON_DAYS = 60
+TICKS = 60  # час работы с тиком в минуту
+
+
+def populate(start: datetime):
+    step = timedelta(days=HORIZON_DAYS) / REMINDERS
+    with db.session_scope() as session:
+        session.bulk_insert_mappings(Reminder, [
+            {
+                "order_id": i, "user_id": 10_000 + i, "audience": "customer", "kind": "24h",
+                "due_at": start + step * i, "show_at": start + step * i + timedelta(hours=24),
+                "status": "pending",
+            }
+            for i in range(REMINDERS)
+        ])
+
+
+def full_scan(start: datetime):
+    """Каждый тик — все ожидающие напоминания и отбор наступивших в Python"""
+    rows_read = 0
+    started = time.perf_counter()
+    for tick in range(TICKS):
+        now = start + timedelta(minutes=tick)
+        with db.session_scope() as session:
+            rows = session.query(Reminder.id, Reminder.due_at).filter(Reminder.status == 'pending').all()
+        rows_read += len(rows)
+        [r for r in rows if r.due_at <= now]
+    return {"seconds": round(time.perf_counter() - started, 3), "rows_read": rows_read}
+
+
+def windowed(start: datetime):
+    scheduler = ReminderScheduler(window=3600)
+    rows_read = 0
+    due = 0
+    started = time.perf_counter()
+    for tick in range(TICKS):
+        now = start + timedelta(minutes=tick)
+        if scheduler._loaded_until is None or now >= scheduler._loaded_until - scheduler.window / 2:
+            rows_read += scheduler.load_window(now)
+        while scheduler._heap and scheduler._heap[0][0] <= now:
+            scheduler._queued.discard(scheduler._heap[0][1])
+            heapq.heappop(scheduler._heap)
+            due += 1
+    return {
+        "seconds": round(time.perf_counter() - started, 3),
+        "rows_read": rows_read,
+        "due_in_hour": due,
+        "heap_size": len(scheduler._heap),
+    }
+
+
+def main():
+    start = datetime(2040, 1, 1)
+    populate(start)
+    print(json.dumps({
+        "reminders": REMINDERS,
+        "ticks": TICKS,
+        "full_scan": full_scan(start),
+        "windowed_heap": windowed(start),
+    }, indent=2))
+
+
+if __name__ == "__main__":
+    main()
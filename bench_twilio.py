@@ -0,0 +1,71 @@
+# bench_twilio.py
+# 1 000 SMS в очереди: прежний синхронный Client в ThreadPoolExecutor(max_workers=5)
+# против TwilioTransport (асинхронный клиент, общий пул keep-alive соединений).
+# Twilio заменяется локальной заглушкой REST API с задержкой сети LATENCY.
+import asyncio
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from twilio.rest import Client
+
+from services.twilio_transport import TwilioTransport
+from test_twilio_transport import ACCOUNT_SID, StubTwilio
+
+MESSAGES = 1000
+LATENCY = 0.05  # типичное время ответа api.twilio.com
+FROM = "+15550000000"
+
+
+def recipients():
+    return [f"+7900{i:07d}" for i in range(MESSAGES)]
+
+
+async def run_legacy(stub: StubTwilio) -> float:
+    """Прежний NotificationManager.send_sms"""
+    client = Client(ACCOUNT_SID, "token")
+    client.api.base_url = stub.url
+    loop = asyncio.get_running_loop()
+    with ThreadPoolExecutor(max_workers=5) as executor:
+        started = time.perf_counter()
+        await asyncio.gather(*(
+            loop.run_in_executor(executor, lambda to=to: client.messages.create(body="Напоминание", from_=FROM, to=to))
+            for to in recipients()
+        ))
+        return time.perf_counter() - started
+
+
+async def run_async(stub: StubTwilio, concurrency: int) -> float:
+    transport = TwilioTransport(ACCOUNT_SID, "token", concurrency=concurrency, base_url=stub.url)
+    try:
+        started = time.perf_counter()
+        await asyncio.gather(*(transport.send(to=to, body="Напоминание", from_=FROM) for to in recipients()))
+        return time.perf_counter() - started
+    finally:
+        await transport.close()
+
+
+def measure(name, run, *args):
+    stub = StubTwilio(latency=LATENCY)
+    elapsed = asyncio.run(run(stub, *args))
+    stub.shutdown()
+    assert len(stub.messages) == MESSAGES
+    return name, {
+        "seconds": round(elapsed, 2),
+        "messages_per_second": round(MESSAGES / elapsed),
+        "max_in_flight": stub.max_in_flight,
+        "connections": len(stub.connections),
+    }
+
+
+def main():
+    results = dict([
+        measure("thread_pool_5", run_legacy),
+        measure("async_concurrency_20", run_async, 20),
+        measure("async_concurrency_50", run_async, 50),
+    ])
+    print(json.dumps({"messages": MESSAGES, "stub_latency_s": LATENCY, **results}, indent=2))
+
+
+if __name__ == "__main__":
+    main()
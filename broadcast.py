@@ -0,0 +1,105 @@
+import asyncio
+import logging
+import time
+from telegram.constants import ParseMode
+from core.database import db
+from services.outbound import outbound, PRIORITY_BULK
+
+logger = logging.getLogger(__name__)
+
+BATCH_SIZE = 100
+PROGRESS_INTERVAL = 5  # секунд между обновлениями сообщения о прогрессе
+
+# Кампании, которые уже выполняются в этом процессе
+_running = {}
+
+
+def _progress_text(campaign: dict, rate: float, done: bool = False) -> str:
+    header = "✅ <b>Рассылка завершена</b>" if done else "📣 <b>Идет рассылка</b>"
+    return (
+        f"{header} #{campaign['id']}\n\n"
+        f"📤 Отправлено: {campaign['sent']}\n"
+        f"⚠️ Ошибок: {campaign['failed']}\n"
+        f"⚡️ Скорость: {rate:.1f} сообщ./с"
+    )
+
+
+async def _update_progress(bot, campaign_id: int, rate: float, done: bool = False):
+    campaign = db.get_broadcast(campaign_id)
+    if not campaign or not campaign.get('progress_message_id'):
+        return
+    try:
+        await outbound.send(
+            bot,
+            "edit_message_text",
+            campaign['progress_chat_id'],
+            message_id=campaign['progress_message_id'],
+            text=_progress_text(campaign, rate, done),
+            parse_mode=ParseMode.HTML
+        )
+    except Exception as e:
+        # "message is not modified" и подобные ошибки не должны останавливать рассылку
+        logger.debug(f"Broadcast {campaign_id} progress update failed: {e}")
+
+
+async def _send_one(bot, user_id: int, text: str) -> bool:
+    try:
+        await outbound.send_message(bot, user_id, text, priority=PRIORITY_BULK, parse_mode=ParseMode.HTML)
+        return True
+    except Exception as e:
+        logger.warning(f"Broadcast delivery to {user_id} failed: {e}")
+        return False
+
+
+async def run_broadcast(bot, campaign_id: int):
+    """Выполняет (или продолжает после перезапуска) рассылку с контрольными точками в БД"""
+    campaign = db.get_broadcast(campaign_id)
+    if not campaign:
+        logger.error(f"Broadcast {campaign_id} not found")
+        return
+
+    stale = db.expire_broadcast_claims(campaign_id)
+    if stale:
+        logger.warning(f"Broadcast {campaign_id}: {stale} recipients left pending by a previous run marked unknown")
+    logger.info(f"Broadcast {campaign_id} started from user_id > {campaign['cursor_user_id']}")
+    started = time.monotonic()
+    processed = 0
+    last_progress = 0.0
+    try:
+        while True:
+            user_ids = db.claim_broadcast_batch(campaign_id, BATCH_SIZE)
+            if not user_ids:
+                break
+
+            results = await asyncio.gather(*[
+                _send_one(bot, user_id, campaign['message']) for user_id in user_ids
+            ])
+            db.checkpoint_broadcast(campaign_id, dict(zip(user_ids, results)))
+            processed += len(user_ids)
+
+            now = time.monotonic()
+            if now - last_progress >= PROGRESS_INTERVAL:
+                last_progress = now
+                await _update_progress(bot, campaign_id, processed / max(now - started, 1e-6))
+
+        elapsed = max(time.monotonic() - started, 1e-6)
+        await _update_progress(bot, campaign_id, processed / elapsed, done=True)
+        logger.info(f"Broadcast {campaign_id} finished: {processed} recipients in {elapsed:.1f}s")
+    finally:
+        _running.pop(campaign_id, None)
+
+
+def start_broadcast(application, campaign_id: int):
+    """Запускает рассылку фоновой задачей, если она еще не выполняется"""
+    if campaign_id in _running:
+        return _running[campaign_id]
+    task = application.create_task(run_broadcast(application.bot, campaign_id))
+    _running[campaign_id] = task
+    return task
+
+
+def resume_broadcasts(application):
+    """Возобновляет незавершенные рассылки после перезапуска бота"""
+    for campaign_id in db.get_running_broadcasts():
+        logger.info(f"Resuming broadcast {campaign_id}")
+        start_broadcast(application, campaign_id)
@@ -0,0 +1,25 @@
+from core.base import Base
+from sqlalchemy import Column, Integer, String, DateTime, UniqueConstraint
+import datetime
+
+class BroadcastCampaign(Base):
+    __tablename__ = 'broadcast_campaigns'
+    id = Column(Integer, primary_key=True)
+    message = Column(String, nullable=False)
+    created_by = Column(Integer, nullable=False)
+    progress_chat_id = Column(Integer)
+    progress_message_id = Column(Integer)
+    status = Column(String, default='running')  # running / done
+    cursor_user_id = Column(Integer, default=0)  # последний обработанный user_id
+    sent = Column(Integer, default=0)
+    failed = Column(Integer, default=0)
+    created_at = Column(DateTime, default=datetime.datetime.utcnow)
+    updated_at = Column(DateTime, default=datetime.datetime.utcnow)
+
+class BroadcastDelivery(Base):
+    __tablename__ = 'broadcast_deliveries'
+    __table_args__ = (UniqueConstraint('campaign_id', 'user_id'),)
+    id = Column(Integer, primary_key=True)
+    campaign_id = Column(Integer, nullable=False)
+    user_id = Column(Integer, nullable=False)
+    status = Column(String, default='pending')  # pending / sent / failed / unknown
@@ -0,0 +1,18 @@
+from core.base import Base
+from sqlalchemy import Column, Integer, String, DateTime, Index
+import datetime
+
+class CalendarOutbox(Base):
+    __tablename__ = 'calendar_outbox'
+    __table_args__ = (Index('ix_calendar_outbox_due', 'status', 'next_attempt_at'),)
+    id = Column(Integer, primary_key=True)
+    order_id = Column(Integer, nullable=False, index=True)
+    performer_user_id = Column(Integer, nullable=False)  # Telegram id владельца календаря
+    action = Column(String, nullable=False)  # insert / update / delete
+    event_id = Column(String, nullable=False)
+    status = Column(String, default='pending')  # pending / done / failed
+    attempts = Column(Integer, default=0)
+    next_attempt_at = Column(DateTime, default=datetime.datetime.utcnow)
+    last_error = Column(String)
+    created_at = Column(DateTime, default=datetime.datetime.utcnow)
+    updated_at = Column(DateTime, default=datetime.datetime.utcnow)
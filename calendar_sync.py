@@ -0,0 +1,481 @@
+import asyncio
+import logging
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from typing import Callable, Dict, List, Optional, Tuple
+from zoneinfo import ZoneInfo
+from googleapiclient.errors import HttpError
+from googleapiclient.http import BatchHttpRequest
+from core.config import config
+from core.database import db
+from core.intervals import subtract_intervals
+from models.calendar_outbox import CalendarOutbox
+from models.order import Order
+from models.performer import Performer
+from services import google_calendar
+
+logger = logging.getLogger(__name__)
+
+# Ошибки, после которых повтор бессмысленен
+PERMANENT_ERRORS = {400, 403, 404, 410}
+
+
+def _error_status(error: Exception) -> Optional[int]:
+    if isinstance(error, HttpError):
+        # 403 с rateLimitExceeded — временная ошибка, ее повторяем
+        if error.resp.status == 403 and 'ratelimit' in str(error).lower():
+            return 429
+        return error.resp.status
+    return None
+
+
+def enqueue(order_id: int, action: str, performer_user_id: int = None) -> Optional[int]:
+    """
+    Ставит операцию с событием заказа в outbox. Незавершенные операции по тому же
+    заказу и календарю схлопываются: insert + update остается insert,
+    последний delete или insert побеждает.
+    """
+    if performer_user_id is None:
+        order = db.get_order(order_id)
+        performer = db.get_performer(name=order['order_performers']) if order else None
+        performer_user_id = performer.get('telegram_user_id') if performer else None
+    if not performer_user_id:
+        logger.debug(f"Order {order_id} has no performer with a calendar, skipping {action}")
+        return None
+
+    with db.session_scope() as session:
+        row = session.query(CalendarOutbox).filter_by(
+            order_id=order_id, performer_user_id=performer_user_id, status='pending'
+        ).first()
+        if row:
+            if not (row.action == 'insert' and action == 'update'):
+                row.action = action
+            row.next_attempt_at = datetime.utcnow()
+            row.updated_at = datetime.utcnow()
+        else:
+            row = CalendarOutbox(
+                order_id=order_id,
+                performer_user_id=performer_user_id,
+                action=action,
+                event_id=google_calendar.event_id_for(order_id)
+            )
+            session.add(row)
+        session.flush()
+        row_id = row.id
+
+    worker.wake()
+    return row_id
+
+
+def _event_holders(session, order_id: int) -> Dict[int, str]:
+    """Последняя операция с событием заказа в каждом календаре: {performer_user_id: action}"""
+    rows = (
+        session.query(CalendarOutbox.performer_user_id, CalendarOutbox.action)
+        .filter(CalendarOutbox.order_id == order_id, CalendarOutbox.status != 'failed')
+        .order_by(CalendarOutbox.id)
+        .all()
+    )
+    return {user_id: action for user_id, action in rows}
+
+
+def sync_order(order_id: int):
+    """
+    Приводит календари к текущему состоянию заказа: активный заказ есть только
+    в календаре назначенного исполнителя (вставка или обновление времени),
+    из остальных календарей и у отмененных заказов событие удаляется.
+    """
+    order = db.get_order(order_id)
+    target = None
+    if order and (order.get('status') or 'pending') in db.ACTIVE_STATUSES:
+        performer = db.get_performer(name=order['order_performers'])
+        target = performer.get('telegram_user_id') if performer else None
+
+    with db.session_scope() as session:
+        holders = _event_holders(session, order_id)
+
+    for user_id, action in holders.items():
+        if user_id != target and action != 'delete':
+            enqueue(order_id, 'delete', user_id)
+    if target:
+        action = 'update' if holders.get(target) in ('insert', 'update') else 'insert'
+        enqueue(order_id, action, target)
+
+
+def _local(value: str) -> datetime:
+    """RFC 3339 -> локальное время календаря без tzinfo (как в заказах)"""
+    parsed = datetime.fromisoformat(value)
+    if parsed.tzinfo:
+        parsed = parsed.astimezone(ZoneInfo(google_calendar.CALENDAR_TIMEZONE)).replace(tzinfo=None)
+    return parsed
+
+
+def _event_interval(event: dict) -> Optional[Tuple[datetime, datetime]]:
+    """Начало и конец события в локальном времени календаря"""
+    try:
+        return _local(event['start']['dateTime']), _local(event['end']['dateTime'])
+    except (KeyError, TypeError, ValueError):
+        return None
+
+
+async def reconcile_calendars(context):
+    """Периодическая сверка календарей исполнителей с базой (job_queue)"""
+    loop = asyncio.get_running_loop()
+    # Тот же однопоточный пул, что и у outbox: сервисы Google не потокобезопасны
+    fixed = await loop.run_in_executor(worker.executor, worker.reconcile)
+    if fixed:
+        logger.info(f"Calendar reconciliation queued {fixed} fixes")
+
+
+async def refresh_busy_windows(context):
+    """Периодический импорт free/busy исполнителей (job_queue)"""
+    loop = asyncio.get_running_loop()
+    await loop.run_in_executor(worker.executor, worker.refresh_busy)
+
+
+async def refresh_calendar_tokens(context):
+    """Заблаговременное обновление токенов Google у кэшированных клиентов (job_queue)"""
+    loop = asyncio.get_running_loop()
+    refreshed = await loop.run_in_executor(worker.executor, google_calendar.clients.refresh_expiring)
+    if refreshed:
+        logger.info(f"Refreshed Google tokens for {refreshed} performers")
+
+
+class CalendarSyncWorker:
+    """
+    Фоновый обработчик calendar_outbox: собирает ожидающие операции, группирует
+    по календарю исполнителя и отправляет их пачками через BatchHttpRequest.
+    """
+
+    def __init__(
+        self,
+        service_factory: Callable[[int], object] = None,
+        batch_uri: str = None,
+        batch_size: int = None,
+        poll_interval: float = None,
+        max_attempts: int = None
+    ):
+        self.service_factory = service_factory or google_calendar.get_calendar_service
+        self.batch_uri = batch_uri or config.CALENDAR_BATCH_URI
+        self.batch_size = batch_size or config.CALENDAR_SYNC_BATCH_SIZE
+        self.poll_interval = poll_interval or config.CALENDAR_SYNC_INTERVAL
+        self.max_attempts = max_attempts or config.CALENDAR_SYNC_MAX_ATTEMPTS
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="calendar-sync")
+        self._wakeup: Optional[asyncio.Event] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self):
+        if self._task:
+            return
+        self._loop = asyncio.get_running_loop()
+        self._wakeup = asyncio.Event()
+        self._task = asyncio.create_task(self._run(), name="calendar-sync")
+        logger.info("Calendar sync worker started")
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        self.executor.shutdown(wait=True)
+
+    def wake(self):
+        """Будит воркер после записи в outbox (можно вызывать из любого потока)"""
+        if self._loop and self._wakeup:
+            self._loop.call_soon_threadsafe(self._wakeup.set)
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            try:
+                processed = await loop.run_in_executor(self.executor, self.process_due)
+            except Exception as e:
+                logger.error(f"Calendar sync cycle failed: {e}", exc_info=True)
+                processed = 0
+            if processed:
+                continue
+            self._wakeup.clear()
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.poll_interval)
+            except asyncio.TimeoutError:
+                pass
+
+    def _backoff(self, attempts: int) -> timedelta:
+        return timedelta(seconds=min(2 ** attempts * 5, 3600))
+
+    def process_due(self) -> int:
+        """Один цикл: берет созревшие операции и выполняет их пачками. Возвращает их число."""
+        with db.session_scope() as session:
+            rows = (
+                session.query(CalendarOutbox)
+                .filter(CalendarOutbox.status == 'pending', CalendarOutbox.next_attempt_at <= datetime.utcnow())
+                .order_by(CalendarOutbox.next_attempt_at)
+                .limit(self.batch_size)
+                .all()
+            )
+            jobs = [
+                {c.name: getattr(row, c.name) for c in row.__table__.columns}
+                for row in rows
+            ]
+        if not jobs:
+            return 0
+
+        by_calendar: Dict[int, List[dict]] = defaultdict(list)
+        for job in jobs:
+            by_calendar[job['performer_user_id']].append(job)
+
+        results = {}
+        for performer_user_id, calendar_jobs in by_calendar.items():
+            results.update(self._execute_batch(performer_user_id, calendar_jobs))
+        self._apply_results(jobs, results)
+        return len(jobs)
+
+    def reconcile(self) -> int:
+        """
+        Инкрементальная сверка: для каждого календаря запрашивает только события,
+        измененные с прошлой сверки (syncToken), и ставит в outbox исправления
+        расхождений с базой. Без изменений это один запрос на исполнителя.
+        Возвращает число поставленных исправлений.
+        """
+        with db.session_scope() as session:
+            performers = [
+                (p.telegram_user_id, p.performer_name, p.calendar_sync_token)
+                for p in session.query(Performer).filter(Performer.google_tokens.isnot(None))
+            ]
+        fixed = 0
+        for user_id, performer_name, sync_token in performers:
+            try:
+                fixed += self._reconcile_calendar(user_id, performer_name, sync_token)
+            except Exception as e:
+                logger.error(f"Calendar reconciliation for performer {user_id} failed: {e}")
+        return fixed
+
+    def refresh_busy(self) -> int:
+        """
+        Загружает занятость из личных календарей исполнителей в индекс расписания.
+        Запросы freebusy всех исполнителей уходят одним batch-запросом (каждая часть
+        несет учетные данные своего исполнителя). Собственные заказы бота из ответа
+        вычитаются — они уже учтены в индексе. Возвращает число обновленных исполнителей.
+        """
+        with db.session_scope() as session:
+            performers = {
+                p.telegram_user_id: p.performer_name
+                for p in session.query(Performer).filter(Performer.google_tokens.isnot(None))
+            }
+        if not performers:
+            return 0
+
+        now = datetime.now(ZoneInfo(google_calendar.CALENDAR_TIMEZONE))
+        body = {
+            'timeMin': now.isoformat(),
+            'timeMax': (now + timedelta(days=config.FREEBUSY_HORIZON_DAYS)).isoformat(),
+            'timeZone': google_calendar.CALENDAR_TIMEZONE,
+            'items': [{'id': 'primary'}]
+        }
+        responses = {}
+
+        def callback(request_id, response, exception):
+            if exception:
+                logger.warning(f"Free/busy for performer {request_id} failed: {exception}")
+            else:
+                responses[int(request_id)] = response
+
+        user_ids = list(performers)
+        for offset in range(0, len(user_ids), self.batch_size):
+            batch = BatchHttpRequest(callback=callback, batch_uri=self.batch_uri)
+            for user_id in user_ids[offset:offset + self.batch_size]:
+                service = self.service_factory(user_id)
+                if service:
+                    batch.add(service.freebusy().query(body=body), request_id=str(user_id))
+            try:
+                batch.execute()
+            except Exception as e:
+                logger.error(f"Free/busy batch failed: {e}")
+
+        db._ensure_schedule()
+        for user_id, response in responses.items():
+            calendar = response.get('calendars', {}).get('primary', {})
+            if calendar.get('errors'):
+                logger.warning(f"Free/busy errors for performer {user_id}: {calendar['errors']}")
+                continue
+            name = performers[user_id]
+            busy = [(_local(window['start']), _local(window['end'])) for window in calendar.get('busy', [])]
+            own = [(start, end) for start, end, _ in db.schedule.bookings(name)]
+            db.schedule.external.replace(name, subtract_intervals(busy, own))
+        db.availability_cache.clear()
+        logger.info(f"Free/busy refreshed for {len(responses)} of {len(performers)} performers")
+        return len(responses)
+
+    def _list_changes(self, service, sync_token: Optional[str]) -> Tuple[List[dict], Optional[str]]:
+        events, page_token = [], None
+        while True:
+            params = {'calendarId': 'primary', 'showDeleted': True, 'maxResults': 250}
+            if sync_token:
+                params['syncToken'] = sync_token
+            if page_token:
+                params['pageToken'] = page_token
+            response = service.events().list(**params).execute()
+            events.extend(response.get('items', []))
+            page_token = response.get('nextPageToken')
+            if not page_token:
+                return events, response.get('nextSyncToken')
+
+    def _reconcile_calendar(self, user_id: int, performer_name: str, sync_token: Optional[str]) -> int:
+        service = self.service_factory(user_id)
+        if not service:
+            return 0
+        try:
+            events, next_token = self._list_changes(service, sync_token)
+        except HttpError as e:
+            if _error_status(e) != 410:
+                raise
+            # Токен устарел — полная синхронизация
+            logger.info(f"Sync token expired for performer {user_id}, running full sync")
+            sync_token = None
+            events, next_token = self._list_changes(service, None)
+
+        changed = {}
+        for event in events:
+            order_id = google_calendar.order_id_for(event.get('id'))
+            if order_id:
+                changed[order_id] = event
+
+        db._ensure_schedule()
+        expected = {order_id: (start, end) for start, end, order_id in db.schedule.bookings(performer_name)}
+        with db.session_scope() as session:
+            in_flight = {
+                row.order_id for row in session.query(CalendarOutbox.order_id).filter_by(
+                    performer_user_id=user_id, status='pending'
+                )
+            }
+
+        fixes = {}
+        for order_id, event in changed.items():
+            if order_id in in_flight:
+                continue
+            wanted = expected.get(order_id)
+            if event.get('status') == 'cancelled':
+                if wanted:
+                    fixes[order_id] = 'insert'
+            elif not wanted:
+                fixes[order_id] = 'delete'
+            elif _event_interval(event) != wanted:
+                fixes[order_id] = 'update'
+
+        if sync_token is None:
+            # Полная синхронизация видит и события, которых в календаре нет совсем
+            now = datetime.now()
+            for order_id, (_, end) in expected.items():
+                if end > now and order_id not in changed and order_id not in in_flight:
+                    fixes[order_id] = 'insert'
+
+        for order_id, action in fixes.items():
+            enqueue(order_id, action, user_id)
+
+        with db.session_scope() as session:
+            performer = session.query(Performer).filter_by(telegram_user_id=user_id).first()
+            if performer:
+                performer.calendar_sync_token = next_token
+        if fixes:
+            logger.info(f"Calendar of performer {user_id}: {len(fixes)} events out of sync")
+        return len(fixes)
+
+    def _build_request(self, service, job: dict):
+        events = service.events()
+        if job['action'] == 'delete':
+            return events.delete(calendarId='primary', eventId=job['event_id'])
+
+        order = db.get_order(job['order_id'])
+        if not order:
+            raise LookupError(f"Order {job['order_id']} not found")
+        body = google_calendar.build_event(order)
+        if job['action'] == 'insert':
+            return events.insert(calendarId='primary', body={**body, 'id': job['event_id']})
+        return events.patch(calendarId='primary', eventId=job['event_id'], body=body)
+
+    def _execute_batch(self, performer_user_id: int, jobs: List[dict]) -> Dict[int, tuple]:
+        """Возвращает {job_id: (response, error)}"""
+        results = {}
+        service = self.service_factory(performer_user_id)
+        if not service:
+            error = RuntimeError(f"Calendar service unavailable for performer {performer_user_id}")
+            return {job['id']: (None, error) for job in jobs}
+
+        def callback(request_id, response, exception):
+            results[int(request_id)] = (response, exception)
+
+        batch = BatchHttpRequest(callback=callback, batch_uri=self.batch_uri)
+        for job in jobs:
+            try:
+                batch.add(self._build_request(service, job), request_id=str(job['id']))
+            except Exception as e:
+                results[job['id']] = (None, e)
+
+        if len(results) < len(jobs):
+            try:
+                batch.execute()
+            except Exception as e:
+                logger.error(f"Calendar batch for performer {performer_user_id} failed: {e}")
+                for job in jobs:
+                    results.setdefault(job['id'], (None, e))
+        logger.info(f"Calendar batch for performer {performer_user_id}: {len(jobs)} operations")
+        return results
+
+    def _apply_results(self, jobs: List[dict], results: Dict[int, tuple]):
+        now = datetime.utcnow()
+        unauthorized = set()
+        with db.session_scope() as session:
+            for job in jobs:
+                row = session.get(CalendarOutbox, job['id'])
+                if not row or row.status != 'pending':
+                    continue
+                if row.action != job['action']:
+                    # Пока запрос выполнялся, enqueue заменил операцию — она уйдет в следующем цикле
+                    continue
+                response, error = results.get(job['id'], (None, RuntimeError("no response")))
+                status = _error_status(error)
+                row.updated_at = now
+
+                if error is None or (row.action == 'delete' and status in (404, 410)):
+                    row.status = 'done'
+                    row.last_error = None
+                    order = session.get(Order, row.order_id)
+                    if order and row.action == 'insert':
+                        order.calendar_event_id = (response or {}).get('id', row.event_id)
+                    elif order and row.action == 'delete' and order.calendar_event_id == row.event_id:
+                        order.calendar_event_id = None
+                    db.order_cache.pop(row.order_id, None)
+                    continue
+
+                if row.action == 'insert' and status == 409:
+                    # Событие с таким id уже существует — обновляем его
+                    row.action = 'update'
+                    row.next_attempt_at = now
+                    continue
+                if row.action == 'update' and status == 404:
+                    row.action = 'insert'
+                    row.next_attempt_at = now
+                    continue
+                if status == 401:
+                    unauthorized.add(row.performer_user_id)
+
+                row.attempts = (row.attempts or 0) + 1
+                row.last_error = str(error)[:500]
+                if status in PERMANENT_ERRORS or isinstance(error, (LookupError, ValueError)) \
+                        or row.attempts >= self.max_attempts:
+                    row.status = 'failed'
+                    logger.error(f"Calendar {row.action} for order {row.order_id} failed: {error}")
+                else:
+                    row.next_attempt_at = now + self._backoff(row.attempts)
+                    logger.warning(
+                        f"Calendar {row.action} for order {row.order_id} will be retried "
+                        f"(attempt {row.attempts}): {error}"
+                    )
+
+        # Вне сессии: обновление токена само пишет в БД
+        for user_id in unauthorized:
+            google_calendar.clients.handle_unauthorized(user_id)
+
+
+worker = CalendarSyncWorker()
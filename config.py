@@ -3,7 +3,7 @@ import json
 import logging
 import re
 from dotenv import load_dotenv
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Optional, Tuple
 
 load_dotenv()
 
@@ -29,6 +29,9 @@ class BotConfig:
         if not self.TWILIO_TOKEN:
             logger.warning("TWILIO_TOKEN is not set! SMS/WhatsApp notifications will be disabled")
         self.TWILIO_NUMBER = os.getenv("TWILIO_NUMBER")
+        # Асинхронный клиент Twilio: одновременных запросов и тайм-аут соединения/чтения (сек)
+        self.TWILIO_CONCURRENCY = int(os.getenv("TWILIO_CONCURRENCY", "20"))
+        self.TWILIO_TIMEOUT = float(os.getenv("TWILIO_TIMEOUT", "30"))
         self.SMTP_SERVER = os.getenv("SMTP_SERVER")
         self.SMTP_PORT = int(os.getenv("SMTP_PORT", "587"))
         self.SMTP_USER = os.getenv("SMTP_USER")
@@ -36,6 +39,11 @@ class BotConfig:
         if not self.SMTP_PASSWORD:
             logger.warning("SMTP_PASSWORD is not set! Email notifications will be disabled")
         self.SMTP_FROM = os.getenv("SMTP_FROM")
+        # Пул SMTP-сессий: число сессий, писем за одну пачку, NOOP и закрытие простаивающих (сек)
+        self.SMTP_POOL_SIZE = int(os.getenv("SMTP_POOL_SIZE", "2"))
+        self.SMTP_BATCH_SIZE = int(os.getenv("SMTP_BATCH_SIZE", "20"))
+        self.SMTP_KEEPALIVE = float(os.getenv("SMTP_KEEPALIVE", "30"))
+        self.SMTP_IDLE_TIMEOUT = float(os.getenv("SMTP_IDLE_TIMEOUT", "300"))
         self.ENCRYPTION_KEY = os.getenv("ENCRYPTION_KEY")
         self._encrypt_sensitive()
         
@@ -45,6 +53,83 @@ class BotConfig:
         self.AWS_SECRET_KEY = os.getenv("AWS_SECRET_KEY")
         self.S3_ENABLED = all([self.S3_BUCKET, self.AWS_ACCESS_KEY, self.AWS_SECRET_KEY])
         
+        # Лимиты исходящих сообщений Telegram (сообщений в секунду)
+        self.OUTBOUND_GLOBAL_RATE = float(os.getenv("OUTBOUND_GLOBAL_RATE", "30"))
+        self.OUTBOUND_CHAT_RATE = float(os.getenv("OUTBOUND_CHAT_RATE", "1"))
+        self.OUTBOUND_GROUP_RATE = float(os.getenv("OUTBOUND_GROUP_RATE", str(20 / 60)))
+        self.OUTBOUND_WORKERS = int(os.getenv("OUTBOUND_WORKERS", "8"))
+        # Сколько секунд остановка бота ждет отправки очереди, после чего оставшиеся вызовы отменяются
+        self.OUTBOUND_STOP_TIMEOUT = float(os.getenv("OUTBOUND_STOP_TIMEOUT", "10"))
+        
+        # Лимиты уведомлений получателю по каналам: {канал: (сообщений, за период в секундах)}
+        self.NOTIFICATION_RATE_LIMITS = {
+            "sms": (5, 3600),
+            "whatsapp": (5, 3600),
+            "email": (5, 3600),
+            **self._parse_rate_limits(os.getenv("NOTIFICATION_RATE_LIMITS", ""))
+        }
+        # Верхняя граница числа ключей в одном ограничителе частоты
+        self.RATE_LIMIT_MAX_KEYS = int(os.getenv("RATE_LIMIT_MAX_KEYS", "1000000"))
+        # Outbox уведомлений: попыток на канал, базовая задержка повтора и опрос (сек), доставок за цикл
+        self.NOTIFICATION_MAX_ATTEMPTS = int(os.getenv("NOTIFICATION_MAX_ATTEMPTS", "5"))
+        self.NOTIFICATION_RETRY_DELAY = float(os.getenv("NOTIFICATION_RETRY_DELAY", "5"))
+        self.NOTIFICATION_POLL_INTERVAL = float(os.getenv("NOTIFICATION_POLL_INTERVAL", "5"))
+        self.NOTIFICATION_BATCH_SIZE = int(os.getenv("NOTIFICATION_BATCH_SIZE", "100"))
+        # Предел времени одной доставки (сек) и переопределения по каналам: '{"email": 120}'.
+        # Зависшая доставка считается неудачной попыткой и не задерживает остальные
+        self.NOTIFICATION_TIMEOUT = float(os.getenv("NOTIFICATION_TIMEOUT", "60"))
+        self.NOTIFICATION_CHANNEL_TIMEOUTS = self._parse_timeouts(os.getenv("NOTIFICATION_CHANNEL_TIMEOUTS", ""))
+        # Сводки для админов и операторов: окно накопления (сек, 0 — без сводок), событий в сводке,
+        # заказы, начинающиеся раньше чем через DIGEST_URGENT_HOURS, отправляются сразу
+        self.DIGEST_WINDOW = float(os.getenv("DIGEST_WINDOW", "60"))
+        self.DIGEST_MAX_ITEMS = int(os.getenv("DIGEST_MAX_ITEMS", "20"))
+        self.DIGEST_URGENT_HOURS = float(os.getenv("DIGEST_URGENT_HOURS", "24"))
+        # Напоминания о шоу: окно, загружаемое в память (сек), и напоминаний за одну пачку
+        self.REMINDER_WINDOW = float(os.getenv("REMINDER_WINDOW", "3600"))
+        self.REMINDER_BATCH_SIZE = int(os.getenv("REMINDER_BATCH_SIZE", "500"))
+        
+        # Эндпоинт метрик Prometheus (порт 0 — выключен)
+        self.METRICS_HOST = os.getenv("METRICS_HOST", "127.0.0.1")
+        self.METRICS_PORT = int(os.getenv("METRICS_PORT", "9108"))
+        # Трассировка обновлений: порог медленного обновления (сек) и окно перцентилей (обновлений на состояние)
+        self.TRACE_SLOW_THRESHOLD = float(os.getenv("TRACE_SLOW_THRESHOLD", "1.0"))
+        self.TRACE_WINDOW = int(os.getenv("TRACE_WINDOW", "1000"))
+        # Профилирование SQL: порог медленного запроса (мс) и предел числа различных запросов
+        self.SQL_SLOW_QUERY_MS = float(os.getenv("SQL_SLOW_QUERY_MS", "100"))
+        self.SQL_PROFILE_MAX_STATEMENTS = int(os.getenv("SQL_PROFILE_MAX_STATEMENTS", "500"))
+        
+        # Обработка вложений поддержки
+        self.MEDIA_MAX_CONCURRENCY = int(os.getenv("MEDIA_MAX_CONCURRENCY", "8"))
+        self.MEDIA_COMPRESS_WORKERS = int(os.getenv("MEDIA_COMPRESS_WORKERS", "2"))
+        self.MEDIA_UPLOAD_WORKERS = int(os.getenv("MEDIA_UPLOAD_WORKERS", "8"))
+        
+        # Длительность шоу (минуты) по программам/категориям и время на дорогу между шоу
+        self.DEFAULT_SHOW_DURATION = int(os.getenv("DEFAULT_SHOW_DURATION", "120"))
+        self.SHOW_DURATIONS = self._parse_int_dict(os.getenv("SHOW_DURATIONS", ""))
+        self.TRAVEL_BUFFER_MINUTES = int(os.getenv("TRAVEL_BUFFER_MINUTES", "30"))
+        # Сколько секунд слот удерживается за клиентом, пока он оформляет заказ
+        self.RESERVATION_HOLD_SECONDS = int(os.getenv("RESERVATION_HOLD_SECONDS", "900"))
+        # Сколько секунд действует предложение замены; не принятый никем заказ возвращается в ожидание
+        self.REPLACEMENT_OFFER_TTL = int(os.getenv("REPLACEMENT_OFFER_TTL", "1800"))
+        
+        # Синхронизация с Google Calendar через outbox
+        self.CALENDAR_BATCH_URI = os.getenv("CALENDAR_BATCH_URI", "https://www.googleapis.com/batch/calendar/v3")
+        self.CALENDAR_SYNC_INTERVAL = float(os.getenv("CALENDAR_SYNC_INTERVAL", "10"))
+        self.CALENDAR_SYNC_BATCH_SIZE = int(os.getenv("CALENDAR_SYNC_BATCH_SIZE", "50"))
+        self.CALENDAR_SYNC_MAX_ATTEMPTS = int(os.getenv("CALENDAR_SYNC_MAX_ATTEMPTS", "8"))
+        self.CALENDAR_RECONCILE_INTERVAL = int(os.getenv("CALENDAR_RECONCILE_INTERVAL", "900"))
+        # Клиенты Google Calendar: размер LRU-кэша и заблаговременное обновление токенов
+        self.CALENDAR_CLIENT_CACHE_SIZE = int(os.getenv("CALENDAR_CLIENT_CACHE_SIZE", "100"))
+        self.CALENDAR_TOKEN_REFRESH_MARGIN = int(os.getenv("CALENDAR_TOKEN_REFRESH_MARGIN", "600"))
+        self.CALENDAR_TOKEN_REFRESH_INTERVAL = int(os.getenv("CALENDAR_TOKEN_REFRESH_INTERVAL", "300"))
+        # Импорт занятости из личных календарей исполнителей (free/busy)
+        self.FREEBUSY_REFRESH_INTERVAL = int(os.getenv("FREEBUSY_REFRESH_INTERVAL", "300"))
+        self.FREEBUSY_TTL = int(os.getenv("FREEBUSY_TTL", "900"))
+        self.FREEBUSY_HORIZON_DAYS = int(os.getenv("FREEBUSY_HORIZON_DAYS", "60"))
+        
+        # URL формы заказа (Telegram Web App); пусто — форма отключена
+        self.ORDER_WEBAPP_URL = os.getenv("ORDER_WEBAPP_URL")
+        
         self.DATE_REGEX = r'^\d{2}\.\d{2}\.\d{4}$'
         self.TIME_REGEX = r'^\d{2}:\d{2}$'
         self.AMOUNT_REGEX = r'^\d+(\.\d{1,2})?$'
@@ -94,6 +179,35 @@ class BotConfig:
         except json.JSONDecodeError:
             return [int(x.strip()) for x in value.split(',') if x.strip().isdigit()]
     
+    def _parse_int_dict(self, value: str) -> Dict[str, int]:
+        if not value:
+            return {}
+        try:
+            return {str(k): int(v) for k, v in json.loads(value).items()}
+        except (json.JSONDecodeError, AttributeError, ValueError):
+            logger.error(f"Invalid JSON mapping: {value}")
+            return {}
+    
+    def _parse_rate_limits(self, value: str) -> Dict[str, Tuple[float, float]]:
+        """'{"sms": [5, 3600]}' -> {"sms": (5.0, 3600.0)}"""
+        if not value:
+            return {}
+        try:
+            return {str(k): (float(v[0]), float(v[1])) for k, v in json.loads(value).items()}
+        except (json.JSONDecodeError, AttributeError, ValueError, TypeError, IndexError):
+            logger.error(f"Invalid rate limits mapping: {value}")
+            return {}
+    
+    def _parse_timeouts(self, value: str) -> Dict[str, float]:
+        """'{"email": 120}' -> {"email": 120.0}"""
+        if not value:
+            return {}
+        try:
+            return {str(k): float(v) for k, v in json.loads(value).items()}
+        except (json.JSONDecodeError, AttributeError, ValueError, TypeError):
+            logger.error(f"Invalid timeouts mapping: {value}")
+            return {}
+    
     def refresh_data(self):
         self.PERFORMERS_LIST = ["Титов Андрей", "Шепелев Олег", "Любой свободный"]
         self.PROGRAM_CATEGORIES = [
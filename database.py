@@ -2,24 +2,39 @@ import os
 import logging
 import shutil
 import json
+import threading
 from contextlib import contextmanager
-from datetime import datetime
+from datetime import datetime, timedelta
 from typing import Dict, Optional, List
-from cachetools import TTLCache
 from sqlalchemy import create_engine, Index
 from sqlalchemy.orm import sessionmaker, scoped_session
 from sqlalchemy.pool import QueuePool
 from sqlalchemy import inspect  # Ключевой импорт для работы с метаданными БД
 from sqlalchemy import text  # Добавляем импорт
+from sqlalchemy.exc import IntegrityError
 
 from .base import Base
 from .config import config
+from .intervals import ScheduleIndex, order_interval
+from .metrics import MeteredTTLCache, register_caches, instrument_engine
 from models.order import Order
 from models.performer import Performer
 from models.support_ticket import SupportTicket
+from models.broadcast_campaign import BroadcastCampaign, BroadcastDelivery
+from models.attachment import Attachment
+from models.reservation import Reservation
+from models.replacement_offer import ReplacementOffer
+from models.calendar_outbox import CalendarOutbox
+from models.notification_outbox import NotificationOutbox, NotificationDelivery, NotificationDeadLetter
+from models.reminder import Reminder
 
 logger = logging.getLogger(__name__)
 
+ANY_PERFORMER = "Любой свободный"
+
+class SlotUnavailableError(Exception):
+    """Исполнитель уже занят (или удерживается другим клиентом) на это время"""
+
 class Database:
     def __init__(self, db_url: str = f"sqlite:///{config.DATABASE_NAME}"):
         self.engine = create_engine(
@@ -29,6 +44,7 @@ class Database:
             max_overflow=5,
             pool_timeout=30
         )
+        instrument_engine(self.engine)
         self.Session = scoped_session(sessionmaker(bind=self.engine))
         
         # Создаем таблицы, если их нет
@@ -38,12 +54,30 @@ class Database:
         self._apply_migrations()
         
         # Создаем кэши
-        self.order_cache = TTLCache(maxsize=500, ttl=1800)
-        self.performer_cache = TTLCache(maxsize=100, ttl=3600)
-        self.availability_cache = TTLCache(maxsize=1000, ttl=300)
+        self.order_cache = MeteredTTLCache(maxsize=500, ttl=1800)
+        self.performer_cache = MeteredTTLCache(maxsize=100, ttl=3600)
+        self.availability_cache = MeteredTTLCache(maxsize=1000, ttl=300)
+        register_caches({
+            "order_cache": self.order_cache,
+            "performer_cache": self.performer_cache,
+            "availability_cache": self.availability_cache,
+        })
+        
+        # Интервалы занятости исполнителей (загружаются при первом обращении)
+        self.schedule = ScheduleIndex()
+        # Проверка занятости и запись брони выполняются под одной блокировкой
+        self._slot_lock = threading.RLock()
     
     def _apply_migrations(self):
         """Применяем необходимые миграции для существующих таблиц"""
+        # Индекс для потокового обхода получателей рассылок
+        with self.engine.begin() as conn:
+            conn.execute(text("CREATE INDEX IF NOT EXISTS ix_orders_user_id ON orders (user_id)"))
+            if self._table_exists("performers_telegram") and \
+                    not self._column_exists("performers_telegram", "calendar_sync_token"):
+                logger.info("Adding column 'calendar_sync_token' to performers_telegram")
+                conn.execute(text("ALTER TABLE performers_telegram ADD COLUMN calendar_sync_token TEXT"))
+        
         # Проверяем только существующие таблицы
         if not self._table_exists("support_tickets"):
             logger.info("Table 'support_tickets' doesn't exist, skipping migrations")
@@ -67,6 +101,21 @@ class Database:
                     logger.info("Adding column 'photo_path' to support_tickets")
                     session.execute(text("ALTER TABLE support_tickets ADD COLUMN photo_path TEXT"))
                 
+                if not self._column_exists("support_tickets", "photo_file_id"):
+                    logger.info("Adding column 'photo_file_id' to support_tickets")
+                    session.execute(text("ALTER TABLE support_tickets ADD COLUMN photo_file_id TEXT"))
+                
+                if not self._column_exists("support_tickets", "photo_sha256"):
+                    logger.info("Adding column 'photo_sha256' to support_tickets")
+                    session.execute(text("ALTER TABLE support_tickets ADD COLUMN photo_sha256 VARCHAR(64)"))
+                
+                session.execute(text(
+                    "CREATE INDEX IF NOT EXISTS ix_support_tickets_photo_sha256 ON support_tickets (photo_sha256)"
+                ))
+                session.execute(text(
+                    "CREATE INDEX IF NOT EXISTS ix_support_tickets_created_at ON support_tickets (created_at)"
+                ))
+                
                 session.commit()
                 logger.info("Database migrations applied successfully")
             except Exception as e:
@@ -95,6 +144,10 @@ class Database:
         try:
             yield session
             session.commit()
+        except SlotUnavailableError:
+            # Ожидаемый отказ в бронировании, не ошибка БД
+            session.rollback()
+            raise
         except Exception as e:
             session.rollback()
             logger.error(f"Database error: {e}", exc_info=True)
@@ -105,12 +158,157 @@ class Database:
     # ... остальные методы без изменений ...
 
     
-    def save_order(self, order_data: dict) -> int:
+    ACTIVE_STATUSES = ("pending", "confirmed")
+    
+    def _ensure_schedule(self):
+        if self.schedule.loaded:
+            return
         with self.session_scope() as session:
-            order = Order(**order_data)
-            session.add(order)
-            session.flush()
-            return order.id
+            rows = session.query(
+                Order.id, Order.order_performers, Order.order_date,
+                Order.order_time, Order.order_program
+            ).filter(Order.status.in_(self.ACTIVE_STATUSES)).all()
+            self.schedule.load(rows)
+    
+    def _index_order(self, order: Order):
+        """Синхронизирует индекс занятости и кэш доступности с записью заказа"""
+        if self.schedule.loaded:
+            if (order.status or "pending") in self.ACTIVE_STATUSES:
+                self.schedule.add(order.id, order.order_performers, order.order_date,
+                                  order.order_time, order.order_program)
+            else:
+                self.schedule.remove(order.id)
+        self.availability_cache.clear()
+    
+    def _hold_conflicts(self, session, performer: str, start: datetime, end: datetime,
+                        exclude_id: int = None) -> bool:
+        """Есть ли чужое действующее удержание, пересекающееся с интервалом"""
+        buffer = self.schedule.travel_buffer
+        holds = session.query(Reservation).filter(
+            Reservation.performer == performer,
+            Reservation.status == 'hold',
+            Reservation.expires_at > datetime.utcnow()
+        )
+        for hold in holds:
+            if hold.id == exclude_id:
+                continue
+            interval = order_interval(hold.slot_date, hold.slot_time, hold.program)
+            if interval and interval[0] - buffer < end and start < interval[1] + buffer:
+                return True
+        return False
+    
+    def hold_slot(self, performer: str, date: str, time: str, user_id: int,
+                  program: str = None, ttl: int = None) -> Optional[int]:
+        """
+        Временно удерживает слот исполнителя за пользователем.
+        Возвращает id удержания или None, если слот занят.
+        """
+        interval = order_interval(date, time, program)
+        if interval is None:
+            return None
+        expires_at = datetime.utcnow() + timedelta(seconds=ttl or config.RESERVATION_HOLD_SECONDS)
+        
+        with self._slot_lock:
+            self._ensure_schedule()
+            if self.schedule.is_busy(performer, *interval):
+                return None
+            try:
+                with self.session_scope() as session:
+                    # Прежние удержания пользователя и просроченные удержания больше не действуют
+                    session.query(Reservation).filter(
+                        Reservation.status == 'hold',
+                        (Reservation.user_id == user_id) | (Reservation.expires_at <= datetime.utcnow())
+                    ).delete(synchronize_session=False)
+                    
+                    if self._hold_conflicts(session, performer, *interval):
+                        return None
+                    
+                    reservation = Reservation(
+                        performer=performer, slot_date=date, slot_time=time,
+                        program=program, user_id=user_id, status='hold', expires_at=expires_at
+                    )
+                    session.add(reservation)
+                    session.flush()
+                    return reservation.id
+            except IntegrityError:
+                return None
+    
+    def release_hold(self, reservation_id: int):
+        """Снимает удержание (отмена или таймаут диалога)"""
+        with self.session_scope() as session:
+            session.query(Reservation).filter(
+                Reservation.id == reservation_id,
+                Reservation.status == 'hold'
+            ).delete(synchronize_session=False)
+    
+    def purge_expired_holds(self) -> int:
+        with self.session_scope() as session:
+            return session.query(Reservation).filter(
+                Reservation.status == 'hold',
+                Reservation.expires_at <= datetime.utcnow()
+            ).delete(synchronize_session=False)
+    
+    def save_order(self, order_data: dict, reservation_id: int = None) -> int:
+        """
+        Сохраняет заказ. Для конкретного исполнителя удержание превращается в бронь
+        в той же транзакции; если слот уже занят, выбрасывается SlotUnavailableError.
+        """
+        performer = order_data.get('order_performers')
+        if not performer or performer == ANY_PERFORMER:
+            with self.session_scope() as session:
+                order = Order(**order_data)
+                session.add(order)
+                session.flush()
+                self._index_order(order)
+                return order.id
+        
+        interval = order_interval(order_data['order_date'], order_data['order_time'],
+                                  order_data.get('order_program'))
+        if interval is None:
+            raise SlotUnavailableError("invalid slot")
+        
+        with self._slot_lock:
+            self._ensure_schedule()
+            try:
+                with self.session_scope() as session:
+                    reservation = session.get(Reservation, reservation_id) if reservation_id else None
+                    if reservation is not None and not (
+                        reservation.status == 'hold'
+                        and reservation.user_id == order_data.get('user_id')
+                        and reservation.performer == performer
+                        and reservation.slot_date == order_data['order_date']
+                        and reservation.slot_time == order_data['order_time']
+                    ):
+                        reservation = None
+                    
+                    if self.schedule.is_busy(performer, *interval) or self._hold_conflicts(
+                        session, performer, *interval, exclude_id=reservation.id if reservation else None
+                    ):
+                        raise SlotUnavailableError(f"{performer} is busy at {order_data['order_date']} {order_data['order_time']}")
+                    
+                    if reservation is None:
+                        reservation = Reservation(
+                            performer=performer,
+                            slot_date=order_data['order_date'],
+                            slot_time=order_data['order_time'],
+                            user_id=order_data.get('user_id')
+                        )
+                        session.add(reservation)
+                    
+                    order = Order(**order_data)
+                    session.add(order)
+                    session.flush()
+                    
+                    reservation.status = 'booked'
+                    reservation.order_id = order.id
+                    reservation.program = order.order_program
+                    reservation.expires_at = None
+                    session.flush()
+                    
+                    self._index_order(order)
+                    return order.id
+            except IntegrityError as e:
+                raise SlotUnavailableError(str(e)) from e
     
     def get_order(self, order_id: int) -> Optional[Dict]:
         # Используем локальный кэш вместо Redis
@@ -131,10 +329,158 @@ class Database:
             order = session.query(Order).get(order_id)
             if order:
                 order.status = status
+                if status not in self.ACTIVE_STATUSES:
+                    # Слот освобождается вместе с бронью
+                    session.query(Reservation).filter_by(order_id=order_id).delete(synchronize_session=False)
+                self._index_order(order)
                 # Удаляем из кэша
-                cache_key = order_id
-                if cache_key in self.order_cache:
-                    del self.order_cache[cache_key]
+                self.order_cache.pop(order_id, None)
+    
+    def update_order_time(self, order_id: int, new_time: str, new_date: str = None):
+        """
+        Переносит заказ вместе с бронью исполнителя.
+        Если новый слот занят, выбрасывается SlotUnavailableError и заказ не меняется.
+        """
+        with self._slot_lock:
+            self._ensure_schedule()
+            try:
+                with self.session_scope() as session:
+                    order = session.query(Order).get(order_id)
+                    if not order:
+                        return
+                    order_date = new_date or order.order_date
+                    performer = order.order_performers
+                    if performer and performer != ANY_PERFORMER:
+                        interval = order_interval(order_date, new_time, order.order_program)
+                        if interval is None or self.schedule.is_busy(
+                            performer, *interval, exclude_order_id=order_id
+                        ) or self._hold_conflicts(session, performer, *interval):
+                            raise SlotUnavailableError(f"{performer} is busy at {order_date} {new_time}")
+
+                    order.order_time = new_time
+                    order.order_date = order_date
+                    reservation = session.query(Reservation).filter_by(order_id=order_id).first()
+                    if reservation:
+                        reservation.slot_date = order.order_date
+                        reservation.slot_time = order.order_time
+                    session.flush()
+                    self._index_order(order)
+            except IntegrityError as e:
+                raise SlotUnavailableError(str(e)) from e
+            finally:
+                self.order_cache.pop(order_id, None)
+    
+    def claim_order(self, order_id: int, performer: str) -> bool:
+        """
+        Compare-and-swap: назначает исполнителя заказу, ожидающему замены.
+        Выигрывает только первый принявший предложение; остальные получают False.
+        """
+        with self._slot_lock:
+            self._ensure_schedule()
+            try:
+                with self.session_scope() as session:
+                    order = session.get(Order, order_id)
+                    if not order or order.status != 'reassigning':
+                        return False
+                    interval = order_interval(order.order_date, order.order_time, order.order_program)
+                    if interval is None or self.schedule.is_busy(
+                        performer, *interval, exclude_order_id=order_id
+                    ) or self._hold_conflicts(session, performer, *interval):
+                        return False
+                    
+                    updated = session.query(Order).filter(
+                        Order.id == order_id,
+                        Order.status == 'reassigning'
+                    ).update(
+                        {Order.order_performers: performer, Order.status: 'confirmed'},
+                        synchronize_session=False
+                    )
+                    if not updated:
+                        return False
+                    
+                    session.add(Reservation(
+                        performer=performer, slot_date=order.order_date, slot_time=order.order_time,
+                        program=order.order_program, user_id=order.user_id,
+                        status='booked', order_id=order_id
+                    ))
+                    session.flush()
+                    session.refresh(order)
+                    self._index_order(order)
+                    self.order_cache.pop(order_id, None)
+                    return True
+            except IntegrityError:
+                return False
+    
+    def release_unclaimed_order(self, order_id: int) -> bool:
+        """
+        Compare-and-swap: заказ, который никто не принял, возвращается из 'reassigning'
+        в 'pending' без исполнителя, оставшиеся предложения истекают.
+        False — заказ уже принят или освобожден.
+        """
+        with self._slot_lock:
+            with self.session_scope() as session:
+                updated = session.query(Order).filter(
+                    Order.id == order_id,
+                    Order.status == 'reassigning'
+                ).update(
+                    {Order.order_performers: ANY_PERFORMER, Order.status: 'pending'},
+                    synchronize_session=False
+                )
+                if not updated:
+                    return False
+                session.query(ReplacementOffer).filter_by(order_id=order_id, status='sent').update(
+                    {ReplacementOffer.status: 'expired'}, synchronize_session=False
+                )
+                self._index_order(session.get(Order, order_id))
+            self.order_cache.pop(order_id, None)
+            return True
+    
+    def get_stale_reassignments(self, max_age_seconds: int) -> List[int]:
+        """Заказы в 'reassigning', у которых нет ни одного действующего предложения моложе max_age_seconds"""
+        cutoff = datetime.utcnow() - timedelta(seconds=max_age_seconds)
+        with self.session_scope() as session:
+            offered = session.query(ReplacementOffer.id).filter(
+                ReplacementOffer.order_id == Order.id
+            ).exists()
+            live = session.query(ReplacementOffer.id).filter(
+                ReplacementOffer.order_id == Order.id,
+                ReplacementOffer.status == 'sent',
+                ReplacementOffer.created_at > cutoff
+            ).exists()
+            rows = session.query(Order.id).filter(Order.status == 'reassigning', offered, ~live).all()
+            return [row.id for row in rows]
+    
+    def add_replacement_offer(self, order_id: int, performer: str, chat_id: int, message_id: int) -> int:
+        with self.session_scope() as session:
+            offer = ReplacementOffer(order_id=order_id, performer=performer, chat_id=chat_id, message_id=message_id)
+            session.add(offer)
+            session.flush()
+            return offer.id
+    
+    def get_replacement_offers(self, order_id: int) -> List[Dict]:
+        with self.session_scope() as session:
+            offers = session.query(ReplacementOffer).filter_by(order_id=order_id).all()
+            return [{c.name: getattr(o, c.name) for c in o.__table__.columns} for o in offers]
+    
+    def set_offer_status(self, order_id: int, chat_id: int, status: str):
+        with self.session_scope() as session:
+            session.query(ReplacementOffer).filter_by(
+                order_id=order_id, chat_id=chat_id
+            ).update({ReplacementOffer.status: status}, synchronize_session=False)
+    
+    def get_assignable_performers(self) -> List[str]:
+        """Исполнители, которым можно отправить запрос подтверждения"""
+        cache_key = ("assignable",)
+        if cache_key in self.performer_cache:
+            return self.performer_cache[cache_key]
+        
+        with self.session_scope() as session:
+            rows = session.query(Performer.performer_name).filter(
+                Performer.telegram_user_id.isnot(None)
+            ).all()
+            result = [row.performer_name for row in rows]
+            self.performer_cache[cache_key] = result
+            return result
     
     def get_performer(self, name: str) -> Optional[Dict]:
         cache_key = name
@@ -149,26 +495,126 @@ class Database:
                 return result
         return None
     
-    def is_performer_available(self, performer_name: str, date: str, time: str) -> bool:
-        cache_key = (performer_name, date, time)
+    def is_performer_available(self, performer_name: str, date: str, time: str,
+                               program: str = None, exclude_order_id: int = None) -> bool:
+        """
+        Свободен ли исполнитель на время шоу (с учетом длительности программы
+        и времени на дорогу). Проверка по индексу интервалов — O(log n).
+        """
+        cache_key = (performer_name, date, time, program, exclude_order_id)
         if cache_key in self.availability_cache:
             return self.availability_cache[cache_key]
         
+        self._ensure_schedule()
+        is_available = self.schedule.is_free(
+            performer_name, date, time, program, exclude_order_id=exclude_order_id
+        )
+        self.availability_cache[cache_key] = is_available
+        return is_available
+    
+    def create_broadcast(self, message: str, created_by: int) -> int:
         with self.session_scope() as session:
-            count = session.query(Order).filter(
-                Order.order_performers == performer_name,
-                Order.order_date == date,
-                Order.order_time == time,
-                Order.status.in_(["pending", "confirmed"])
-            ).count()
-            is_available = count == 0
-            self.availability_cache[cache_key] = is_available
-            return is_available
+            campaign = BroadcastCampaign(message=message, created_by=created_by)
+            session.add(campaign)
+            session.flush()
+            return campaign.id
+    
+    def get_broadcast(self, campaign_id: int) -> Optional[Dict]:
+        with self.session_scope() as session:
+            campaign = session.get(BroadcastCampaign, campaign_id)
+            if campaign:
+                return {c.name: getattr(campaign, c.name) for c in campaign.__table__.columns}
+        return None
+    
+    def get_running_broadcasts(self) -> List[int]:
+        with self.session_scope() as session:
+            rows = session.query(BroadcastCampaign.id).filter_by(status='running').all()
+            return [row.id for row in rows]
+    
+    def set_broadcast_progress_message(self, campaign_id: int, chat_id: int, message_id: int):
+        with self.session_scope() as session:
+            campaign = session.get(BroadcastCampaign, campaign_id)
+            if campaign:
+                campaign.progress_chat_id = chat_id
+                campaign.progress_message_id = message_id
+    
+    def claim_broadcast_batch(self, campaign_id: int, limit: int = 100) -> List[int]:
+        """
+        Берет следующую порцию получателей после курсора и помечает их как pending.
+        Получатели, уже записанные в broadcast_deliveries, повторно не выдаются.
+        """
+        with self.session_scope() as session:
+            campaign = session.get(BroadcastCampaign, campaign_id)
+            if not campaign or campaign.status != 'running':
+                return []
+            
+            already = session.query(BroadcastDelivery.user_id).filter(
+                BroadcastDelivery.campaign_id == campaign_id,
+                BroadcastDelivery.user_id == Order.user_id
+            ).exists()
+            rows = (
+                session.query(Order.user_id)
+                .filter(Order.user_id > (campaign.cursor_user_id or 0), ~already)
+                .distinct()
+                .order_by(Order.user_id)
+                .limit(limit)
+                .all()
+            )
+            user_ids = [row.user_id for row in rows]
+            session.add_all([
+                BroadcastDelivery(campaign_id=campaign_id, user_id=user_id)
+                for user_id in user_ids
+            ])
+            if not user_ids:
+                campaign.status = 'done'
+                campaign.updated_at = datetime.utcnow()
+            return user_ids
+    
+    def expire_broadcast_claims(self, campaign_id: int) -> int:
+        """
+        Получатели, оставшиеся pending после падения процесса, помечаются unknown:
+        сообщение могло уйти, поэтому повторно они не выдаются, а учитываются как ошибки.
+        """
+        with self.session_scope() as session:
+            stale = session.query(BroadcastDelivery).filter(
+                BroadcastDelivery.campaign_id == campaign_id,
+                BroadcastDelivery.status == 'pending'
+            )
+            user_ids = [row.user_id for row in stale.with_entities(BroadcastDelivery.user_id)]
+            if not user_ids:
+                return 0
+            stale.update({BroadcastDelivery.status: 'unknown'}, synchronize_session=False)
+            
+            campaign = session.get(BroadcastCampaign, campaign_id)
+            campaign.failed = (campaign.failed or 0) + len(user_ids)
+            campaign.cursor_user_id = max(campaign.cursor_user_id or 0, max(user_ids))
+            campaign.updated_at = datetime.utcnow()
+            return len(user_ids)
+    
+    def checkpoint_broadcast(self, campaign_id: int, results: Dict[int, bool]):
+        """Фиксирует результаты порции и сдвигает курсор одной транзакцией"""
+        if not results:
+            return
+        with self.session_scope() as session:
+            for status in ('sent', 'failed'):
+                user_ids = [uid for uid, ok in results.items() if ok == (status == 'sent')]
+                if user_ids:
+                    session.query(BroadcastDelivery).filter(
+                        BroadcastDelivery.campaign_id == campaign_id,
+                        BroadcastDelivery.user_id.in_(user_ids)
+                    ).update({BroadcastDelivery.status: status}, synchronize_session=False)
+            
+            campaign = session.get(BroadcastCampaign, campaign_id)
+            sent = sum(1 for ok in results.values() if ok)
+            campaign.sent = (campaign.sent or 0) + sent
+            campaign.failed = (campaign.failed or 0) + len(results) - sent
+            campaign.cursor_user_id = max(results)
+            campaign.updated_at = datetime.utcnow()
     
     def create_support_ticket(self, user_id: int, message: str, user_name: str = None, username: str = None) -> int:
         """
-    Создает запрос в поддержку с возможностью указания дополнительной информации
-         """
+        Создает запрос в поддержку с возможностью указания дополнительной информации
+        """
         with self.session_scope() as session:
             # Если имя не указано, попробуем получить из профиля исполнителя
             if not user_name:
@@ -176,36 +622,51 @@ class Database:
                 if performer:
                     user_name = performer.performer_name
                     username = performer.telegram_user_id
-        
-        # Создаем объект
-        ticket = SupportTicket(
-            user_id=user_id,
-            message=message,
-            user_name=user_name or f"User_{user_id}",
-            username=username or f"user_{user_id}"
-        )
-        session.add(ticket)
-        session.flush()
-        return ticket.id
-
-def get_support_ticket(self, ticket_id: int) -> Optional[Dict]:
-    """
-    Получает информацию о тикете поддержки
-    """
-    with self.session_scope() as session:
-        ticket = session.query(SupportTicket).get(ticket_id)
-        if ticket:
-            return {
-                "id": ticket.id,
-                "user_id": ticket.user_id,
-                "user_name": ticket.user_name,
-                "username": ticket.username,
-                "message": ticket.message,
-                "created_at": ticket.created_at,
-                "resolved": ticket.resolved,
-                "photo_path": ticket.photo_path
-            }
-    return None
+            
+            # Создаем объект
+            ticket = SupportTicket(
+                user_id=user_id,
+                message=message,
+                user_name=user_name or f"User_{user_id}",
+                username=username or f"user_{user_id}"
+            )
+            session.add(ticket)
+            session.flush()
+            return ticket.id
+    
+    def get_support_ticket(self, ticket_id: int) -> Optional[Dict]:
+        """
+        Получает информацию о тикете поддержки
+        """
+        with self.session_scope() as session:
+            ticket = session.query(SupportTicket).get(ticket_id)
+            if ticket:
+                return {
+                    "id": ticket.id,
+                    "user_id": ticket.user_id,
+                    "user_name": ticket.user_name,
+                    "username": ticket.username,
+                    "message": ticket.message,
+                    "created_at": ticket.created_at,
+                    "resolved": ticket.resolved,
+                    "photo_path": ticket.photo_path,
+                    "photo_file_id": ticket.photo_file_id,
+                    "photo_sha256": ticket.photo_sha256
+                }
+        return None
+    
+    def set_ticket_photo(self, ticket_id: int, photo_path: str = None, photo_file_id: str = None,
+                         photo_sha256: str = None):
+        """Сохраняет путь к скриншоту, его Telegram file_id и хэш содержимого"""
+        with self.session_scope() as session:
+            ticket = session.get(SupportTicket, ticket_id)
+            if ticket:
+                if photo_path:
+                    ticket.photo_path = photo_path
+                if photo_file_id:
+                    ticket.photo_file_id = photo_file_id
+                if photo_sha256:
+                    ticket.photo_sha256 = photo_sha256
     
     def create_backup(self) -> str:
         os.makedirs(config.BACKUP_DIR, exist_ok=True)
@@ -0,0 +1,257 @@
+import asyncio
+import logging
+import queue
+import smtplib
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from email.message import Message
+from typing import List, Optional
+from core.config import config
+from core.security import decrypt_data
+
+logger = logging.getLogger(__name__)
+
+# Ошибки соединения: сессию нужно открыть заново
+CONNECTION_ERRORS = (smtplib.SMTPServerDisconnected, smtplib.SMTPConnectError)
+
+
+def is_connection_error(error: BaseException) -> bool:
+    """
+    Обрыв или недоступность сервера. SMTPException — подкласс OSError, поэтому
+    отказы сервера по письму (получатель, отправитель, данные) сюда не относятся.
+    """
+    if isinstance(error, CONNECTION_ERRORS):
+        return True
+    return isinstance(error, OSError) and not isinstance(error, smtplib.SMTPException)
+
+
+class SMTPPool:
+    """
+    Небольшой пул SMTP-сессий, уже прошедших STARTTLS и авторизацию.
+    Перед повторным использованием простаивавшая сессия проверяется NOOP,
+    слишком долго простаивавшие закрываются. Методы синхронные — для пула потоков.
+    """
+
+    def __init__(self, host: str, port: int, user: str = None, password: str = None,
+                 size: int = 2, keepalive: float = 30, idle_timeout: float = 300, timeout: float = 30):
+        self.host = host
+        self.port = port
+        self.user = user
+        self.password = password
+        self.size = size
+        self.keepalive = keepalive
+        self.idle_timeout = idle_timeout
+        self.timeout = timeout
+        self._idle: "queue.LifoQueue" = queue.LifoQueue()
+        self._lock = threading.Lock()
+        self.connects = 0
+
+    def connect(self) -> smtplib.SMTP:
+        server = smtplib.SMTP(self.host, self.port, timeout=self.timeout)
+        try:
+            server.ehlo()
+            if server.has_extn('starttls'):
+                server.starttls()
+                server.ehlo()
+            if self.user and server.has_extn('auth'):
+                server.login(self.user, self.password)
+        except Exception:
+            self._quit(server)
+            raise
+        with self._lock:
+            self.connects += 1
+        return server
+
+    @staticmethod
+    def _quit(server: smtplib.SMTP):
+        try:
+            server.quit()
+        except Exception:
+            server.close()
+
+    @staticmethod
+    def _alive(server: smtplib.SMTP) -> bool:
+        try:
+            return server.noop()[0] == 250
+        except Exception:
+            return False
+
+    def acquire(self) -> smtplib.SMTP:
+        while True:
+            try:
+                server, last_used = self._idle.get_nowait()
+            except queue.Empty:
+                return self.connect()
+            idle = time.monotonic() - last_used
+            if idle > self.idle_timeout:
+                self._quit(server)
+                continue
+            if idle > self.keepalive and not self._alive(server):
+                server.close()
+                continue
+            return server
+
+    def release(self, server: smtplib.SMTP):
+        if self._idle.qsize() >= self.size:
+            self._quit(server)
+        else:
+            self._idle.put((server, time.monotonic()))
+
+    def keepalive_idle(self):
+        """NOOP для простаивающих сессий; закрывает мертвые и простаивавшие дольше idle_timeout"""
+        alive = []
+        while True:
+            try:
+                server, last_used = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            if time.monotonic() - last_used > self.idle_timeout or not self._alive(server):
+                self._quit(server)
+            else:
+                alive.append((server, last_used))
+        for item in reversed(alive):
+            self._idle.put(item)
+
+    def close(self):
+        while True:
+            try:
+                server, _ = self._idle.get_nowait()
+            except queue.Empty:
+                return
+            self._quit(server)
+
+
+class EmailTransport:
+    """
+    Очередь исходящих писем. Воркеры забирают до batch_size писем и отправляют
+    их подряд по одной сессии из SMTPPool, без повторного STARTTLS и входа.
+    При обрыве соединения сессия переоткрывается и письмо отправляется еще раз.
+    """
+
+    def __init__(self, host: str = None, port: int = None, user: str = None, password: str = None,
+                 pool_size: int = None, batch_size: int = None, keepalive: float = None,
+                 idle_timeout: float = None):
+        self.host = host or config.SMTP_SERVER
+        self.port = port or config.SMTP_PORT
+        self.user = user if user is not None else config.SMTP_USER
+        self._password = password
+        self.pool_size = pool_size or config.SMTP_POOL_SIZE
+        self.batch_size = batch_size or config.SMTP_BATCH_SIZE
+        self.keepalive = keepalive or config.SMTP_KEEPALIVE
+        self.idle_timeout = idle_timeout or config.SMTP_IDLE_TIMEOUT
+        self.pool: Optional[SMTPPool] = None
+        self.executor = ThreadPoolExecutor(max_workers=self.pool_size, thread_name_prefix="smtp")
+        self.queue: Optional[asyncio.Queue] = None
+        self._workers = []
+        self.sent = 0
+        self.failed = 0
+
+    @property
+    def configured(self) -> bool:
+        return bool(self.host)
+
+    def _get_pool(self) -> SMTPPool:
+        if self.pool is None:
+            # Пароль расшифровывается один раз, а не для каждого письма
+            password = self._password if self._password is not None else decrypt_data(config.SMTP_PASSWORD)
+            self.pool = SMTPPool(
+                self.host, self.port, self.user, password,
+                size=self.pool_size, keepalive=self.keepalive, idle_timeout=self.idle_timeout
+            )
+        return self.pool
+
+    def start(self):
+        if self._workers:
+            return
+        self.queue = asyncio.Queue()
+        self._workers = [
+            asyncio.create_task(self._worker(), name=f"smtp-{i}")
+            for i in range(self.pool_size)
+        ]
+        logger.info(f"Email transport started with {self.pool_size} SMTP sessions")
+
+    async def stop(self):
+        """Дожидается отправки очереди и закрывает сессии"""
+        if self._workers:
+            await self.queue.join()
+            for task in self._workers:
+                task.cancel()
+            await asyncio.gather(*self._workers, return_exceptions=True)
+            self._workers = []
+        if self.pool:
+            await asyncio.get_running_loop().run_in_executor(self.executor, self.pool.close)
+
+    async def send(self, msg: Message) -> bool:
+        """Ставит письмо в очередь и ждет результата отправки"""
+        if not self._workers:
+            self.start()
+        future = asyncio.get_running_loop().create_future()
+        self.queue.put_nowait((msg, future))
+        return await future
+
+    async def _worker(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            try:
+                first = await asyncio.wait_for(self.queue.get(), timeout=self.keepalive)
+            except asyncio.TimeoutError:
+                if self.pool:
+                    await loop.run_in_executor(self.executor, self.pool.keepalive_idle)
+                continue
+
+            batch = [first]
+            while len(batch) < self.batch_size and not self.queue.empty():
+                batch.append(self.queue.get_nowait())
+            try:
+                errors = await loop.run_in_executor(
+                    self.executor, self._send_batch, [msg for msg, _ in batch]
+                )
+            except Exception as e:
+                errors = [e] * len(batch)
+            for (msg, future), error in zip(batch, errors):
+                if error is None:
+                    self.sent += 1
+                else:
+                    self.failed += 1
+                    logger.error(f"Email to {msg.get('To')} failed: {error}")
+                if not future.done():
+                    future.set_result(error is None)
+                self.queue.task_done()
+
+    def _send_batch(self, messages: List[Message]) -> List[Optional[Exception]]:
+        """Отправляет пачку по одной сессии; возвращает ошибку (или None) для каждого письма"""
+        pool = self._get_pool()
+        errors: List[Optional[Exception]] = []
+        server = None
+        try:
+            for msg in messages:
+                if len(errors) and is_connection_error(errors[-1]) and server is None:
+                    # Сервер недоступен — остаток пачки не ждет таймаутов подключения
+                    errors.append(errors[-1])
+                    continue
+                for attempt in range(2):
+                    try:
+                        if server is None:
+                            server = pool.acquire()
+                        server.send_message(msg)
+                        errors.append(None)
+                        break
+                    except OSError as e:
+                        if not is_connection_error(e):
+                            # Письмо отклонено сервером, сессия исправна
+                            errors.append(e)
+                            break
+                        # Сессия оборвалась — переподключаемся и повторяем письмо один раз
+                        if server is not None:
+                            server.close()
+                            server = None
+                        if attempt:
+                            errors.append(e)
+        finally:
+            if server is not None:
+                pool.release(server)
+        return errors
+
+
+email_transport = EmailTransport()
@@ -1,161 +1,237 @@
 import logging
 import json
-import asyncio
+import threading
+from concurrent.futures import Future
 from datetime import datetime, timedelta
-from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, Optional, Tuple
+import httplib2
+from cachetools import LRUCache
+from google.auth.exceptions import RefreshError
 from google.oauth2.credentials import Credentials
+from google_auth_httplib2 import Request as AuthRequest
 from googleapiclient.discovery import build
-from googleapiclient.errors import HttpError
 from core.database import db
 from core.config import config
 from core.utils import validate_date_time_format  # Новая функция валидации
+from core.intervals import show_duration
 from models.performer import Performer  # Импорт модели
-from models.order import Order  # Импорт модели
 
 logger = logging.getLogger(__name__)
 
-# Кэш сервисов для производительности
-SERVICE_CACHE = {}
+CALENDAR_TIMEZONE = 'Europe/Moscow'
+EVENT_ID_PREFIX = 'order'
+
+
+def _default_service_builder(creds: Credentials):
+    return build(
+        'calendar',
+        'v3',
+        credentials=creds,
+        cache_discovery=False  # Ускоряет создание сервиса
+    )
+
+
+class CalendarClientCache:
+    """
+    Ограниченный LRU-кэш клиентов Google Calendar по исполнителям.
+    Клиент создается один раз даже при одновременных запросах; токен доступа
+    обновляется заранее, до истечения, и сохраняется в Performer.google_tokens,
+    поэтому после вытеснения или перезапуска повторное обновление не нужно.
+    """
+
+    def __init__(
+        self,
+        maxsize: int = None,
+        refresh_margin: int = None,
+        credentials_loader: Callable[[dict], Credentials] = None,
+        service_builder: Callable[[Credentials], object] = None
+    ):
+        self.clients = LRUCache(maxsize=maxsize or config.CALENDAR_CLIENT_CACHE_SIZE)
+        self.refresh_margin = timedelta(seconds=refresh_margin or config.CALENDAR_TOKEN_REFRESH_MARGIN)
+        self.credentials_loader = credentials_loader or Credentials.from_authorized_user_info
+        self.service_builder = service_builder or _default_service_builder
+        self._lock = threading.Lock()
+        self._building: Dict[int, Future] = {}
+        self.stats = {'hits': 0, 'builds': 0, 'shared_builds': 0, 'token_refreshes': 0}
+
+    def get(self, user_id: int):
+        """Сервис календаря исполнителя или None, если календарь не подключен"""
+        with self._lock:
+            entry = self.clients.get(user_id)
+            if entry:
+                self.stats['hits'] += 1
+                return entry[0]
+            future = self._building.get(user_id)
+            owner = future is None
+            if owner:
+                future = self._building[user_id] = Future()
+            else:
+                self.stats['shared_builds'] += 1
+
+        if not owner:
+            entry = future.result()
+            return entry[0] if entry else None
+
+        entry = None
+        try:
+            entry = self._build(user_id)
+        finally:
+            with self._lock:
+                if entry:
+                    self.clients[user_id] = entry
+                self._building.pop(user_id, None)
+            future.set_result(entry)
+        return entry[0] if entry else None
+
+    def _load_credentials(self, user_id: int) -> Optional[Credentials]:
+        performer = db.get_performer_by_user_id(user_id)
+        if not performer:
+            logger.warning(f"Performer not found for user_id: {user_id}")
+            return None
+        if not performer.get('google_tokens'):
+            logger.warning(f"No Google tokens for performer: {performer['id']}")
+            return None
+        try:
+            return self.credentials_loader(json.loads(performer['google_tokens']))
+        except (json.JSONDecodeError, TypeError, ValueError) as e:
+            logger.error(f"Invalid Google tokens JSON (user {user_id}): {e}")
+            return None
+
+    def _build(self, user_id: int) -> Optional[Tuple[object, Credentials]]:
+        creds = self._load_credentials(user_id)
+        if not creds:
+            return None
+        try:
+            if not creds.valid and creds.refresh_token:
+                self._refresh(user_id, creds)
+            service = self.service_builder(creds)
+            self.stats['builds'] += 1
+            return service, creds
+        except RefreshError as e:
+            logger.error(f"Google token refresh rejected for user {user_id}: {e}")
+            clear_performer_tokens(user_id)
+        except Exception as e:
+            logger.error(f"Error creating Google Calendar service: {e}")
+        return None
+
+    def _refresh(self, user_id: int, creds: Credentials):
+        """Обновляет токен доступа и сохраняет его, чтобы не обновлять заново после перезапуска"""
+        creds.refresh(AuthRequest(httplib2.Http()))
+        self.stats['token_refreshes'] += 1
+        with db.session_scope() as session:
+            performer = session.query(Performer).filter_by(telegram_user_id=user_id).first()
+            if performer:
+                performer.google_tokens = creds.to_json()
+                db.performer_cache.pop(performer.performer_name, None)
+
+    def refresh_expiring(self) -> int:
+        """
+        Заранее обновляет токены, истекающие в ближайшие refresh_margin.
+        Запускается в потоке синхронизации календаря, который пользуется этими клиентами.
+        """
+        deadline = datetime.utcnow() + self.refresh_margin
+        with self._lock:
+            entries = list(self.clients.items())
+        refreshed = 0
+        for user_id, (_, creds) in entries:
+            if not creds.refresh_token or (creds.expiry and creds.expiry > deadline):
+                continue
+            try:
+                self._refresh(user_id, creds)
+                refreshed += 1
+            except RefreshError as e:
+                logger.error(f"Google token refresh rejected for user {user_id}: {e}")
+                clear_performer_tokens(user_id)
+            except Exception as e:
+                logger.warning(f"Google token refresh for user {user_id} failed, will retry: {e}")
+        return refreshed
+
+    def handle_unauthorized(self, user_id: int):
+        """
+        401 от API: пробуем обновить токен. Токены удаляются, только если
+        Google отклонил refresh token (доступ отозван).
+        """
+        with self._lock:
+            entry = self.clients.pop(user_id, None)
+        creds = entry[1] if entry else self._load_credentials(user_id)
+        if not creds or not creds.refresh_token:
+            clear_performer_tokens(user_id)
+            return
+        try:
+            self._refresh(user_id, creds)
+            with self._lock:
+                if entry:
+                    self.clients[user_id] = entry
+        except RefreshError as e:
+            logger.error(f"Google token refresh rejected for user {user_id}: {e}")
+            clear_performer_tokens(user_id)
+        except Exception as e:
+            logger.warning(f"Google token refresh for user {user_id} failed: {e}")
+
+    def invalidate(self, user_id: int):
+        with self._lock:
+            self.clients.pop(user_id, None)
+
+
+clients = CalendarClientCache()
 
 def get_calendar_service(user_id: int):
     """Возвращает сервис Google Calendar для пользователя, используя кэш"""
-    # Проверка кэша
-    if user_id in SERVICE_CACHE:
-        return SERVICE_CACHE[user_id]
-    
-    # Получение данных исполнителя
-    performer = db.get_performer_by_user_id(user_id)
-    if not performer:
-        logger.warning(f"Performer not found for user_id: {user_id}")
-        return None
-    
-    # Проверка токенов
-    if not performer.get('google_tokens'):
-        logger.warning(f"No Google tokens for performer: {performer['id']}")
+    return clients.get(user_id)
+
+def event_id_for(order_id: int) -> str:
+    """
+    Детерминированный id события (base32hex: a-v, 0-9). Повторная вставка того же
+    заказа дает 409 вместо дубликата, что делает синхронизацию идемпотентной.
+    """
+    return f"{EVENT_ID_PREFIX}{order_id:06d}"
+
+def order_id_for(event_id: str) -> Optional[int]:
+    """Обратное к event_id_for; None для событий, созданных не ботом"""
+    if not event_id or not event_id.startswith(EVENT_ID_PREFIX):
         return None
-    
-    try:
-        # Десериализация токенов
-        tokens = json.loads(performer['google_tokens'])
-        
-        # Создание учетных данных
-        creds = Credentials.from_authorized_user_info(tokens)
-        
-        # Создание сервиса календаря
-        service = build(
-            'calendar', 
-            'v3', 
-            credentials=creds,
-            cache_discovery=False  # Ускоряет создание сервиса
-        )
-        
-        # Сохранение в кэш
-        SERVICE_CACHE[user_id] = service
-        return service
-    
-    except (json.JSONDecodeError, TypeError) as e:
-        logger.error(f"Invalid Google tokens JSON (user {user_id}): {e}")
-    except Exception as e:
-        logger.error(f"Error creating Google Calendar service: {e}")
-    
-    return None
-
-async def sync_order_to_calendar(order_id: int):
-    """Асинхронная синхронизация заказа с Google Calendar"""
-    # Получаем данные заказа
-    order = db.get_order(order_id)
-    if not order:
-        logger.warning(f"Order {order_id} not found")
-        return
-    
-    # Проверяем наличие исполнителя
-    performer_id = order.get('performer_id')
-    if not performer_id:
-        logger.warning(f"No performer for order {order_id}")
-        return
-    
-    # Получаем сервис календаря
-    service = get_calendar_service(performer_id)
-    if not service:
-        logger.warning(f"Calendar service unavailable for performer {performer_id}")
-        return
-    
-    # Форматируем дату и время
+    suffix = event_id[len(EVENT_ID_PREFIX):]
+    return int(suffix) if suffix.isdigit() else None
+
+def build_event(order: dict) -> dict:
+    """Формирует тело события Google Calendar для заказа"""
     date_str = f"{order['order_date']} {order['order_time']}"
-    
-    # Валидация формата даты
     if not validate_date_time_format(date_str, "%d.%m.%Y %H:%M"):
-        logger.error(f"Invalid date format for order {order_id}: {date_str}")
-        return
+        raise ValueError(f"Invalid date format for order {order['id']}: {date_str}")
     
+    start_dt = datetime.strptime(date_str, "%d.%m.%Y %H:%M")
+    end_dt = start_dt + show_duration(order.get('order_program'))
+    return {
+        'summary': f"Заказ #{order['id']}",
+        'description': (
+            f"Программа: {order['order_program']}\n"
+            f"Место: {order['order_location']}\n"
+            f"Клиент: {order['user_name']}"
+        ),
+        'start': {
+            'dateTime': start_dt.isoformat(),
+            'timeZone': CALENDAR_TIMEZONE
+        },
+        'end': {
+            'dateTime': end_dt.isoformat(),
+            'timeZone': CALENDAR_TIMEZONE
+        },
+        'reminders': {
+            'useDefault': True
+        },
+        # Восстанавливает событие, если оно было удалено ранее
+        'status': 'confirmed',
+    }
+
+def clear_performer_tokens(user_id: int):
+    """Сбрасывает токены Google исполнителя после ошибки авторизации"""
+    logger.error("Google API authorization expired. Clearing tokens...")
     try:
-        # Парсинг даты
-        start_dt = datetime.strptime(date_str, "%d.%m.%Y %H:%M")
-        start_iso = start_dt.isoformat()
-        end_iso = (start_dt + timedelta(hours=2)).isoformat()
-        
-        # Формируем событие
-        event = {
-            'summary': f"Заказ #{order_id}",
-            'description': (
-                f"Программа: {order['order_program']}\n"
-                f"Место: {order['order_location']}\n"
-                f"Клиент: {order['user_name']}"
-            ),
-            'start': {
-                'dateTime': start_iso,
-                'timeZone': 'Europe/Moscow'
-            },
-            'end': {
-                'dateTime': end_iso,
-                'timeZone': 'Europe/Moscow'
-            },
-            'reminders': {
-                'useDefault': True
-            },
-        }
-        
-        # Асинхронный вызов Google API
-        loop = asyncio.get_running_loop()
-        with ThreadPoolExecutor() as pool:
-            created_event = await loop.run_in_executor(
-                pool, 
-                lambda: service.events().insert(
-                    calendarId='primary',
-                    body=event
-                ).execute()
-            )
-        
-        logger.info(f"Google Calendar event created: {created_event['id']}")
-        
-        # Обновляем заказ в БД
         with db.session_scope() as session:
-            order_obj = session.query(Order).get(order_id)
-            if order_obj:
-                order_obj.calendar_event_id = created_event['id']
-                session.commit()
-                logger.debug(f"Order {order_id} updated with event ID")
-    
-    except HttpError as e:
-        # Обработка ошибок авторизации
-        if e.resp.status == 401:
-            logger.error("Google API authorization expired. Clearing tokens...")
-            try:
-                with db.session_scope() as session:
-                    performer_obj = session.query(Performer).filter_by(id=performer_id).first()
-                    if performer_obj:
-                        performer_obj.google_tokens = None
-                        session.commit()
-                        logger.info(f"Google tokens cleared for performer {performer_id}")
-                        
-                        # Очищаем кэш
-                        if performer_id in SERVICE_CACHE:
-                            del SERVICE_CACHE[performer_id]
-            except Exception as db_error:
-                logger.error(f"Error clearing tokens: {db_error}")
-        
-        else:
-            logger.error(f"Google API error: {e}")
-    
-    except Exception as e:
-        logger.error(f"Error syncing to Google Calendar: {e}", exc_info=True)
\ No newline at end of file
+            performer_obj = session.query(Performer).filter_by(telegram_user_id=user_id).first()
+            if performer_obj:
+                performer_obj.clear_google_tokens()
+                logger.info(f"Google tokens cleared for performer {performer_obj.id}")
+    except Exception as db_error:
+        logger.error(f"Error clearing tokens: {db_error}")
+    clients.invalidate(user_id)
@@ -0,0 +1,241 @@
+import bisect
+import heapq
+import logging
+import threading
+from datetime import datetime, timedelta
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from .config import config
+
+logger = logging.getLogger(__name__)
+
+DATETIME_FORMAT = "%d.%m.%Y %H:%M"
+
+
+def show_duration(program: Optional[str]) -> timedelta:
+    """Длительность шоу: точное совпадение программы, затем ее категория, иначе по умолчанию"""
+    durations = config.SHOW_DURATIONS
+    if program:
+        if program in durations:
+            return timedelta(minutes=durations[program])
+        category = program.split(" - ", 1)[0]
+        if category in durations:
+            return timedelta(minutes=durations[category])
+    return timedelta(minutes=config.DEFAULT_SHOW_DURATION)
+
+
+def parse_slot(date: str, time: str) -> Optional[datetime]:
+    try:
+        return datetime.strptime(f"{date} {time}", DATETIME_FORMAT)
+    except (TypeError, ValueError):
+        return None
+
+
+def order_interval(date: str, time: str, program: Optional[str]) -> Optional[Tuple[datetime, datetime]]:
+    start = parse_slot(date, time)
+    if start is None:
+        return None
+    return start, start + show_duration(program)
+
+
+class PerformerTimeline:
+    """Отсортированные по началу интервалы одного исполнителя"""
+
+    __slots__ = ("starts", "items", "max_length")
+
+    def __init__(self):
+        self.starts: List[datetime] = []
+        self.items: List[Tuple[datetime, datetime, int]] = []
+        self.max_length = timedelta(0)
+
+    def add(self, start: datetime, end: datetime, order_id: int):
+        index = bisect.bisect_right(self.starts, start)
+        self.starts.insert(index, start)
+        self.items.insert(index, (start, end, order_id))
+        self.max_length = max(self.max_length, end - start)
+
+    def remove(self, start: datetime, order_id: int) -> bool:
+        index = bisect.bisect_left(self.starts, start)
+        while index < len(self.items) and self.starts[index] == start:
+            if self.items[index][2] == order_id:
+                del self.starts[index]
+                del self.items[index]
+                return True
+            index += 1
+        return False
+
+    def overlapping(self, start: datetime, end: datetime) -> List[Tuple[datetime, datetime, int]]:
+        """
+        Интервалы, пересекающиеся с [start, end).
+        Начало подходящего интервала лежит в (start - max_length, end), поэтому
+        достаточно двух бинарных поисков: O(log n + k).
+        """
+        lo = bisect.bisect_right(self.starts, start - self.max_length)
+        hi = bisect.bisect_left(self.starts, end)
+        return [item for item in self.items[lo:hi] if item[1] > start]
+
+
+def subtract_intervals(windows: Iterable[Tuple[datetime, datetime]],
+                       holes: Iterable[Tuple[datetime, datetime]]) -> List[Tuple[datetime, datetime]]:
+    """Части окон windows, не покрытые интервалами holes"""
+    holes = sorted(holes)
+    result = []
+    for start, end in sorted(windows):
+        for hole_start, hole_end in holes:
+            if hole_end <= start or hole_start >= end:
+                continue
+            if hole_start > start:
+                result.append((start, hole_start))
+            start = max(start, hole_end)
+            if start >= end:
+                break
+        if start < end:
+            result.append((start, end))
+    return result
+
+
+class BusyWindows:
+    """
+    Внешняя занятость исполнителей (free/busy из Google Calendar).
+    Окна каждого исполнителя хранятся отсортированными и непересекающимися,
+    поэтому проверка пересечения — один бинарный поиск. Устаревшие данные
+    (старше ttl) не учитываются: лучше пропустить личное событие, чем
+    блокировать запись, когда Google недоступен.
+    """
+
+    def __init__(self, ttl: timedelta = None):
+        self.ttl = ttl if ttl is not None else timedelta(seconds=config.FREEBUSY_TTL)
+        self._windows: Dict[str, Tuple[List[datetime], List[datetime], datetime]] = {}
+        self._lock = threading.Lock()
+
+    def replace(self, performer: str, windows: Iterable[Tuple[datetime, datetime]]):
+        merged: List[List[datetime]] = []
+        for start, end in sorted(windows):
+            if merged and start <= merged[-1][1]:
+                merged[-1][1] = max(merged[-1][1], end)
+            else:
+                merged.append([start, end])
+        with self._lock:
+            self._windows[performer] = ([w[0] for w in merged], [w[1] for w in merged], datetime.now())
+
+    def overlaps(self, performer: str, start: datetime, end: datetime) -> bool:
+        with self._lock:
+            entry = self._windows.get(performer)
+        if not entry or datetime.now() - entry[2] > self.ttl:
+            return False
+        starts, ends, _ = entry
+        index = bisect.bisect_right(ends, start)
+        return index < len(starts) and starts[index] < end
+
+
+class ScheduleIndex:
+    """
+    Индекс занятости исполнителей в памяти. Загружается из таблицы orders
+    и обновляется при каждой записи заказа.
+    """
+
+    def __init__(self, travel_buffer: timedelta = None):
+        self.travel_buffer = travel_buffer if travel_buffer is not None else timedelta(minutes=config.TRAVEL_BUFFER_MINUTES)
+        self.timelines: Dict[str, PerformerTimeline] = {}
+        self.orders: Dict[int, Tuple[str, datetime, datetime]] = {}
+        # Нагрузка: суммарная длительность предстоящих шоу по исполнителям
+        self.upcoming: Dict[str, float] = {}
+        self._expiry: List[Tuple[datetime, int]] = []
+        self._counted = set()  # брони, учтенные в upcoming
+        self.external = BusyWindows()
+        self.loaded = False
+        self._lock = threading.RLock()
+
+    def load(self, orders: Iterable[Tuple[int, str, str, str, Optional[str]]]):
+        """orders: (id, performer, date, time, program) активных заказов"""
+        with self._lock:
+            self.timelines.clear()
+            self.orders.clear()
+            self.upcoming.clear()
+            self._expiry.clear()
+            self._counted.clear()
+            for order_id, performer, date, time, program in orders:
+                self.add(order_id, performer, date, time, program)
+            self.loaded = True
+            logger.info(f"Schedule index loaded: {len(self.orders)} bookings")
+
+    def add(self, order_id: int, performer: str, date: str, time: str, program: Optional[str] = None):
+        interval = order_interval(date, time, program)
+        if not performer or interval is None:
+            return
+        with self._lock:
+            self.remove(order_id)
+            start, end = interval
+            self.timelines.setdefault(performer, PerformerTimeline()).add(start, end, order_id)
+            self.orders[order_id] = (performer, start, end)
+            if end > datetime.now():
+                self.upcoming[performer] = self.upcoming.get(performer, 0.0) + (end - start).total_seconds()
+                self._counted.add(order_id)
+                heapq.heappush(self._expiry, (end, order_id))
+
+    def remove(self, order_id: int):
+        with self._lock:
+            booking = self.orders.pop(order_id, None)
+            if booking:
+                performer, start, end = booking
+                self.timelines[performer].remove(start, order_id)
+                if order_id in self._counted:
+                    self._counted.discard(order_id)
+                    self.upcoming[performer] -= (end - start).total_seconds()
+
+    def _expire_past(self):
+        """Снимает из нагрузки прошедшие шоу; амортизированно O(log n) на бронь"""
+        now = datetime.now()
+        while self._expiry and self._expiry[0][0] <= now:
+            end, order_id = heapq.heappop(self._expiry)
+            booking = self.orders.get(order_id)
+            if booking and booking[2] == end and order_id in self._counted:
+                performer, start, _ = booking
+                self._counted.discard(order_id)
+                self.upcoming[performer] -= (end - start).total_seconds()
+
+    def bookings(self, performer: str) -> List[Tuple[datetime, datetime, int]]:
+        """Копия интервалов исполнителя: (начало, конец, order_id)"""
+        with self._lock:
+            timeline = self.timelines.get(performer)
+            return list(timeline.items) if timeline else []
+
+    def upcoming_hours(self, performer: str) -> float:
+        with self._lock:
+            self._expire_past()
+            return self.upcoming.get(performer, 0.0) / 3600
+
+    def least_loaded_free(self, performers: Iterable[str], date: str, time: str,
+                          program: Optional[str] = None) -> List[str]:
+        """Свободные на это время исполнители, от наименее загруженного к наиболее"""
+        interval = order_interval(date, time, program)
+        if interval is None:
+            return []
+        with self._lock:
+            self._expire_past()
+            free = [p for p in performers if not self.is_busy(p, *interval)]
+            return sorted(free, key=lambda p: (self.upcoming.get(p, 0.0), p))
+
+    def conflicts(self, performer: str, start: datetime, end: datetime,
+                  exclude_order_id: int = None) -> List[int]:
+        """Заказы исполнителя, пересекающиеся с [start, end) с учетом времени на дорогу"""
+        with self._lock:
+            timeline = self.timelines.get(performer)
+            if not timeline:
+                return []
+            found = timeline.overlapping(start - self.travel_buffer, end + self.travel_buffer)
+            return [order_id for _, _, order_id in found if order_id != exclude_order_id]
+
+    def is_busy(self, performer: str, start: datetime, end: datetime,
+                exclude_order_id: int = None) -> bool:
+        """Занят ли исполнитель заказами бота или по личному календарю"""
+        if self.conflicts(performer, start, end, exclude_order_id=exclude_order_id):
+            return True
+        return self.external.overlaps(performer, start - self.travel_buffer, end + self.travel_buffer)
+
+    def is_free(self, performer: str, date: str, time: str, program: Optional[str] = None,
+                exclude_order_id: int = None) -> bool:
+        interval = order_interval(date, time, program)
+        if interval is None:
+            return False
+        return not self.is_busy(performer, *interval, exclude_order_id=exclude_order_id)
@@ -0,0 +1,207 @@
+import atexit
+import contextvars
+import copy
+import json
+import logging
+import os
+import queue
+import threading
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+from typing import Dict, List, Optional
+from dotenv import load_dotenv
+
+# Настройка логирования выполняется до загрузки config (он требует BOT_TOKEN),
+# поэтому параметры читаются из окружения напрямую:
+#   LOG_FILE          — имя файла в каталоге logs (bot.log)
+#   LOG_LEVEL         — уровень корневого логгера (INFO)
+#   LOG_FORMAT        — text или json
+#   LOG_QUEUE_SIZE    — предел очереди записей; при переполнении записи отбрасываются (10000)
+#   LOG_SAMPLE_RATES  — '{"services.notifications": 10}': пропускать каждую N-ю запись
+#                       ниже WARNING от логгера и его потомков
+TEXT_FORMAT = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+
+# Поля LogRecord, которые не попадают в JSON как extra
+_RECORD_FIELDS = set(vars(logging.makeLogRecord({}))) | {"message", "asctime", "taskName"}
+
+# Контекст текущего обновления: update_id, user_id, state
+_context: contextvars.ContextVar[Optional[dict]] = contextvars.ContextVar("log_context", default=None)
+
+
+def bind(**fields):
+    """Добавляет поля к контексту логирования текущей задачи; возвращает токен для unbind"""
+    context = dict(_context.get() or {})
+    context.update({k: v for k, v in fields.items() if v is not None})
+    return _context.set(context)
+
+
+def unbind(token):
+    _context.reset(token)
+
+
+def current_context() -> dict:
+    return dict(_context.get() or {})
+
+
+class SamplingFilter(logging.Filter):
+    """Пропускает каждую N-ю запись ниже WARNING от шумных логгеров (и их потомков)"""
+
+    def __init__(self, rates: Dict[str, int]):
+        super().__init__()
+        self.rates = {name: int(rate) for name, rate in rates.items() if int(rate) > 1}
+        self._counters: Dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    def _rate_for(self, name: str):
+        while name:
+            if name in self.rates:
+                return name, self.rates[name]
+            name = name.rpartition(".")[0]
+        return None, 1
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno >= logging.WARNING or not self.rates:
+            return True
+        name, rate = self._rate_for(record.name)
+        if rate <= 1:
+            return True
+        with self._lock:
+            count = self._counters.get(name, 0)
+            self._counters[name] = count + 1
+        if count % rate:
+            return False
+        record.sampled = rate
+        return True
+
+
+class ContextQueueHandler(QueueHandler):
+    """
+    Кладет запись в очередь без блокировки: сообщение форматируется и контекст
+    обновления прикрепляется в потоке вызова, запись в файл — в фоновом потоке.
+    """
+
+    def __init__(self, log_queue: queue.Queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        record = copy.copy(record)
+        record.message = record.getMessage()
+        if record.exc_info and not record.exc_text:
+            record.exc_text = _exception_formatter.formatException(record.exc_info)
+        record.msg = record.message
+        record.args = None
+        record.exc_info = None
+        for key, value in (_context.get() or {}).items():
+            if not hasattr(record, key):
+                setattr(record, key, value)
+        return record
+
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            # Цикл событий не должен ждать диск: при переполнении запись теряется
+            self.dropped += 1
+
+
+class BackgroundListener(QueueListener):
+    def enqueue_sentinel(self):
+        # Остановка не должна падать на полной очереди — ждем, пока писатель освободит место
+        self.queue.put(self._sentinel)
+
+
+class JsonFormatter(logging.Formatter):
+    """Одна запись — одна строка JSON; extra-поля (trace, sql, ...) и контекст обновления включаются"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        for key, value in vars(record).items():
+            if key not in _RECORD_FIELDS and key not in entry:
+                entry[key] = value
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            entry["exc"] = record.exc_text
+        if record.stack_info:
+            entry["stack"] = record.stack_info
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+_exception_formatter = logging.Formatter()
+_listener: Optional[BackgroundListener] = None
+_queue_handler: Optional[ContextQueueHandler] = None
+
+
+def _parse_rates(value: str) -> Dict[str, int]:
+    if not value:
+        return {}
+    try:
+        return {str(k): int(v) for k, v in json.loads(value).items()}
+    except (json.JSONDecodeError, AttributeError, ValueError, TypeError):
+        logging.getLogger(__name__).error(f"Invalid LOG_SAMPLE_RATES mapping: {value}")
+        return {}
+
+
+def setup_logging(log_dir: str = "logs", handlers: List[logging.Handler] = None) -> logging.Logger:
+    """
+    Корневой логгер пишет в очередь; файл с ротацией и консоль обслуживает
+    QueueListener в отдельном потоке. Повторный вызов перенастраивает логирование.
+    """
+    global _listener, _queue_handler
+    load_dotenv()
+    stop_logging()
+
+    fmt = os.getenv("LOG_FORMAT", "text").lower()
+    formatter = JsonFormatter() if fmt == "json" else logging.Formatter(TEXT_FORMAT)
+
+    if handlers is None:
+        os.makedirs(log_dir, exist_ok=True)
+        file_handler = RotatingFileHandler(
+            os.path.join(log_dir, os.getenv("LOG_FILE", "bot.log")),
+            maxBytes=10 * 1024 * 1024,
+            backupCount=5,
+            encoding='utf-8'
+        )
+        handlers = [file_handler, logging.StreamHandler()]
+    for handler in handlers:
+        handler.setFormatter(formatter)
+
+    log_queue = queue.Queue(int(os.getenv("LOG_QUEUE_SIZE", "10000")))
+    _queue_handler = ContextQueueHandler(log_queue)
+    _queue_handler.addFilter(SamplingFilter(_parse_rates(os.getenv("LOG_SAMPLE_RATES", ""))))
+    _listener = BackgroundListener(log_queue, *handlers, respect_handler_level=True)
+    _listener.start()
+
+    logger = logging.getLogger()
+    logger.setLevel(os.getenv("LOG_LEVEL", "INFO").upper())
+    logger.addHandler(_queue_handler)
+    logging.getLogger('httpx').setLevel(logging.WARNING)
+    return logger
+
+
+def stop_logging():
+    """Дописывает накопленные записи и останавливает фоновый поток"""
+    global _listener, _queue_handler
+    if _queue_handler is not None:
+        logging.getLogger().removeHandler(_queue_handler)
+    if _listener is not None:
+        _listener.stop()
+        for handler in _listener.handlers:
+            handler.close()
+    _listener = None
+    _queue_handler = None
+
+
+def stats() -> dict:
+    if _queue_handler is None:
+        return {"queued": 0, "dropped": 0}
+    return {"queued": _queue_handler.queue.qsize(), "dropped": _queue_handler.dropped}
+
+
+atexit.register(stop_logging)
@@ -1,7 +1,6 @@
 import sys
 import os
 import logging
-from logging.handlers import RotatingFileHandler
 
 # Monkey patch для Python 3.13
 if sys.version_info >= (3, 13):
@@ -14,29 +13,8 @@ if sys.version_info >= (3, 13):
         if s != '__weakref__'
     ) + ('_polling_cleanup_cb',)
 
-# Инициализация логгера в самом начале
-def setup_logging():
-    log_format = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
-    os.makedirs("logs", exist_ok=True)
-    
-    logger = logging.getLogger()
-    logger.setLevel(logging.INFO)
-    
-    file_handler = RotatingFileHandler(
-        os.path.join("logs", "bot.log"),
-        maxBytes=10 * 1024 * 1024,
-        backupCount=5,
-        encoding='utf-8'
-    )
-    file_handler.setFormatter(logging.Formatter(log_format))
-    console_handler = logging.StreamHandler()
-    console_handler.setFormatter(logging.Formatter(log_format))
-    
-    logger.addHandler(file_handler)
-    logger.addHandler(console_handler)
-    logging.getLogger('httpx').setLevel(logging.WARNING)
-    
-    return logger
+# Инициализация логгера в самом начале: запись в файл и консоль — в фоновом потоке
+from core.logging_setup import setup_logging
 
 # Инициализируем логгер сразу
 root_logger = setup_logging()
@@ -69,9 +47,10 @@ else:
 # Теперь можно логировать
 logger.info("Logger initialized successfully")
 
+from telegram import Update
 from telegram.ext import (
     ApplicationBuilder, CommandHandler, MessageHandler, 
-    CallbackQueryHandler, ConversationHandler, filters
+    CallbackQueryHandler, ConversationHandler, TypeHandler, filters
 )
 from core.config import config, states
 from handlers.base import start, help_command, system_status, cancel, back_handler
@@ -79,6 +58,121 @@ import handlers.order_handlers as order_handlers
 import handlers.support_handlers as support_handlers
 import handlers.performer_handlers as performer_handlers
 import handlers.admin_handlers as admin_handlers
+from services.outbound import outbound, OutboundRateLimiter
+
+from services.broadcast import resume_broadcasts
+from services.media import media_pipeline
+from services.email_transport import email_transport
+from services.twilio_transport import twilio_transport
+from services.notifications import notifier
+from services import calendar_sync, reminders
+from core import metrics
+
+async def post_init(application):
+    outbound.start()
+    calendar_sync.worker.start()
+    notifier.start(application.bot)
+    reminders.backfill()
+    reminders.scheduler.start()
+    metrics.start_http_server(config.METRICS_HOST, config.METRICS_PORT)
+    resume_broadcasts(application)
+
+async def post_shutdown(application):
+    await reminders.scheduler.stop()
+    await notifier.digest.flush_all()
+    await outbound.stop()
+    await calendar_sync.worker.stop()
+    await notifier.stop()
+    await email_transport.stop()
+    await twilio_transport.close()
+    media_pipeline.shutdown()
+    metrics.stop_http_server()
+
+def register_handlers(application):
+    """Обработчики бота; те же регистрирует bench_conversations.py"""
+    # Базовые обработчики
+    application.add_handler(CommandHandler("start", start))
+    application.add_handler(CommandHandler("help", help_command))
+    application.add_handler(CommandHandler("status", system_status))
+    application.add_handler(CommandHandler("cancel", cancel))
+    
+    # Обработчики заказов
+    order_conv_handler = ConversationHandler(
+        entry_points=[
+            CommandHandler("order", order_handlers.order_command),
+            CallbackQueryHandler(order_handlers.new_order_handler, pattern="^new_order$")
+        ],
+        states={
+            states.ASK_DATE: [CallbackQueryHandler(order_handlers.calendar_handler)],
+            states.ASK_TIME: [CallbackQueryHandler(order_handlers.time_handler)],
+            states.ASK_LOCATION: [MessageHandler(filters.TEXT & ~filters.COMMAND, order_handlers.location_handler)],
+            states.ASK_PERFORMERS: [CallbackQueryHandler(order_handlers.performer_handler)],
+            states.ASK_PROGRAM: [CallbackQueryHandler(order_handlers.program_handler)],
+            states.ASK_PROGRAM_SUB: [CallbackQueryHandler(order_handlers.subprogram_handler)],
+            states.ASK_AMOUNT: [MessageHandler(filters.TEXT & ~filters.COMMAND, order_handlers.amount_handler)],
+            states.ASK_DETAILS: [MessageHandler(filters.TEXT & ~filters.COMMAND, order_handlers.details_handler)],
+            states.REVIEW_ORDER: [
+                CallbackQueryHandler(order_handlers.confirm_order, pattern="^confirm_order$"),
+                #CallbackQueryHandler(back_handler, pattern="^edit_order$"),
+                CallbackQueryHandler(cancel, pattern="^cancel_order$")
+            ],
+            states.PERFORMER_FEEDBACK: [CallbackQueryHandler(performer_handlers.handle_reschedule_time)],
+            ConversationHandler.TIMEOUT: [TypeHandler(Update, order_handlers.order_timeout)]
+        },
+        fallbacks=[CommandHandler("cancel", cancel)],
+        # Без per_message: в диалоге есть текстовые шаги, а календарь отправляется новым сообщением
+        per_user=True,
+        conversation_timeout=300
+    )
+    application.add_handler(order_conv_handler)
+    
+    # Заказ одной отправкой формы (Web App) — работает параллельно с диалогом
+    application.add_handler(CommandHandler("quickorder", order_handlers.web_app_order_command))
+    application.add_handler(MessageHandler(
+        filters.StatusUpdate.WEB_APP_DATA,
+        order_handlers.web_app_order_handler
+    ))
+    
+    # Обработчики поддержки
+    support_conv_handler = ConversationHandler(
+        entry_points=[
+            CommandHandler("support", support_handlers.start_support),
+            CallbackQueryHandler(support_handlers.start_support, pattern="^support$")
+        ],
+        states={
+            states.SUPPORT_REQUEST: [MessageHandler(filters.TEXT & ~filters.COMMAND, support_handlers.handle_support_request)],
+            states.SUPPORT_CONFIRM: [
+                CallbackQueryHandler(support_handlers.handle_support_confirm, pattern="^support_attach_"),
+                MessageHandler(filters.PHOTO, support_handlers.handle_support_confirm)
+            ]
+        },
+        fallbacks=[CommandHandler("cancel", cancel)],
+        per_user=True
+    )
+    application.add_handler(support_conv_handler)
+    
+    # Обработчики исполнителей
+    application.add_handler(CallbackQueryHandler(
+        performer_handlers.handle_performer_response, 
+        pattern=r"^(confirm|reject|reschedule)_\d+$"
+    ))
+    application.add_handler(CallbackQueryHandler(
+        performer_handlers.handle_replacement_offer,
+        pattern=r"^offer_(accept|decline)_\d+$"
+    ))
+
+    # Администрирование
+    application.add_handler(CallbackQueryHandler(
+        admin_handlers.admin_panel_handler, 
+        pattern="^admin_panel$"
+    ))
+    application.add_handler(CommandHandler("backup", admin_handlers.backup_database))
+    application.add_handler(CommandHandler("broadcast", admin_handlers.broadcast_command))
+    application.add_handler(CommandHandler("replay", admin_handlers.replay_command))
+    application.add_handler(CommandHandler("sqltop", admin_handlers.sqltop_command))
+    
+    # Счетчики и время обработки для всех обработчиков
+    metrics.instrument_application(application)
 
 def main():
     logger.info("Starting bot...")
@@ -96,79 +190,40 @@ def main():
     
     try:
         os.makedirs(config.BACKUP_DIR, exist_ok=True)
-        application = ApplicationBuilder().token(config.BOT_TOKEN).build()
-        
-        # Базовые обработчики
-        application.add_handler(CommandHandler("start", start))
-        application.add_handler(CommandHandler("help", help_command))
-        application.add_handler(CommandHandler("status", system_status))
-        application.add_handler(CommandHandler("cancel", cancel))
-        
-        # Обработчики заказов
-        order_conv_handler = ConversationHandler(
-            entry_points=[
-                CommandHandler("order", order_handlers.order_command),
-                CallbackQueryHandler(order_handlers.new_order_handler, pattern="^new_order$")
-            ],
-            states={
-                states.ASK_DATE: [CallbackQueryHandler(order_handlers.calendar_handler)],
-                states.ASK_TIME: [CallbackQueryHandler(order_handlers.time_handler)],
-                states.ASK_LOCATION: [MessageHandler(filters.TEXT & ~filters.COMMAND, order_handlers.location_handler)],
-                states.ASK_PERFORMERS: [CallbackQueryHandler(order_handlers.performer_handler)],
-                states.ASK_PROGRAM: [CallbackQueryHandler(order_handlers.program_handler)],
-                states.ASK_PROGRAM_SUB: [CallbackQueryHandler(order_handlers.subprogram_handler)],
-                states.ASK_AMOUNT: [MessageHandler(filters.TEXT & ~filters.COMMAND, order_handlers.amount_handler)],
-                states.ASK_DETAILS: [MessageHandler(filters.TEXT & ~filters.COMMAND, order_handlers.details_handler)],
-                states.REVIEW_ORDER: [
-                    CallbackQueryHandler(order_handlers.confirm_order, pattern="^confirm_order$"),
-                    #CallbackQueryHandler(back_handler, pattern="^edit_order$"),
-                    CallbackQueryHandler(cancel, pattern="^cancel_order$")
-                ],
-                states.PERFORMER_FEEDBACK: [CallbackQueryHandler(performer_handlers.handle_reschedule_time)]
-            },
-            fallbacks=[CommandHandler("cancel", cancel)],
-            per_message=True,
-            per_user=True,
-            conversation_timeout=300
-        )
-        application.add_handler(order_conv_handler)
-        
-        # Обработчики поддержки
-        support_conv_handler = ConversationHandler(
-            entry_points=[
-                CommandHandler("support", support_handlers.start_support),
-                CallbackQueryHandler(support_handlers.start_support, pattern="^support$")
-            ],
-            states={
-                states.SUPPORT_REQUEST: [MessageHandler(filters.TEXT & ~filters.COMMAND, support_handlers.handle_support_request)],
-                states.SUPPORT_CONFIRM: [
-                    CallbackQueryHandler(support_handlers.handle_support_confirm, pattern="^support_attach_"),
-                    MessageHandler(filters.PHOTO, support_handlers.handle_support_confirm)
-                ]
-            },
-            fallbacks=[CommandHandler("cancel", cancel)],
-            per_user=True
+        application = (
+            ApplicationBuilder()
+            .token(config.BOT_TOKEN)
+            .rate_limiter(OutboundRateLimiter(outbound))
+            .post_init(post_init)
+            .post_shutdown(post_shutdown)
+            .build()
         )
-        application.add_handler(support_conv_handler)
         
-        # Обработчики исполнителей
-        application.add_handler(CallbackQueryHandler(
-            performer_handlers.handle_performer_response, 
-            pattern=r"^(confirm|reject|reschedule)_\d+$"
-        ))
-
-        # Администрирование
-        application.add_handler(CallbackQueryHandler(
-            admin_handlers.admin_panel_handler, 
-            pattern="^admin_panel$"
-        ))
-        application.add_handler(CommandHandler("backup", admin_handlers.backup_database))
+        register_handlers(application)
         
         # Планировщик задач
         job_queue = application.job_queue
         if job_queue:
             job_queue.run_repeating(admin_handlers.backup_database, interval=86400, first=10)
+            job_queue.run_repeating(admin_handlers.cleanup_attachments, interval=86400, first=600)
             job_queue.run_repeating(config.refresh_data, interval=3600, first=0)
+            job_queue.run_repeating(order_handlers.release_expired_holds, interval=60, first=60)
+            job_queue.run_repeating(performer_handlers.expire_replacement_offers, interval=60, first=60)
+            job_queue.run_repeating(
+                calendar_sync.reconcile_calendars,
+                interval=config.CALENDAR_RECONCILE_INTERVAL,
+                first=120
+            )
+            job_queue.run_repeating(
+                calendar_sync.refresh_calendar_tokens,
+                interval=config.CALENDAR_TOKEN_REFRESH_INTERVAL,
+                first=60
+            )
+            job_queue.run_repeating(
+                calendar_sync.refresh_busy_windows,
+                interval=config.FREEBUSY_REFRESH_INTERVAL,
+                first=30
+            )
         
         logger.info("🚀 Бот успешно запущен")
         application.run_polling()
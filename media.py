@@ -0,0 +1,175 @@
+import asyncio
+import logging
+import os
+import shutil
+import tempfile
+import threading
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Optional, Tuple
+from core.config import config
+from services.attachment_store import attachment_store
+
+logger = logging.getLogger(__name__)
+
+MAX_WIDTH, MAX_HEIGHT = 1920, 1080
+JPEG_QUALITY = 85
+
+
+def compress_image(src_path: str) -> str:
+    """
+    Уменьшает и пережимает изображение в JPEG (выполняется в отдельном процессе).
+    Возвращает путь к результату: новый файл или исходный, если сжатие не помогло.
+    """
+    try:
+        from PIL import Image
+    except ImportError:
+        return src_path
+
+    original_size = os.path.getsize(src_path)
+    with Image.open(src_path) as img:
+        if img.width > MAX_WIDTH or img.height > MAX_HEIGHT:
+            img.thumbnail((MAX_WIDTH, MAX_HEIGHT), Image.LANCZOS)
+        if img.format != 'JPEG' or img.mode != 'RGB':
+            img = img.convert('RGB')
+        dst_path = f"{src_path}.min.jpg"
+        img.save(dst_path, format='JPEG', quality=JPEG_QUALITY, optimize=True)
+
+    if os.path.getsize(dst_path) < original_size:
+        return dst_path
+    os.remove(dst_path)
+    return src_path
+
+
+class MediaPipeline:
+    """Обработка вложений вне event loop: загрузка в файл, сжатие в пуле процессов,
+    выгрузка в S3 или на диск в пуле потоков с ограничением параллелизма"""
+
+    def __init__(self, max_concurrency: int = None, compress_workers: int = None, upload_workers: int = None):
+        self.max_concurrency = max_concurrency or config.MEDIA_MAX_CONCURRENCY
+        self.compress_workers = compress_workers or config.MEDIA_COMPRESS_WORKERS
+        self.upload_workers = upload_workers or config.MEDIA_UPLOAD_WORKERS
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self._process_pool: Optional[ProcessPoolExecutor] = None
+        self._thread_pool: Optional[ThreadPoolExecutor] = None
+        self._s3_client = None
+        self._s3_lock = threading.Lock()
+
+    @property
+    def semaphore(self) -> asyncio.Semaphore:
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        return self._semaphore
+
+    @property
+    def process_pool(self) -> ProcessPoolExecutor:
+        if self._process_pool is None:
+            self._process_pool = ProcessPoolExecutor(max_workers=self.compress_workers)
+        return self._process_pool
+
+    @property
+    def thread_pool(self) -> ThreadPoolExecutor:
+        if self._thread_pool is None:
+            self._thread_pool = ThreadPoolExecutor(
+                max_workers=self.upload_workers,
+                thread_name_prefix="media-upload"
+            )
+        return self._thread_pool
+
+    def _get_s3_client(self):
+        """Один клиент S3 на процесс: клиенты boto3 потокобезопасны и держат пул соединений"""
+        if self._s3_client is None:
+            with self._s3_lock:
+                if self._s3_client is None:
+                    import boto3
+                    from botocore.config import Config as BotoConfig
+                    self._s3_client = boto3.client(
+                        's3',
+                        region_name=config.S3_REGION,
+                        aws_access_key_id=config.AWS_ACCESS_KEY,
+                        aws_secret_access_key=config.AWS_SECRET_KEY,
+                        config=BotoConfig(max_pool_connections=self.upload_workers)
+                    )
+        return self._s3_client
+
+    def _upload_s3(self, path: str, key: str) -> str:
+        self._get_s3_client().upload_file(
+            path,
+            config.S3_BUCKET,
+            key,
+            ExtraArgs={'ContentType': 'image/jpeg', 'ACL': 'private'}
+        )
+        return key
+
+    def _delete_s3(self, key: str):
+        self._get_s3_client().delete_object(Bucket=config.S3_BUCKET, Key=key)
+
+    async def compress(self, path: str) -> str:
+        loop = asyncio.get_running_loop()
+        try:
+            return await loop.run_in_executor(self.process_pool, compress_image, path)
+        except Exception as e:
+            logger.warning(f"Image compression failed: {e}")
+            return path
+
+    async def store(self, path: str) -> Optional[Tuple[str, str]]:
+        """
+        Помещает файл в хранилище вложений (S3, если настроен, иначе локально).
+        Возвращает (sha256, путь/ключ); дубликаты не загружаются повторно.
+        """
+        loop = asyncio.get_running_loop()
+        if config.S3_ENABLED:
+            try:
+                sha256, key = await loop.run_in_executor(
+                    self.thread_pool, attachment_store.acquire, path, self._upload_s3
+                )
+                logger.info(f"Stored in S3: s3://{config.S3_BUCKET}/{key}")
+                return sha256, key
+            except Exception as e:
+                logger.error(f"S3 upload failed: {e}")
+        try:
+            sha256, file_path = await loop.run_in_executor(self.thread_pool, attachment_store.acquire, path)
+            logger.info(f"Saved locally: {file_path}")
+            return sha256, file_path
+        except Exception as e:
+            logger.error(f"Local file save failed: {e}")
+        return None
+
+    async def collect_garbage(self, max_age_days: int = 30) -> int:
+        """Отвязывает вложения старых тикетов и удаляет файлы без ссылок"""
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(self.thread_pool, attachment_store.release_tickets_older_than, max_age_days)
+        delete_remote = self._delete_s3 if config.S3_ENABLED else None
+        legacy = await loop.run_in_executor(
+            self.thread_pool,
+            lambda: attachment_store.sweep_legacy(max_age_days, delete_remote=delete_remote)
+        )
+        return legacy + await loop.run_in_executor(
+            self.thread_pool,
+            lambda: attachment_store.collect_garbage(delete_remote=delete_remote)
+        )
+
+    async def process_telegram_file(self, file) -> Optional[Tuple[str, str]]:
+        """Скачивает файл Telegram во временный файл, сжимает и сохраняет"""
+        async with self.semaphore:
+            tmp_dir = tempfile.mkdtemp(prefix="media-")
+            try:
+                src_path = os.path.join(tmp_dir, "original")
+                await file.download_to_drive(custom_path=src_path)
+                result_path = await self.compress(src_path)
+                original_size = os.path.getsize(src_path)
+                if result_path != src_path:
+                    logger.info(f"Compressed image: {original_size} -> {os.path.getsize(result_path)} bytes")
+                return await self.store(result_path)
+            finally:
+                shutil.rmtree(tmp_dir, ignore_errors=True)
+
+    def shutdown(self):
+        if self._process_pool:
+            self._process_pool.shutdown(wait=False, cancel_futures=True)
+            self._process_pool = None
+        if self._thread_pool:
+            self._thread_pool.shutdown(wait=True)
+            self._thread_pool = None
+
+
+media_pipeline = MediaPipeline()
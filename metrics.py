@@ -0,0 +1,476 @@
+import functools
+import logging
+import os
+import threading
+import time
+from bisect import bisect_left
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+import psutil
+from cachetools import TTLCache
+from sqlalchemy import event
+from .config import states
+from . import logging_setup, profiling, tracing
+from .tracing import tracer
+
+logger = logging.getLogger(__name__)
+
+# Границы бакетов гистограмм задержек (секунды)
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+DB_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1.0)
+
+Labels = Tuple[Tuple[str, str], ...]
+
+
+def _labels(labels: dict) -> Labels:
+    return tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(labels: Labels, extra: Tuple[Tuple[str, str], ...] = ()) -> str:
+    items = labels + extra
+    if not items:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in items) + "}"
+
+
+def _format_value(value: float) -> str:
+    return repr(float(value)) if value != int(value) else str(int(value))
+
+
+class Counter:
+    def __init__(self, name: str, documentation: str):
+        self.name = name
+        self.documentation = documentation
+        self._values: Dict[Labels, float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, value: float = 1, **labels):
+        key = _labels(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + value
+
+    def value(self, **labels) -> float:
+        return self._values.get(_labels(labels), 0)
+
+    def items(self) -> List[Tuple[Labels, float]]:
+        with self._lock:
+            return list(self._values.items())
+
+    def render(self) -> Iterable[str]:
+        yield f"# HELP {self.name} {self.documentation}"
+        yield f"# TYPE {self.name} counter"
+        for labels, value in self.items():
+            yield f"{self.name}{_format_labels(labels)} {_format_value(value)}"
+
+
+class Histogram:
+    def __init__(self, name: str, documentation: str, buckets: Tuple[float, ...] = LATENCY_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.buckets = tuple(sorted(buckets))
+        # По меткам: [счетчики бакетов (последний — +Inf), сумма, количество]
+        self._values: Dict[Labels, list] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels):
+        key = _labels(labels)
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            state[0][index] += 1
+            state[1] += value
+            state[2] += 1
+
+    def time(self, **labels):
+        return _Timer(self, labels)
+
+    def items(self) -> List[Tuple[Labels, list, float, int]]:
+        with self._lock:
+            return [(labels, list(counts), total, count) for labels, (counts, total, count) in self._values.items()]
+
+    def quantile(self, q: float, **labels) -> Optional[float]:
+        """Оценка квантиля по бакетам (верхняя граница бакета, как histogram_quantile без интерполяции)"""
+        state = self._values.get(_labels(labels))
+        if not state or not state[2]:
+            return None
+        rank = q * state[2]
+        seen = 0
+        for bound, bucket_count in zip(self.buckets + (float("inf"),), state[0]):
+            seen += bucket_count
+            if seen >= rank:
+                return bound
+        return float("inf")
+
+    def render(self) -> Iterable[str]:
+        yield f"# HELP {self.name} {self.documentation}"
+        yield f"# TYPE {self.name} histogram"
+        for labels, counts, total, count in self.items():
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += bucket_count
+                le = "+Inf" if bound == float("inf") else repr(bound)
+                yield f"{self.name}_bucket{_format_labels(labels, (('le', le),))} {cumulative}"
+            yield f"{self.name}_sum{_format_labels(labels)} {_format_value(total)}"
+            yield f"{self.name}_count{_format_labels(labels)} {count}"
+
+
+class _Timer:
+    __slots__ = ("histogram", "labels", "started")
+
+    def __init__(self, histogram: Histogram, labels: dict):
+        self.histogram = histogram
+        self.labels = labels
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.histogram.observe(time.perf_counter() - self.started, **self.labels)
+
+
+class Gauge:
+    """Значение вычисляется при сборе: callback возвращает число или {метки: число}"""
+
+    def __init__(self, name: str, documentation: str, callback: Callable, kind: str = "gauge"):
+        self.name = name
+        self.documentation = documentation
+        self.callback = callback
+        self.kind = kind
+
+    def render(self) -> Iterable[str]:
+        try:
+            value = self.callback()
+        except Exception as e:
+            logger.warning(f"Metric {self.name} collection failed: {e}")
+            return
+        yield f"# HELP {self.name} {self.documentation}"
+        yield f"# TYPE {self.name} {self.kind}"
+        if isinstance(value, dict):
+            for labels, item in value.items():
+                yield f"{self.name}{_format_labels(_labels(dict(labels)))} {_format_value(item)}"
+        else:
+            yield f"{self.name} {_format_value(value)}"
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self._metrics: Dict[str, object] = {}
+        self._lock = threading.Lock()
+
+    def _register(self, metric):
+        with self._lock:
+            return self._metrics.setdefault(metric.name, metric)
+
+    def counter(self, name: str, documentation: str) -> Counter:
+        return self._register(Counter(name, documentation))
+
+    def histogram(self, name: str, documentation: str, buckets: Tuple[float, ...] = LATENCY_BUCKETS) -> Histogram:
+        return self._register(Histogram(name, documentation, buckets))
+
+    def gauge(self, name: str, documentation: str, callback: Callable, kind: str = "gauge") -> Gauge:
+        with self._lock:
+            # Колбэк можно перерегистрировать (например, кэши новой Database)
+            self._metrics[name] = Gauge(name, documentation, callback, kind)
+            return self._metrics[name]
+
+    def render(self) -> str:
+        """Текстовый формат экспозиции Prometheus 0.0.4"""
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+registry = MetricsRegistry()
+started_at = time.time()
+
+handler_updates = registry.counter("bot_handler_updates_total", "Updates processed per handler and outcome")
+handler_latency = registry.histogram("bot_handler_duration_seconds", "Handler callback latency")
+db_queries = registry.histogram("bot_db_query_duration_seconds", "SQL statement execution time", DB_BUCKETS)
+outbound_calls = registry.counter("bot_outbound_requests_total", "Bot API calls made by the outbound scheduler")
+
+
+class MeteredTTLCache(TTLCache):
+    """TTLCache со счетчиками попаданий и промахов проверки `key in cache`"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.hits = 0
+        self.misses = 0
+
+    def __contains__(self, key) -> bool:
+        found = super().__contains__(key)
+        if found:
+            self.hits += 1
+        else:
+            self.misses += 1
+        return found
+
+    @property
+    def hit_ratio(self) -> Optional[float]:
+        total = self.hits + self.misses
+        return self.hits / total if total else None
+
+
+_caches: Dict[str, MeteredTTLCache] = {}
+
+
+def register_caches(caches: Dict[str, MeteredTTLCache]):
+    _caches.clear()
+    _caches.update(caches)
+    registry.gauge(
+        "bot_cache_hits_total", "Cache lookups that found the key",
+        lambda: {(("cache", name),): cache.hits for name, cache in _caches.items()}, kind="counter"
+    )
+    registry.gauge(
+        "bot_cache_misses_total", "Cache lookups that missed",
+        lambda: {(("cache", name),): cache.misses for name, cache in _caches.items()}, kind="counter"
+    )
+    registry.gauge(
+        "bot_cache_hit_ratio", "Cache hit ratio since start",
+        lambda: {(("cache", name),): cache.hit_ratio or 0 for name, cache in _caches.items()}
+    )
+    registry.gauge(
+        "bot_cache_entries", "Entries currently in cache",
+        lambda: {(("cache", name),): len(cache) for name, cache in _caches.items()}
+    )
+
+
+def instrument_engine(engine, profiler: "profiling.QueryProfiler" = profiling.profiler):
+    """
+    Время выполнения SQL по типу оператора (SELECT/INSERT/UPDATE/...);
+    то же измерение уходит в профилировщик запросов.
+    """
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def _before(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("metrics_started", []).append(time.perf_counter())
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def _after(conn, cursor, statement, parameters, context, executemany):
+        elapsed = time.perf_counter() - conn.info["metrics_started"].pop()
+        operation = statement.lstrip().split(None, 1)[0].upper() if statement.strip() else "OTHER"
+        db_queries.observe(elapsed, operation=operation)
+        tracing.add(tracing.DB, elapsed)
+        profiler.record(statement, parameters, elapsed, cursor, executemany)
+
+
+def _handler_name(callback) -> str:
+    module = getattr(callback, "__module__", "") or ""
+    return f"{module.rsplit('.', 1)[-1]}.{getattr(callback, '__qualname__', repr(callback))}"
+
+
+# Имена состояний диалогов для меток: {3: "ASK_LOCATION", ...}
+STATE_NAMES = {value: name for name, value in vars(type(states)).items() if isinstance(value, int)}
+
+
+def _state_name(state) -> str:
+    return STATE_NAMES.get(state, str(state))
+
+
+def _wrap_callback(callback, tag: str = None):
+    name = _handler_name(callback)
+    tag = tag or name
+
+    @functools.wraps(callback)
+    async def wrapper(*args, **kwargs):
+        trace, token = tracer.start(tag, name, args[0] if args else None)
+        started = time.perf_counter()
+        outcome = "ok"
+        error = None
+        try:
+            return await callback(*args, **kwargs)
+        except Exception as e:
+            outcome = "error"
+            error = e
+            raise
+        finally:
+            handler_latency.observe(time.perf_counter() - started, handler=name)
+            handler_updates.inc(handler=name, outcome=outcome)
+            tracer.finish(trace, token, error)
+
+    wrapper.metrics_wrapped = True
+    return wrapper
+
+
+def _conversation_name(conversation) -> str:
+    if conversation.name:
+        return conversation.name
+    for handler in conversation.entry_points:
+        commands = getattr(handler, "commands", None)
+        if commands:
+            return sorted(commands)[0]
+    return "conversation"
+
+
+def _instrument_handler(handler, tag: str = None):
+    # ConversationHandler: метка — «диалог:состояние» для точек входа, состояний и fallbacks
+    if hasattr(handler, "entry_points"):
+        conversation = _conversation_name(handler)
+        groups = [("entry", handler.entry_points)]
+        groups += [(_state_name(state), handlers) for state, handlers in handler.states.items()]
+        groups.append(("fallback", handler.fallbacks))
+        for state, handlers in groups:
+            for inner in handlers:
+                _instrument_handler(inner, f"{conversation}:{state}")
+        return
+    callback = getattr(handler, "callback", None)
+    if callback is not None and not getattr(callback, "metrics_wrapped", False):
+        handler.callback = _wrap_callback(callback, tag)
+
+
+def instrument_application(application):
+    """
+    Оборачивает колбэки всех зарегистрированных обработчиков: счетчик, гистограмма
+    и трасса обновления с разбивкой времени на Bot API, базу и прочее.
+    """
+    for handlers in application.handlers.values():
+        for handler in handlers:
+            _instrument_handler(handler)
+
+
+registry.gauge(
+    "bot_state_latency_seconds", "Rolling update latency quantiles per conversation state",
+    lambda: {
+        (("state", state), ("quantile", q)): stats[f"p{int(float(q) * 100)}"]
+        for state, stats in tracer.percentiles().items()
+        for q in ("0.5", "0.95", "0.99")
+    }
+)
+
+
+registry.gauge("bot_log_queue_records", "Log records waiting for the background writer", lambda: logging_setup.stats()["queued"])
+registry.gauge("bot_log_dropped_total", "Log records dropped because the queue was full", lambda: logging_setup.stats()["dropped"], kind="counter")
+
+_process = psutil.Process(os.getpid())
+
+
+def process_stats(process: psutil.Process = _process) -> dict:
+    with process.oneshot():
+        cpu = process.cpu_times()
+        return {
+            "rss_bytes": process.memory_info().rss,
+            "cpu_seconds": cpu.user + cpu.system,
+            "cpu_percent": process.cpu_percent(None),
+            "threads": process.num_threads(),
+            "open_fds": process.num_fds() if hasattr(process, "num_fds") else 0,
+        }
+
+
+class ProcessCollector:
+    """
+    Метрики процесса из одного снимка за сбор. cpu_percent считается от
+    предыдущего вызова, поэтому у сборщика свой psutil.Process: /status
+    и отдельные метрики не сбрасывают базу друг другу.
+    """
+
+    name = "process"
+    METRICS = (
+        ("process_resident_memory_bytes", "Resident memory size in bytes", "rss_bytes", "gauge"),
+        ("process_cpu_seconds_total", "User and system CPU time", "cpu_seconds", "counter"),
+        ("process_cpu_percent", "CPU usage since previous scrape", "cpu_percent", "gauge"),
+        ("process_threads", "Number of OS threads", "threads", "gauge"),
+        ("process_open_fds", "Open file descriptors", "open_fds", "gauge"),
+    )
+
+    def __init__(self):
+        self.process = psutil.Process(os.getpid())
+        self.process.cpu_percent(None)
+
+    def render(self) -> Iterable[str]:
+        try:
+            stats = process_stats(self.process)
+        except Exception as e:
+            logger.warning(f"Process metrics collection failed: {e}")
+            return
+        for name, documentation, key, kind in self.METRICS:
+            yield f"# HELP {name} {documentation}"
+            yield f"# TYPE {name} {kind}"
+            yield f"{name} {_format_value(stats[key])}"
+
+
+registry._register(ProcessCollector())
+registry.gauge("process_start_time_seconds", "Start time since epoch", lambda: started_at)
+
+
+def _histogram_summary(histogram: Histogram, label: str) -> List[dict]:
+    rows = []
+    for labels, _, total, count in histogram.items():
+        name = dict(labels).get(label, "")
+        rows.append({
+            label: name,
+            "count": count,
+            "avg_ms": total / count * 1000 if count else 0,
+            "p95_ms": (histogram.quantile(0.95, **{label: name}) or 0) * 1000,
+        })
+    return sorted(rows, key=lambda row: row["count"], reverse=True)
+
+
+def snapshot() -> dict:
+    """Сводка тех же метрик для /status"""
+    uptime = time.time() - started_at
+    outbound: Dict[str, float] = {}
+    for labels, value in outbound_calls.items():
+        result = dict(labels)["result"]
+        outbound[result] = outbound.get(result, 0) + value
+    errors = sum(value for labels, value in handler_updates.items() if dict(labels)["outcome"] == "error")
+    return {
+        "uptime_seconds": uptime,
+        "process": process_stats(),
+        "updates": sum(value for _, value in handler_updates.items()),
+        "handler_errors": errors,
+        "handlers": _histogram_summary(handler_latency, "handler"),
+        "db": _histogram_summary(db_queries, "operation"),
+        "caches": {name: cache.hit_ratio for name, cache in _caches.items()},
+        "outbound": outbound,
+        "outbound_per_minute": outbound.get("ok", 0) / max(uptime / 60, 1),
+        "states": tracer.percentiles(),
+        "slow_updates": list(tracer.slow),
+    }
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        if self.path.split("?", 1)[0] not in ("/metrics", "/"):
+            self.send_error(404)
+            return
+        body = registry.render().encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+_server: Optional[ThreadingHTTPServer] = None
+
+
+def start_http_server(host: str, port: int) -> Optional[ThreadingHTTPServer]:
+    """HTTP-эндпоинт /metrics в фоновом потоке; port=0 — выключено"""
+    global _server
+    if not port or _server:
+        return _server
+    _server = ThreadingHTTPServer((host, port), _MetricsHandler)
+    threading.Thread(target=_server.serve_forever, name="metrics-http", daemon=True).start()
+    logger.info(f"Metrics endpoint listening on http://{host}:{port}/metrics")
+    return _server
+
+
+def stop_http_server():
+    global _server
+    if _server:
+        _server.shutdown()
+        _server.server_close()
+        _server = None
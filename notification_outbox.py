@@ -0,0 +1,39 @@
+from core.base import Base
+from sqlalchemy import Column, Integer, String, DateTime, Index
+import datetime
+
+class NotificationOutbox(Base):
+    __tablename__ = 'notification_outbox'
+    id = Column(Integer, primary_key=True)
+    user_id = Column(Integer, nullable=False, index=True)
+    message = Column(String, nullable=False)
+    created_at = Column(DateTime, default=datetime.datetime.utcnow)
+
+class NotificationDelivery(Base):
+    """Состояние доставки уведомления по одному каналу"""
+    __tablename__ = 'notification_deliveries'
+    __table_args__ = (Index('ix_notification_deliveries_due', 'status', 'next_attempt_at'),)
+    id = Column(Integer, primary_key=True)
+    notification_id = Column(Integer, nullable=False, index=True)
+    channel = Column(String, nullable=False)  # telegram / sms / whatsapp / email
+    status = Column(String, default='pending')  # pending / sent / dead
+    attempts = Column(Integer, default=0)
+    max_attempts = Column(Integer, nullable=False)
+    next_attempt_at = Column(DateTime, default=datetime.datetime.utcnow)
+    last_error = Column(String)
+    sent_at = Column(DateTime)
+    updated_at = Column(DateTime, default=datetime.datetime.utcnow)
+
+class NotificationDeadLetter(Base):
+    """Доставка, исчерпавшая попытки; администратор может отправить ее повторно"""
+    __tablename__ = 'notification_dead_letters'
+    id = Column(Integer, primary_key=True)
+    delivery_id = Column(Integer, nullable=False, index=True)
+    notification_id = Column(Integer, nullable=False)
+    user_id = Column(Integer, nullable=False)
+    channel = Column(String, nullable=False)
+    message = Column(String, nullable=False)
+    attempts = Column(Integer, default=0)
+    last_error = Column(String)
+    created_at = Column(DateTime, default=datetime.datetime.utcnow)
+    replayed_at = Column(DateTime)
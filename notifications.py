@@ -1,65 +1,124 @@
 import logging
 import asyncio
+from datetime import datetime, timedelta
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
 from email.mime.text import MIMEText
-from concurrent.futures import ThreadPoolExecutor
-from twilio.rest import Client
 from twilio.base.exceptions import TwilioRestException
 from core.config import config
 from telegram.constants import ParseMode
 from core.database import db
-from core.security import encrypt_data, decrypt_data  # Предполагается реализация
+from core.ratelimit import ChannelRateLimits
+from services.outbound import outbound, PRIORITY_NORMAL
+from services.email_transport import email_transport
+from services.twilio_transport import twilio_transport
+from models.notification_outbox import NotificationOutbox, NotificationDelivery, NotificationDeadLetter
 
 logger = logging.getLogger(__name__)
 
+# Предел длины сообщения Telegram
+MAX_MESSAGE_LENGTH = 4096
+DIGEST_SEPARATOR = "\n\n— — —\n\n"
+
+class DigestBuffer:
+    """
+    Копит некритичные события для получателя в течение window секунд и
+    отправляет их одним сообщением-сводкой. Срочные события идут сразу.
+    followup — корутина, выполняемая после отправки сводки (например, фото тикета).
+    """
+    
+    def __init__(self, window: float = None, max_items: int = None):
+        self.window = config.DIGEST_WINDOW if window is None else window
+        self.max_items = max_items or config.DIGEST_MAX_ITEMS
+        self.bot = None
+        self._items: Dict[Tuple[int, Optional[str]], List[Tuple[str, Optional[Callable[[], Awaitable]]]]] = {}
+        self._timers: Dict[Tuple[int, Optional[str]], asyncio.Task] = {}
+    
+    def pending(self, chat_id: int) -> int:
+        return sum(len(items) for (chat, _), items in self._items.items() if chat == chat_id)
+    
+    async def add(self, bot, chat_id: int, text: str, parse_mode: str = None, urgent: bool = False,
+                  followup: Callable[[], Awaitable] = None):
+        self.bot = bot
+        if urgent or self.window <= 0:
+            await self._send(chat_id, parse_mode, [(text, followup)])
+            return
+        key = (chat_id, parse_mode)
+        items = self._items.setdefault(key, [])
+        items.append((text, followup))
+        if len(items) >= self.max_items:
+            await self.flush(key)
+        elif key not in self._timers:
+            self._timers[key] = asyncio.create_task(self._flush_later(key))
+    
+    async def _flush_later(self, key):
+        await asyncio.sleep(self.window)
+        self._timers.pop(key, None)
+        await self.flush(key)
+    
+    async def flush(self, key):
+        timer = self._timers.pop(key, None)
+        if timer and timer is not asyncio.current_task():
+            timer.cancel()
+        items = self._items.pop(key, None)
+        if items:
+            await self._send(key[0], key[1], items)
+    
+    async def flush_all(self):
+        """Отправляет все накопленное (при остановке бота)"""
+        await asyncio.gather(*[self.flush(key) for key in list(self._items)])
+    
+    @staticmethod
+    def render(texts: List[str]) -> List[str]:
+        """Одно событие — как есть; несколько — сводка, разбитая по пределу длины сообщения"""
+        if len(texts) == 1:
+            return texts
+        chunks, chunk = [], []
+        for text in texts:
+            # Запас под заголовок сводки
+            if chunk and len(DIGEST_SEPARATOR.join(chunk + [text])) + 64 > MAX_MESSAGE_LENGTH:
+                chunks.append(chunk)
+                chunk = []
+            chunk.append(text)
+        chunks.append(chunk)
+        messages = []
+        for i, chunk in enumerate(chunks, 1):
+            part = f" ({i}/{len(chunks)})" if len(chunks) > 1 else ""
+            header = f"📬 Сводка{part}: событий — {len(chunk)}"
+            messages.append(DIGEST_SEPARATOR.join([header] + chunk))
+        return messages
+    
+    async def _send(self, chat_id: int, parse_mode: Optional[str], items):
+        try:
+            for message in self.render([text for text, _ in items]):
+                await outbound.send_message(self.bot, chat_id, message, parse_mode=parse_mode)
+        except Exception as e:
+            logger.error(f"Digest send to {chat_id} failed ({len(items)} events): {e}")
+            return
+        for _, followup in items:
+            if followup:
+                try:
+                    await followup()
+                except Exception as e:
+                    logger.error(f"Digest followup for {chat_id} failed: {e}")
+
 class NotificationManager:
     def __init__(self):
-        self.twilio_client = None
-        self.executor = ThreadPoolExecutor(max_workers=5)
-        self.rate_limit_cache = {}
-        
-        # Инициализация Twilio с задержкой
-        self._init_twilio()
-    
-    def _init_twilio(self):
-        """Асинхронная инициализация Twilio"""
-        if config.TWILIO_SID and config.TWILIO_TOKEN:
-            try:
-                # Дешифруем токен, если он зашифрован
-                decrypted_token = decrypt_data(config.TWILIO_TOKEN)
-                self.twilio_client = Client(config.TWILIO_SID, decrypted_token)
-                logger.info("Twilio client initialized")
-            except Exception as e:
-                logger.error(f"Error initializing Twilio: {e}")
+        self.rate_limits = ChannelRateLimits(config.NOTIFICATION_RATE_LIMITS, max_keys=config.RATE_LIMIT_MAX_KEYS)
+        self.digest = DigestBuffer()
+        self.bot = None
+        self._wakeup: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
     
     def _check_rate_limit(self, channel: str, recipient: str) -> bool:
-        """Проверка ограничения частоты отправки"""
-        key = f"{channel}:{recipient}"
-        current_time = asyncio.get_event_loop().time()
-        
-        # Получаем историю отправок
-        last_sent = self.rate_limit_cache.get(key, [])
-        
-        # Фильтруем старые записи (окно 1 час)
-        recent_sent = [t for t in last_sent if current_time - t < 3600]
-        
-        # Проверяем лимит (не более 5 сообщений в час)
-        if len(recent_sent) >= 5:
-            logger.warning(f"Rate limit exceeded for {key}")
-            return False
-        
-        # Обновляем кэш
-        recent_sent.append(current_time)
-        self.rate_limit_cache[key] = recent_sent
-        return True
-    
-    async def _run_in_thread(self, func, *args, **kwargs):
-        """Асинхронный запуск синхронных функций"""
-        loop = asyncio.get_running_loop()
-        return await loop.run_in_executor(self.executor, lambda: func(*args, **kwargs))
+        """Проверка ограничения частоты отправки (лимиты каналов — config.NOTIFICATION_RATE_LIMITS)"""
+        if self.rate_limits.acquire(channel, recipient):
+            return True
+        logger.warning(f"Rate limit exceeded for {channel}:{recipient}")
+        return False
     
     async def send_sms(self, phone: str, message: str):
         """Асинхронная отправка SMS через Twilio"""
-        if not self.twilio_client:
+        if not twilio_transport.configured:
             logger.warning("Twilio client not initialized")
             return False
         
@@ -67,8 +126,7 @@ class NotificationManager:
             return False
         
         try:
-            await self._run_in_thread(
-                self.twilio_client.messages.create,
+            await twilio_transport.send(
                 body=message,
                 from_=config.TWILIO_NUMBER,
                 to=phone
@@ -83,7 +141,7 @@ class NotificationManager:
     
     async def send_whatsapp(self, phone: str, message: str):
         """Асинхронная отправка WhatsApp через Twilio"""
-        if not self.twilio_client:
+        if not twilio_transport.configured:
             logger.warning("Twilio client not initialized")
             return False
         
@@ -91,8 +149,7 @@ class NotificationManager:
             return False
         
         try:
-            await self._run_in_thread(
-                self.twilio_client.messages.create,
+            await twilio_transport.send(
                 body=message,
                 from_=f"whatsapp:{config.TWILIO_NUMBER}",
                 to=f"whatsapp:{phone}"
@@ -115,40 +172,27 @@ class NotificationManager:
             return False
         
         try:
-            # Дешифруем SMTP пароль
-            from core.security import decrypt_data
-            smtp_password = decrypt_data(config.SMTP_PASSWORD)
-            
             msg = MIMEText(message, 'html')
             msg['Subject'] = subject
             msg['From'] = config.SMTP_FROM
             msg['To'] = email
             
-            # Асинхронная отправка через thread pool
-            await self._run_in_thread(
-                self._sync_send_email,
-                msg,
-                smtp_password
-            )
-            logger.info(f"Email sent to {email}")
-            return True
+            # Очередь с пулом авторизованных SMTP-сессий
+            if await email_transport.send(msg):
+                logger.info(f"Email sent to {email}")
+                return True
         except Exception as e:
             logger.error(f"Email sending error: {e}")
         return False
     
-    def _sync_send_email(self, msg, smtp_password):
-        """Синхронная отправка email (выполняется в thread pool)"""
-        with smtplib.SMTP(config.SMTP_SERVER, config.SMTP_PORT) as server:
-            server.starttls()
-            server.login(config.SMTP_USER, smtp_password)
-            server.send_message(msg)
-    
-    async def send_telegram(self, user_id: int, message: str, context):
-        """Отправка Telegram сообщения"""
+    async def send_telegram(self, user_id: int, message: str, bot, priority: int = PRIORITY_NORMAL):
+        """Отправка Telegram сообщения через общую очередь исходящих"""
         try:
-            await context.bot.send_message(
-                chat_id=user_id,
-                text=message,
+            await outbound.send_message(
+                bot,
+                user_id,
+                message,
+                priority=priority,
                 parse_mode=ParseMode.HTML
             )
             logger.info(f"Telegram message sent to {user_id}")
@@ -161,50 +205,185 @@ class NotificationManager:
         self,
         user_id: int,
         message: str,
-        context,
+        context=None,
         channels: list = ["telegram"],
-        max_retries: int = 2,
-        retry_delay: float = 1.0
-    ):
-        """Отправка уведомления с повторными попытками"""
-        # Убираем зависимость от модели User
-        for attempt in range(1, max_retries + 1):
-            success = True
-            
-            for channel in channels:
-                channel_success = False
-                
-                try:
-                    if channel == "telegram":
-                        channel_success = await self.send_telegram(user_id, message, context)
-                    elif channel == "sms":
-                        # Для SMS нужен номер телефона - упрощаем логику
-                        channel_success = await self.send_sms(str(user_id), message)
-                    elif channel == "whatsapp":
-                        channel_success = await self.send_whatsapp(str(user_id), message)
-                    elif channel == "email":
-                        # Для email нужен адрес - упрощаем
-                        channel_success = await self.send_email(
-                            f"{user_id}@example.com",  # В реальной системе нужно получать email
-                            "Уведомление от EventBot",
-                            message
-                        )
-                except Exception as e:
-                    logger.error(f"Channel {channel} error: {e}")
-                    channel_success = False
-                
-                success = success and channel_success
-            
-            if success:
-                return True
-            
-            # Экспоненциальная задержка перед повторной попыткой
-            delay = retry_delay * (2 ** (attempt - 1))
-            logger.warning(f"Retry {attempt}/{max_retries} in {delay}s")
-            await asyncio.sleep(delay)
+        max_attempts: int = None
+    ) -> int:
+        """
+        Записывает уведомление в outbox (по доставке на канал) и сразу возвращает
+        управление: отправку и повторы выполняет фоновый воркер. Возвращает id уведомления.
+        """
+        if context is not None and not self._task:
+            self.start(context.bot)
+        return self.send_notifications([(user_id, message)], channels, max_attempts)[0]
+    
+    def send_notifications(self, notifications: List[Tuple[int, str]], channels: list = ["telegram"],
+                           max_attempts: int = None) -> List[int]:
+        """Пакетная запись уведомлений [(user_id, message)] в outbox одной транзакцией"""
+        max_attempts = max_attempts or config.NOTIFICATION_MAX_ATTEMPTS
+        with db.session_scope() as session:
+            rows = [NotificationOutbox(user_id=user_id, message=message) for user_id, message in notifications]
+            session.add_all(rows)
+            session.flush()
+            session.add_all([
+                NotificationDelivery(notification_id=row.id, channel=channel, max_attempts=max_attempts)
+                for row in rows
+                for channel in dict.fromkeys(channels)
+            ])
+            ids = [row.id for row in rows]
+        self.wake()
+        return ids
+    
+    def start(self, bot):
+        if self._task:
+            return
+        self.bot = bot
+        self._wakeup = asyncio.Event()
+        self._task = asyncio.create_task(self._run(), name="notification-outbox")
+        logger.info("Notification outbox worker started")
+    
+    async def stop(self):
+        """Незавершенные доставки остаются в outbox и будут отправлены после перезапуска"""
+        if self._task:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+    
+    def wake(self):
+        if self._wakeup:
+            self._wakeup.set()
+    
+    async def _run(self):
+        while True:
+            try:
+                processed = await self.process_due()
+            except Exception as e:
+                logger.error(f"Notification outbox cycle failed: {e}", exc_info=True)
+                processed = 0
+            if processed:
+                continue
+            self._wakeup.clear()
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=config.NOTIFICATION_POLL_INTERVAL)
+            except asyncio.TimeoutError:
+                pass
+    
+    def _backoff(self, attempts: int) -> timedelta:
+        return timedelta(seconds=min(config.NOTIFICATION_RETRY_DELAY * 2 ** (attempts - 1), 3600))
+    
+    async def _deliver(self, channel: str, user_id: int, message: str) -> bool:
+        if channel == "telegram":
+            return await self.send_telegram(user_id, message, self.bot)
+        elif channel == "sms":
+            # Для SMS нужен номер телефона - упрощаем логику
+            return await self.send_sms(str(user_id), message)
+        elif channel == "whatsapp":
+            return await self.send_whatsapp(str(user_id), message)
+        elif channel == "email":
+            # Для email нужен адрес - упрощаем
+            return await self.send_email(
+                f"{user_id}@example.com",  # В реальной системе нужно получать email
+                "Уведомление от EventBot",
+                message
+            )
+        raise ValueError(f"Unknown channel {channel}")
+    
+    async def process_due(self) -> int:
+        """
+        Один цикл: берет созревшие доставки и отправляет их одновременно по всем
+        каналам; доставка дольше тайм-аута канала считается неудачной. Неудачные откладываются с экспоненциальной задержкой, исчерпавшие
+        попытки переносятся в notification_dead_letters. Возвращает число доставок.
+        """
+        with db.session_scope() as session:
+            rows = (
+                session.query(NotificationDelivery, NotificationOutbox)
+                .join(NotificationOutbox, NotificationOutbox.id == NotificationDelivery.notification_id)
+                .filter(
+                    NotificationDelivery.status == 'pending',
+                    NotificationDelivery.next_attempt_at <= datetime.utcnow()
+                )
+                .order_by(NotificationDelivery.next_attempt_at)
+                .limit(config.NOTIFICATION_BATCH_SIZE)
+                .all()
+            )
+            jobs = [(delivery.id, delivery.channel, note.user_id, note.message) for delivery, note in rows]
+        if not jobs:
+            return 0
         
-        logger.error(f"Failed to send notification after {max_retries} attempts")
-        return False
+        async def attempt(channel, user_id, message):
+            timeout = config.NOTIFICATION_CHANNEL_TIMEOUTS.get(channel, config.NOTIFICATION_TIMEOUT)
+            try:
+                delivered = await asyncio.wait_for(self._deliver(channel, user_id, message), timeout)
+                return None if delivered else "delivery failed"
+            except asyncio.TimeoutError:
+                logger.error(f"Channel {channel} timed out after {timeout:g}s")
+                return f"timed out after {timeout:g}s"
+            except Exception as e:
+                logger.error(f"Channel {channel} error: {e}")
+                return str(e) or type(e).__name__
+        
+        errors = await asyncio.gather(*[attempt(channel, user_id, message) for _, channel, user_id, message in jobs])
+        
+        now = datetime.utcnow()
+        with db.session_scope() as session:
+            for (delivery_id, channel, user_id, message), error in zip(jobs, errors):
+                delivery = session.get(NotificationDelivery, delivery_id)
+                delivery.attempts += 1
+                delivery.updated_at = now
+                if error is None:
+                    delivery.status = 'sent'
+                    delivery.sent_at = now
+                    continue
+                delivery.last_error = error
+                if delivery.attempts < delivery.max_attempts:
+                    delivery.next_attempt_at = now + self._backoff(delivery.attempts)
+                    logger.warning(f"Notification delivery {delivery_id} via {channel} failed, retry {delivery.attempts}/{delivery.max_attempts}")
+                    continue
+                delivery.status = 'dead'
+                session.add(NotificationDeadLetter(
+                    delivery_id=delivery_id,
+                    notification_id=delivery.notification_id,
+                    user_id=user_id,
+                    channel=channel,
+                    message=message,
+                    attempts=delivery.attempts,
+                    last_error=error
+                ))
+                logger.error(f"Notification delivery {delivery_id} via {channel} dead-lettered after {delivery.attempts} attempts")
+        return len(jobs)
+    
+    def dead_letters(self, limit: int = 10) -> List[dict]:
+        """Последние неотправленные повторно записи dead-letter"""
+        with db.session_scope() as session:
+            rows = (
+                session.query(NotificationDeadLetter)
+                .filter(NotificationDeadLetter.replayed_at.is_(None))
+                .order_by(NotificationDeadLetter.id.desc())
+                .limit(limit)
+                .all()
+            )
+            return [{c.name: getattr(row, c.name) for c in row.__table__.columns} for row in rows]
+    
+    def replay(self, dead_letter_id: int = None) -> int:
+        """Возвращает доставку (или все, если id не указан) из dead-letter в outbox с новым счетчиком попыток"""
+        now = datetime.utcnow()
+        with db.session_scope() as session:
+            query = session.query(NotificationDeadLetter).filter(NotificationDeadLetter.replayed_at.is_(None))
+            if dead_letter_id is not None:
+                query = query.filter(NotificationDeadLetter.id == dead_letter_id)
+            replayed = 0
+            for letter in query.all():
+                delivery = session.get(NotificationDelivery, letter.delivery_id)
+                if delivery:
+                    delivery.status = 'pending'
+                    delivery.attempts = 0
+                    delivery.next_attempt_at = now
+                    delivery.updated_at = now
+                letter.replayed_at = now
+                replayed += 1
+        if replayed:
+            self.wake()
+        return replayed
 
 # Инициализируем менеджер уведомлений
-notifier = NotificationManager()
\ No newline at end of file
+notifier = NotificationManager()
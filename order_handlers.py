@@ -1,17 +1,26 @@
 import re
+import json
 import logging
+import asyncio
 import datetime
-from telegram import Update, InlineKeyboardMarkup
-from telegram.ext import ContextTypes, CallbackQueryHandler, MessageHandler, filters
+from typing import List, Tuple
+from telegram import (
+    Update, InlineKeyboardMarkup, InlineKeyboardButton,
+    ReplyKeyboardMarkup, ReplyKeyboardRemove, KeyboardButton, WebAppInfo
+)
+from telegram.ext import ContextTypes, CallbackQueryHandler, MessageHandler, filters, ConversationHandler
 from core.config import config, states
-from core.database import db
+from core.database import db, SlotUnavailableError, ANY_PERFORMER
+from core.intervals import parse_slot
 from core.utils import (
     create_calendar, validate_date, validate_time, 
     validate_amount, create_time_selection_keyboard,
     create_inline_keyboard
 )
-from services import google_calendar
+from services import calendar_sync, reminders
 from services.notifications import notifier
+from services.outbound import outbound, PRIORITY_CONFIRMATION
+from services.assignment import save_order_with_assignment
 
 logger = logging.getLogger(__name__)
 
@@ -106,6 +115,13 @@ async def time_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
     
     return states.ASK_TIME
 
+def performer_choices(date: str, time: str):
+    """Исполнители для клавиатуры: занятые на это время (в том числе по личному календарю) скрыты"""
+    return [
+        performer for performer in config.PERFORMERS_LIST
+        if performer == ANY_PERFORMER or db.is_performer_available(performer, date, time)
+    ]
+
 async def location_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
     location = update.message.text.strip()
     if len(location) < 5:
@@ -116,7 +132,10 @@ async def location_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
     await update.message.reply_text(
         f"📍 Место: *{location}*\n\n👨‍🎤 Выберите исполнителя:",
         parse_mode="Markdown",
-        reply_markup=create_inline_keyboard(config.PERFORMERS_LIST, "performer", 2)
+        reply_markup=create_inline_keyboard(
+            performer_choices(context.user_data.get('order_date'), context.user_data.get('order_time')),
+            "performer", 2
+        )
     )
     return states.ASK_PERFORMERS
 
@@ -129,10 +148,16 @@ async def performer_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
     date = context.user_data.get('order_date', '')
     time = context.user_data.get('order_time', '')
     
-    if performer != "Любой свободный" and not db.is_performer_available(performer, date, time):
+    release_reservation(context)
+    if performer != "Любой свободный":
+        reservation_id = db.hold_slot(performer, date, time, update.effective_user.id)
+        if reservation_id:
+            context.user_data['reservation_id'] = reservation_id
+    
+    if performer != "Любой свободный" and not context.user_data.get('reservation_id'):
         await query.edit_message_text(
             "❌ Этот исполнитель занят в выбранное время. Пожалуйста, выберите другого.",
-            reply_markup=create_inline_keyboard(config.PERFORMERS_LIST, "performer", 2)
+            reply_markup=create_inline_keyboard(performer_choices(date, time), "performer", 2)
         )
         return states.ASK_PERFORMERS
     
@@ -253,24 +278,18 @@ async def confirm_order(update: Update, context: ContextTypes.DEFAULT_TYPE):
     })
     
     try:
-        order_id = db.save_order(order_data)
+        order_id, _ = save_order_with_assignment(
+            order_data,
+            reservation_id=context.user_data.pop('reservation_id', None)
+        )
         context.user_data['order_id'] = order_id
         
         await query.edit_message_text("✅ <b>Заказ успешно создан!</b>", parse_mode="HTML")
-        await notify_admin(context, order_data)
-        
-        if order_data['order_performers'] != "Любой свободный":
-            performer = db.get_performer(name=order_data['order_performers'])
-            if performer and performer.get('telegram_user_id'):
-                await request_performer_confirmation(
-                    context, 
-                    performer['telegram_user_id'], 
-                    order_id
-                )
-        
-        context.job_queue.run_once(
-            lambda ctx: google_calendar.sync_order_to_calendar(order_id),
-            when=0
+        await process_new_order(context, order_id, order_data)
+    except SlotUnavailableError:
+        await query.edit_message_text(
+            "❌ <b>К сожалению, исполнитель уже занят в это время.</b> Пожалуйста, оформите заказ заново.",
+            parse_mode="HTML"
         )
     except Exception as e:
         logger.error(f"Ошибка при создании заказа: {e}", exc_info=True)
@@ -285,6 +304,151 @@ async def confirm_order(update: Update, context: ContextTypes.DEFAULT_TYPE):
     
     return ConversationHandler.END
 
+def release_reservation(context: ContextTypes.DEFAULT_TYPE):
+    """Снимает удержание слота, взятое при выборе исполнителя"""
+    reservation_id = context.user_data.pop('reservation_id', None)
+    if reservation_id:
+        db.release_hold(reservation_id)
+
+async def order_timeout(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Диалог заказа прерван по conversation_timeout"""
+    release_reservation(context)
+    for key in list(context.user_data.keys()):
+        if key.startswith('order_') or key == 'program_category':
+            del context.user_data[key]
+
+async def release_expired_holds(context: ContextTypes.DEFAULT_TYPE):
+    removed = db.purge_expired_holds()
+    if removed:
+        logger.info(f"Снято просроченных удержаний слотов: {removed}")
+
+async def process_new_order(context: ContextTypes.DEFAULT_TYPE, order_id: int, order_data: dict):
+    """Действия после сохранения заказа: уведомления, запрос исполнителю, календарь"""
+    await notify_admin(context, order_data)
+    
+    if order_data['order_performers'] != "Любой свободный":
+        performer = db.get_performer(name=order_data['order_performers'])
+        if performer and performer.get('telegram_user_id'):
+            await request_performer_confirmation(
+                context, 
+                performer['telegram_user_id'], 
+                order_id
+            )
+    
+    calendar_sync.sync_order(order_id)
+    reminders.schedule_order(order_id)
+
+async def web_app_order_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Открывает форму заказа (Telegram Web App), которая отправляет все поля разом"""
+    if not config.ORDER_WEBAPP_URL:
+        await update.message.reply_text("❌ Форма заказа не настроена. Используйте /order")
+        return
+    
+    keyboard = ReplyKeyboardMarkup(
+        [[KeyboardButton("📝 Заполнить форму заказа", web_app=WebAppInfo(url=config.ORDER_WEBAPP_URL))]],
+        resize_keyboard=True,
+        one_time_keyboard=True
+    )
+    await update.message.reply_text("Заполните форму заказа:", reply_markup=keyboard)
+
+def validate_order_form(form: dict) -> Tuple[dict, List[str]]:
+    """
+    Проверяет все поля формы за один проход.
+    Возвращает данные заказа и список всех найденных ошибок.
+    """
+    errors = []
+    get = lambda key: str(form.get(key) or '').strip()
+    
+    date, time = get('date'), get('time')
+    location, performer = get('location'), get('performer')
+    program, subprogram = get('program'), get('subprogram')
+    amount, details = get('amount'), get('details')
+    
+    if not validate_date(date):
+        errors.append("📅 Неверная дата: укажите дату в будущем в формате ДД.ММ.ГГГГ")
+    elif time not in config.TIME_SLOTS or not validate_time(date, time):
+        errors.append("⏰ Неверное время: выберите один из доступных слотов")
+    if len(location) < 5:
+        errors.append("📍 Слишком короткое название места")
+    if performer not in config.PERFORMERS_LIST:
+        errors.append("👨‍🎤 Неизвестный исполнитель")
+    
+    sub_categories = config.PROGRAM_SUB_CATEGORIES.get(program, [])
+    if program not in config.PROGRAM_CATEGORIES:
+        errors.append("🎪 Неизвестная программа")
+    elif sub_categories and subprogram not in sub_categories:
+        errors.append("🎪 Выберите подкатегорию программы")
+    
+    if not validate_amount(amount):
+        errors.append("💰 Неверный формат суммы (например: 5000 или 7500.50)")
+    
+    order_data = {
+        'order_date': date,
+        'order_time': time,
+        'order_location': location,
+        'order_performers': performer,
+        'order_program': f"{program} - {subprogram}" if sub_categories else program,
+        'order_amount': amount,
+        'order_details': details
+    }
+    return order_data, errors
+
+async def web_app_order_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Создание заказа одной отправкой формы (web_app_data)"""
+    message = update.effective_message
+    try:
+        form = json.loads(message.web_app_data.data)
+        if not isinstance(form, dict):
+            raise ValueError("form data must be an object")
+    except (ValueError, TypeError) as e:
+        logger.warning(f"Invalid web_app_data from {update.effective_user.id}: {e}")
+        await message.reply_text("❌ Не удалось прочитать данные формы", reply_markup=ReplyKeyboardRemove())
+        return
+    
+    order_data, errors = validate_order_form(form)
+    if not errors and order_data['order_performers'] != "Любой свободный" and not db.is_performer_available(
+        order_data['order_performers'], order_data['order_date'], order_data['order_time'],
+        order_data['order_program']
+    ):
+        errors.append("👨‍🎤 Этот исполнитель занят в выбранное время")
+    
+    if errors:
+        await message.reply_text(
+            "❌ <b>Заказ не создан:</b>\n" + "\n".join(errors),
+            parse_mode="HTML",
+            reply_markup=ReplyKeyboardRemove()
+        )
+        return
+    
+    user = update.effective_user
+    order_data.update({
+        'user_id': user.id,
+        'user_name': user.full_name,
+        'username': user.username
+    })
+    
+    try:
+        order_id, _ = save_order_with_assignment(order_data)
+        await message.reply_text(
+            "✅ <b>Заказ успешно создан!</b>",
+            parse_mode="HTML",
+            reply_markup=ReplyKeyboardRemove()
+        )
+        await process_new_order(context, order_id, order_data)
+    except SlotUnavailableError:
+        await message.reply_text(
+            "❌ <b>Заказ не создан:</b>\n👨‍🎤 Этот исполнитель занят в выбранное время",
+            parse_mode="HTML",
+            reply_markup=ReplyKeyboardRemove()
+        )
+    except Exception as e:
+        logger.error(f"Ошибка при создании заказа из формы: {e}", exc_info=True)
+        await message.reply_text(
+            "❌ <b>Произошла ошибка при создании заказа.</b> Пожалуйста, попробуйте позже.",
+            parse_mode="HTML",
+            reply_markup=ReplyKeyboardRemove()
+        )
+
 async def notify_admin(context: ContextTypes.DEFAULT_TYPE, order_data: dict):
     message = (
         "🆕 *Новый заказ!*\n\n"
@@ -298,15 +462,13 @@ async def notify_admin(context: ContextTypes.DEFAULT_TYPE, order_data: dict):
         f"📝 Детали: {order_data['order_details']}"
     )
     
-    for admin_id in config.ADMIN_IDS:
-        try:
-            await context.bot.send_message(
-                chat_id=admin_id,
-                text=message,
-                parse_mode="Markdown"
-            )
-        except Exception as e:
-            logger.error(f"Ошибка отправки уведомления администратору {admin_id}: {e}")
+    # Заказ на ближайшие часы — сразу, остальные попадают в сводку
+    start = parse_slot(order_data['order_date'], order_data['order_time'])
+    urgent = start is not None and start - datetime.datetime.now() < datetime.timedelta(hours=config.DIGEST_URGENT_HOURS)
+    await asyncio.gather(*[
+        notifier.digest.add(context.bot, admin_id, message, parse_mode="Markdown", urgent=urgent)
+        for admin_id in config.ADMIN_IDS
+    ])
 
 async def request_performer_confirmation(context: ContextTypes.DEFAULT_TYPE, performer_id: int, order_id: int):
     order = db.get_order(order_id)
@@ -331,9 +493,11 @@ async def request_performer_confirmation(context: ContextTypes.DEFAULT_TYPE, per
     ])
     
     try:
-        await context.bot.send_message(
-            chat_id=performer_id,
-            text=message,
+        await outbound.send_message(
+            context.bot,
+            performer_id,
+            message,
+            priority=PRIORITY_CONFIRMATION,
             reply_markup=keyboard,
             parse_mode="HTML"
         )
@@ -0,0 +1,317 @@
+import asyncio
+import itertools
+import logging
+import time
+from typing import Any, Dict, Optional, Tuple
+from telegram.error import RetryAfter
+from telegram.ext import BaseRateLimiter
+from core.config import config
+from core.ratelimit import RateLimiter
+from core.metrics import outbound_calls
+from core import tracing
+
+logger = logging.getLogger(__name__)
+
+# Приоритеты исходящих сообщений (меньше — важнее)
+PRIORITY_CONFIRMATION = 0
+PRIORITY_NORMAL = 1
+PRIORITY_BULK = 2
+
+
+# Маркер вызовов, уже прошедших через очередь планировщика
+SCHEDULED = {"outbound": True}
+
+
+def _retry_seconds(error: RetryAfter) -> float:
+    retry_after = error.retry_after
+    if hasattr(retry_after, "total_seconds"):
+        return retry_after.total_seconds()
+    return float(retry_after)
+
+
+class TokenBucket:
+    """Классический token bucket: rate токенов в секунду, не более capacity"""
+
+    __slots__ = ("rate", "capacity", "tokens", "updated", "blocked_until")
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.blocked_until = 0.0
+
+    def _refill(self, now: float):
+        elapsed = now - self.updated
+        if elapsed > 0:
+            self.tokens = min(self.capacity, self.tokens + elapsed * self.rate)
+            self.updated = now
+
+    def delay(self, now: Optional[float] = None) -> float:
+        """Сколько секунд ждать до появления токена (0 — можно отправлять)"""
+        now = time.monotonic() if now is None else now
+        if now < self.blocked_until:
+            return self.blocked_until - now
+        self._refill(now)
+        if self.tokens >= 1:
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+    def consume(self, now: Optional[float] = None):
+        now = time.monotonic() if now is None else now
+        self._refill(now)
+        self.tokens -= 1
+
+    def block(self, seconds: float):
+        """Блокирует корзину (например, после RetryAfter)"""
+        self.blocked_until = max(self.blocked_until, time.monotonic() + seconds)
+        self.tokens = 0
+
+
+class OutboundScheduler:
+    """Центральная очередь исходящих вызовов Bot API с учетом лимитов Telegram"""
+
+    def __init__(
+        self,
+        global_rate: float = None,
+        chat_rate: float = None,
+        group_rate: float = None,
+        workers: int = None,
+        max_retries: int = 3
+    ):
+        self.global_bucket = TokenBucket(
+            global_rate or config.OUTBOUND_GLOBAL_RATE,
+            global_rate or config.OUTBOUND_GLOBAL_RATE
+        )
+        self.chat_rate = chat_rate or config.OUTBOUND_CHAT_RATE
+        self.group_rate = group_rate or config.OUTBOUND_GROUP_RATE
+        # Лимиты по чатам (GCRA): одно число на чат, неактивные чаты вытесняются сами
+        self.chat_limiter = self._make_limiter(self.chat_rate)
+        self.group_limiter = self._make_limiter(self.group_rate)
+        self.workers_count = workers or config.OUTBOUND_WORKERS
+        self.max_retries = max_retries
+        self.queue: Optional[asyncio.PriorityQueue] = None
+        self._workers = []
+        self._seq = itertools.count()
+        # Отложенные задачи: seq -> (таймер возврата в очередь, задача)
+        self._deferred: Dict[int, Tuple[asyncio.TimerHandle, tuple]] = {}
+        self.sent = 0
+        self.failed = 0
+
+    @staticmethod
+    def _make_limiter(rate: float) -> RateLimiter:
+        # rate сообщений в секунду со всплеском до max(1, rate)
+        burst = max(1.0, rate)
+        return RateLimiter(burst, burst / rate, max_keys=config.RATE_LIMIT_MAX_KEYS)
+
+    def _chat_limiter(self, chat_id) -> RateLimiter:
+        # Отрицательные chat_id — группы и каналы, для них лимит ниже
+        is_group = isinstance(chat_id, str) or chat_id < 0
+        return self.group_limiter if is_group else self.chat_limiter
+
+    def start(self):
+        """Запускает воркеры в текущем event loop"""
+        if self._workers:
+            return
+        self.queue = asyncio.PriorityQueue()
+        self._workers = [
+            asyncio.create_task(self._worker(), name=f"outbound-{i}")
+            for i in range(self.workers_count)
+        ]
+        logger.info(f"Outbound scheduler started with {self.workers_count} workers")
+
+    async def stop(self, timeout: float = None):
+        """
+        Дожидается отправки очереди и останавливает воркеры. Если за timeout секунд
+        очередь не опустела (например, отложенные по RetryAfter повторы), оставшиеся
+        вызовы отменяются: их Future завершаются с CancelledError.
+        """
+        if not self._workers:
+            return
+        timeout = config.OUTBOUND_STOP_TIMEOUT if timeout is None else timeout
+        try:
+            await asyncio.wait_for(self._drain(), timeout)
+        except asyncio.TimeoutError:
+            logger.warning(f"Outbound queue not drained in {timeout:g}s, cancelling pending calls")
+            self._cancel_pending()
+        for task in self._workers:
+            task.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+        logger.info("Outbound scheduler stopped")
+
+    async def _drain(self):
+        while True:
+            await self.queue.join()
+            if not self._deferred:
+                return
+            await asyncio.sleep(0.1)
+
+    def _cancel_pending(self):
+        """Отменяет отложенные и ожидающие в очереди вызовы"""
+        cancelled = 0
+        for handle, item in self._deferred.values():
+            handle.cancel()
+            cancelled += self._cancel(item)
+        self._deferred.clear()
+        while not self.queue.empty():
+            cancelled += self._cancel(self.queue.get_nowait())
+            self.queue.task_done()
+        if cancelled:
+            logger.warning(f"Cancelled {cancelled} outbound calls on shutdown")
+
+    @staticmethod
+    def _cancel(item) -> int:
+        future = item[2][4]
+        if future.done():
+            return 0
+        future.cancel()
+        return 1
+
+    def submit(self, bot, method: str, chat_id, priority: int = PRIORITY_NORMAL, **kwargs) -> asyncio.Future:
+        """Ставит вызов bot.<method>(chat_id=..., **kwargs) в очередь, возвращает Future"""
+        if not self._workers:
+            self.start()
+        future = asyncio.get_running_loop().create_future()
+        job = [bot, method, chat_id, kwargs, future, 0]
+        self.queue.put_nowait((priority, next(self._seq), job))
+        return future
+
+    async def send(self, bot, method: str, chat_id, priority: int = PRIORITY_NORMAL, **kwargs) -> Any:
+        """Отправляет через очередь и дожидается результата вызова"""
+        # Ожидание в очереди — тоже время Bot API для обработчика
+        with tracing.span(tracing.API):
+            return await self.submit(bot, method, chat_id, priority, **kwargs)
+
+    async def send_message(self, bot, chat_id, text: str, priority: int = PRIORITY_NORMAL, **kwargs):
+        return await self.send(bot, "send_message", chat_id, priority, text=text, **kwargs)
+
+    async def _worker(self):
+        while True:
+            item = await self.queue.get()
+            try:
+                await self._process(item)
+            except asyncio.CancelledError:
+                # Остановка по тайм-ауту: вызов в работе тоже отменяется
+                self._cancel(item)
+                raise
+            except Exception as e:
+                logger.error(f"Outbound worker error: {e}", exc_info=True)
+            finally:
+                self.queue.task_done()
+
+    async def _process(self, item):
+        priority, _, job = item
+        bot, method, chat_id, kwargs, future, attempts = job
+        if future.done():
+            return
+
+        # Лимит чата: если он исчерпан, откладываем задачу и берем следующую
+        chat_limiter = self._chat_limiter(chat_id)
+        chat_delay = chat_limiter.delay(chat_id)
+        if chat_delay > 0:
+            self._defer(item, chat_delay)
+            return
+
+        # Глобальный лимит бота
+        while True:
+            global_delay = self.global_bucket.delay()
+            if global_delay <= 0:
+                break
+            await asyncio.sleep(global_delay)
+
+        # Пока ждали глобальный лимит, слот чата мог занять другой воркер
+        chat_delay = chat_limiter.delay(chat_id)
+        if chat_delay > 0:
+            self._defer(item, chat_delay)
+            return
+
+        self.global_bucket.consume()
+        chat_limiter.consume(chat_id)
+        if getattr(bot, "rate_limiter", None) is not None:
+            # Помечаем вызов, чтобы OutboundRateLimiter не посчитал его второй раз
+            kwargs = {**kwargs, "rate_limit_args": SCHEDULED}
+        try:
+            result = await getattr(bot, method)(chat_id=chat_id, **kwargs)
+        except RetryAfter as e:
+            retry_after = _retry_seconds(e)
+            logger.warning(f"Flood control for chat {chat_id}: retry in {retry_after}s")
+            chat_limiter.block(chat_id, retry_after)
+            if attempts < self.max_retries:
+                job[5] = attempts + 1
+                outbound_calls.inc(method=method, result="retry_after")
+                self._defer(item, retry_after)
+            else:
+                self.failed += 1
+                outbound_calls.inc(method=method, result="error")
+                future.set_exception(e)
+            return
+        except Exception as e:
+            self.failed += 1
+            outbound_calls.inc(method=method, result="error")
+            future.set_exception(e)
+            return
+
+        self.sent += 1
+        outbound_calls.inc(method=method, result="ok")
+        future.set_result(result)
+
+    def _defer(self, item, delay: float):
+        """Возвращает задачу в очередь через delay секунд, не занимая воркер"""
+        handle = asyncio.get_running_loop().call_later(delay, self._put_deferred, item)
+        self._deferred[item[1]] = (handle, item)
+
+    def _put_deferred(self, item):
+        self._deferred.pop(item[1], None)
+        self.queue.put_nowait(item)
+
+
+class OutboundRateLimiter(BaseRateLimiter):
+    """Применяет лимиты планировщика ко всем прочим вызовам Bot API
+    (ответы в диалогах, edit_message_text и т.п.)"""
+
+    def __init__(self, scheduler: OutboundScheduler, max_retries: int = 1):
+        self.scheduler = scheduler
+        self.max_retries = max_retries
+
+    async def initialize(self) -> None:
+        pass
+
+    async def shutdown(self) -> None:
+        pass
+
+    async def process_request(self, callback, args, kwargs, endpoint, data, rate_limit_args):
+        if rate_limit_args == SCHEDULED:
+            return await callback(*args, **kwargs)
+        # Ожидание лимитов и сам запрос — время Bot API для обработчика
+        with tracing.span(tracing.API):
+            return await self._limited(callback, args, kwargs, endpoint, data)
+
+    async def _limited(self, callback, args, kwargs, endpoint, data):
+        chat_id = data.get("chat_id")
+        chat_limiter = self.scheduler._chat_limiter(chat_id) if chat_id is not None else None
+        for attempt in range(self.max_retries + 1):
+            while True:
+                delay = self.scheduler.global_bucket.delay()
+                if chat_limiter is not None:
+                    delay = max(delay, chat_limiter.delay(chat_id))
+                if delay <= 0:
+                    break
+                await asyncio.sleep(delay)
+            self.scheduler.global_bucket.consume()
+            if chat_limiter is not None:
+                chat_limiter.consume(chat_id)
+            try:
+                return await callback(*args, **kwargs)
+            except RetryAfter as e:
+                if attempt >= self.max_retries:
+                    raise
+                retry_after = _retry_seconds(e)
+                logger.warning(f"Flood control on {endpoint}: retry in {retry_after}s")
+                if chat_limiter is not None:
+                    chat_limiter.block(chat_id, retry_after)
+                else:
+                    await asyncio.sleep(retry_after)
+
+
+outbound = OutboundScheduler()
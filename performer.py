@@ -7,6 +7,7 @@ class Performer(Base):
     performer_name = Column(String, unique=True, nullable=False)
     telegram_user_id = Column(Integer, unique=True, nullable=False)
     google_tokens = Column(String)
+    calendar_sync_token = Column(String)  # syncToken последней сверки календаря
 
     def clear_google_tokens(self):
         """Очищает токены Google OAuth"""
@@ -1,9 +1,13 @@
+import asyncio
 import logging
-from telegram import Update
-from telegram.ext import ContextTypes, CallbackQueryHandler
+from telegram import Update, InlineKeyboardMarkup, InlineKeyboardButton
+from telegram.ext import ContextTypes, CallbackQueryHandler, ConversationHandler
 from core.config import config, states
-from core.database import db
+from core.database import db, SlotUnavailableError
 from services.notifications import notifier
+from services.outbound import outbound, PRIORITY_CONFIRMATION
+from services.assignment import pick_performers
+from services import calendar_sync, reminders
 from core.utils import create_time_selection_keyboard
 
 logger = logging.getLogger(__name__)
@@ -29,9 +33,16 @@ async def handle_performer_response(update: Update, context: ContextTypes.DEFAUL
             )
     
     elif action == "reject":
-        db.update_order_status(order_id, "rejected")
+        # Слот отказавшегося исполнителя освобождается, заказ ждет замены
+        db.update_order_status(order_id, "reassigning")
+        calendar_sync.sync_order(order_id)
+        reminders.schedule_order(order_id)
         await query.edit_message_text("❌ Вы отказались от заказа.")
-        await find_replacement_performer(context, order_id)
+        performer = db.get_performer_by_user_id(update.effective_user.id)
+        await find_replacement_performer(
+            context, order_id,
+            exclude=performer['performer_name'] if performer else None
+        )
     
     elif action == "reschedule":
         context.user_data['reschedule_order_id'] = order_id
@@ -48,11 +59,16 @@ async def handle_reschedule_time(update: Update, context: ContextTypes.DEFAULT_T
     order_id = int(data[1])
     new_time = data[2]
     
-    with db.session_scope() as session:
-        order = session.query(Order).get(order_id)
-        if order:
-            order.order_time = new_time
-            session.commit()
+    try:
+        db.update_order_time(order_id, new_time)
+    except SlotUnavailableError:
+        await query.edit_message_text(
+            f"❌ Время {new_time} уже занято, заказ остается на прежнем времени."
+        )
+        return ConversationHandler.END
+    
+    calendar_sync.sync_order(order_id)
+    reminders.schedule_order(order_id)
     
     order = db.get_order(order_id)
     if order:
@@ -66,15 +82,138 @@ async def handle_reschedule_time(update: Update, context: ContextTypes.DEFAULT_T
     await query.edit_message_text(f"✅ Время заказа изменено на {new_time}")
     return ConversationHandler.END
 
-async def find_replacement_performer(context: ContextTypes.DEFAULT_TYPE, order_id: int):
+async def notify_admins(context: ContextTypes.DEFAULT_TYPE, message: str):
+    await asyncio.gather(*[
+        notifier.send_notification(admin_id, message, context, ["telegram"])
+        for admin_id in config.ADMIN_IDS
+    ])
+
+async def find_replacement_performer(context: ContextTypes.DEFAULT_TYPE, order_id: int, exclude: str = None):
+    """Рассылает предложение всем свободным исполнителям; заказ получает первый принявший"""
     order = db.get_order(order_id)
     if not order:
         return
     
-    logger.info(f"Поиск замены для заказа #{order_id}")
-    await notifier.send_notification(
-        config.ADMIN_IDS[0],
-        f"⚠️ Требуется замена исполнителя для заказа #{order_id}",
+    candidates = [
+        name for name in pick_performers(order['order_date'], order['order_time'], order['order_program'])
+        if name != exclude
+    ]
+    performers = [db.get_performer(name=name) for name in candidates]
+    performers = [p for p in performers if p and p.get('telegram_user_id')]
+    logger.info(f"Поиск замены для заказа #{order_id}: {len(performers)} кандидатов")
+    
+    if not performers:
+        await release_unclaimed_order(context, order_id, "нет свободных исполнителей для замены")
+        return
+    
+    message = (
+        "🆘 <b>Срочно нужна замена!</b>\n\n"
+        f"📅 <b>Дата:</b> {order['order_date']}\n"
+        f"⏰ <b>Время:</b> {order['order_time']}\n"
+        f"📍 <b>Место:</b> {order['order_location']}\n"
+        f"🎭 <b>Программа:</b> {order['order_program']}\n\n"
+        "Заказ получит первый, кто примет предложение."
+    )
+    keyboard = InlineKeyboardMarkup([[
+        InlineKeyboardButton("✅ Беру заказ", callback_data=f"offer_accept_{order_id}"),
+        InlineKeyboardButton("❌ Не могу", callback_data=f"offer_decline_{order_id}")
+    ]])
+    
+    async def send_offer(performer):
+        chat_id = performer['telegram_user_id']
+        try:
+            sent = await outbound.send_message(
+                context.bot, chat_id, message,
+                priority=PRIORITY_CONFIRMATION,
+                reply_markup=keyboard,
+                parse_mode="HTML"
+            )
+            db.add_replacement_offer(order_id, performer['performer_name'], chat_id, sent.message_id)
+            return True
+        except Exception as e:
+            logger.error(f"Ошибка отправки предложения исполнителю {chat_id}: {e}")
+            return False
+    
+    results = await asyncio.gather(*[send_offer(p) for p in performers])
+    if not any(results):
+        await release_unclaimed_order(context, order_id, "не удалось предложить замену")
+
+async def release_unclaimed_order(context: ContextTypes.DEFAULT_TYPE, order_id: int, reason: str) -> bool:
+    """Заказ без нового исполнителя возвращается в ожидание назначения, админы получают уведомление"""
+    if not db.release_unclaimed_order(order_id):
+        return False
+    calendar_sync.sync_order(order_id)
+    reminders.schedule_order(order_id)
+    logger.info(f"Заказ #{order_id} возвращен в ожидание назначения: {reason}")
+    await notify_admins(
         context,
-        ["telegram"]
-    )
\ No newline at end of file
+        f"⚠️ Заказ #{order_id}: {reason}. Заказ возвращен в ожидание назначения исполнителя."
+    )
+    return True
+
+async def expire_replacement_offers(context: ContextTypes.DEFAULT_TYPE):
+    """Периодическая задача: заказы, предложения по которым истекли без ответа, возвращаются в ожидание"""
+    for order_id in db.get_stale_reassignments(config.REPLACEMENT_OFFER_TTL):
+        offers = [o for o in db.get_replacement_offers(order_id) if o['status'] == 'sent']
+        if not await release_unclaimed_order(context, order_id, "никто не принял предложение замены"):
+            continue
+        for offer in offers:
+            try:
+                await outbound.send(
+                    context.bot, "edit_message_text", offer['chat_id'],
+                    message_id=offer['message_id'],
+                    text=f"⌛️ Предложение по заказу #{order_id} истекло."
+                )
+            except Exception as e:
+                logger.warning(f"Не удалось отозвать предложение у {offer['chat_id']}: {e}")
+
+async def handle_replacement_offer(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    query = update.callback_query
+    await query.answer()
+    _, action, order_id = query.data.split('_')
+    order_id = int(order_id)
+    chat_id = update.effective_user.id
+    
+    if action == "decline":
+        db.set_offer_status(order_id, chat_id, "declined")
+        await query.edit_message_text("Вы отказались от предложения.")
+        offers = db.get_replacement_offers(order_id)
+        if offers and not any(o['status'] in ('sent', 'accepted') for o in offers):
+            await release_unclaimed_order(context, order_id, "все исполнители отказались от замены")
+        return
+    
+    performer = db.get_performer_by_user_id(chat_id)
+    if not performer or not db.claim_order(order_id, performer['performer_name']):
+        await query.edit_message_text("⌛️ Заказ уже принят другим исполнителем.")
+        return
+    
+    db.set_offer_status(order_id, chat_id, "accepted")
+    calendar_sync.sync_order(order_id)
+    reminders.schedule_order(order_id)
+    await query.edit_message_text(f"✅ Заказ #{order_id} закреплен за вами!")
+    logger.info(f"Заказ #{order_id} передан исполнителю {performer['performer_name']}")
+    
+    # Отзываем остальные предложения
+    others = [o for o in db.get_replacement_offers(order_id) if o['chat_id'] != chat_id and o['status'] == 'sent']
+    
+    async def withdraw(offer):
+        db.set_offer_status(order_id, offer['chat_id'], "withdrawn")
+        try:
+            await outbound.send(
+                context.bot, "edit_message_text", offer['chat_id'],
+                message_id=offer['message_id'],
+                text=f"⌛️ Заказ #{order_id} уже принят другим исполнителем."
+            )
+        except Exception as e:
+            logger.warning(f"Не удалось отозвать предложение у {offer['chat_id']}: {e}")
+    
+    await asyncio.gather(*[withdraw(o) for o in others])
+    
+    order = db.get_order(order_id)
+    if order:
+        await notifier.send_notification(
+            order['user_id'],
+            f"🔄 Для вашего заказа назначен новый исполнитель: {performer['performer_name']}",
+            context,
+            ["telegram"]
+        )
@@ -0,0 +1,141 @@
+import functools
+import logging
+import re
+import threading
+from typing import Dict, List, Optional
+from .config import config
+
+logger = logging.getLogger(__name__)
+slow_logger = logging.getLogger("bot.slow_queries")
+
+# Операторы, для которых имеет смысл EXPLAIN QUERY PLAN
+EXPLAINABLE = ("SELECT", "UPDATE", "DELETE", "INSERT", "WITH")
+
+_IN_LIST = re.compile(r"\(\s*(?:\?|%\(\w+\)s|:\w+)(?:\s*,\s*(?:\?|%\(\w+\)s|:\w+))+\s*\)")
+_STRING = re.compile(r"'(?:[^']|'')*'")
+_NUMBER = re.compile(r"(?<![\w.])-?\d+(?:\.\d+)?\b")
+_SPACES = re.compile(r"\s+")
+
+
+@functools.lru_cache(maxsize=2048)
+def normalize(statement: str) -> str:
+    """Текст запроса без литералов и с одинаковыми списками IN (...) — ключ агрегации"""
+    normalized = _STRING.sub("?", statement)
+    normalized = _NUMBER.sub("?", normalized)
+    normalized = _IN_LIST.sub("(?, ...)", normalized)
+    return _SPACES.sub(" ", normalized).strip()
+
+
+def _short(parameters, limit: int = 300) -> str:
+    text = repr(parameters)
+    return text if len(text) <= limit else text[:limit] + "..."
+
+
+class StatementStats:
+    __slots__ = ("statement", "count", "total", "max", "slow", "plan", "full_scans")
+
+    def __init__(self, statement: str):
+        self.statement = statement
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.slow = 0
+        self.plan: Optional[List[str]] = None
+        self.full_scans: List[str] = []
+
+    @property
+    def avg(self) -> float:
+        return self.total / self.count if self.count else 0.0
+
+    def as_dict(self) -> dict:
+        return {
+            "statement": self.statement,
+            "count": self.count,
+            "total_ms": self.total * 1000,
+            "avg_ms": self.avg * 1000,
+            "max_ms": self.max * 1000,
+            "slow": self.slow,
+            "plan": self.plan,
+            "full_scans": self.full_scans,
+        }
+
+
+class QueryProfiler:
+    """
+    Агрегирует время SQL по нормализованному тексту запроса. Медленные запросы
+    пишутся в лог с параметрами; при первом медленном выполнении запроса
+    снимается EXPLAIN QUERY PLAN и отмечаются полные сканы таблиц.
+    """
+
+    def __init__(self, slow_threshold: float = None, max_statements: int = None):
+        self.slow_threshold = (config.SQL_SLOW_QUERY_MS if slow_threshold is None else slow_threshold) / 1000
+        self.max_statements = max_statements or config.SQL_PROFILE_MAX_STATEMENTS
+        self._stats: Dict[str, StatementStats] = {}
+        self._lock = threading.Lock()
+
+    def record(self, statement: str, parameters, elapsed: float, cursor=None, executemany: bool = False):
+        key = normalize(statement)
+        with self._lock:
+            stats = self._stats.get(key)
+            if stats is None:
+                if len(self._stats) >= self.max_statements:
+                    # Таблица переполнена: новые редкие запросы не учитываются
+                    return
+                stats = self._stats[key] = StatementStats(key)
+            stats.count += 1
+            stats.total += elapsed
+            stats.max = max(stats.max, elapsed)
+            if elapsed < self.slow_threshold:
+                return
+            stats.slow += 1
+            first_slow = stats.plan is None
+            if first_slow:
+                stats.plan = []  # план снимается один раз, даже если EXPLAIN не удался
+
+        slow_logger.warning(
+            f"Slow query {elapsed * 1000:.1f} ms: {key} params={_short(parameters)}",
+            extra={"sql": key, "duration_ms": round(elapsed * 1000, 1)}
+        )
+        if first_slow and cursor is not None:
+            self._explain(stats, statement, parameters[0] if executemany and parameters else parameters, cursor)
+
+    def _explain(self, stats: StatementStats, statement: str, parameters, cursor):
+        if not statement.lstrip().upper().startswith(EXPLAINABLE):
+            return
+        try:
+            # Отдельный курсор того же DB-API соединения: события SQLAlchemy не срабатывают,
+            # результат исходного запроса не затрагивается
+            raw = cursor.connection.cursor()
+            try:
+                raw.execute(f"EXPLAIN QUERY PLAN {statement}", parameters or ())
+                plan = [row[-1] for row in raw.fetchall()]
+            finally:
+                raw.close()
+        except Exception as e:
+            logger.debug(f"EXPLAIN QUERY PLAN failed for {stats.statement}: {e}")
+            return
+        full_scans = [
+            detail for detail in plan
+            if detail.startswith("SCAN") and "USING" not in detail and "SUBQUERY" not in detail
+        ]
+        with self._lock:
+            stats.plan = plan
+            stats.full_scans = full_scans
+        message = f"Query plan for {stats.statement}: " + " | ".join(plan)
+        if full_scans:
+            slow_logger.warning(f"Full table scan ({', '.join(full_scans)}). {message}")
+        else:
+            slow_logger.info(message)
+
+    def top(self, limit: int = 10, order_by: str = "total") -> List[dict]:
+        key = {"total": "total", "avg": "avg", "count": "count", "max": "max"}.get(order_by, "total")
+        with self._lock:
+            ranked = sorted(self._stats.values(), key=lambda s: getattr(s, key), reverse=True)[:limit]
+            return [stats.as_dict() for stats in ranked]
+
+    def reset(self):
+        with self._lock:
+            self._stats.clear()
+
+
+profiler = QueryProfiler()
@@ -0,0 +1,88 @@
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, Dict, Hashable, Optional, Tuple
+
+
+class RateLimiter:
+    """
+    GCRA (generic cell rate algorithm): не более limit событий за period секунд
+    на ключ, с допустимым всплеском до limit. На ключ хранится одно число —
+    теоретическое время следующего события (TAT), поэтому память не зависит
+    от числа отправок. Ключ, у которого TAT в прошлом, ничем не отличается
+    от нового и удаляется; max_keys дополнительно ограничивает размер таблицы.
+    """
+
+    def __init__(self, limit: float, period: float, max_keys: int = 1_000_000,
+                 clock: Callable[[], float] = time.monotonic):
+        if limit <= 0 or period <= 0:
+            raise ValueError("limit and period must be positive")
+        self.limit = limit
+        self.period = period
+        self.interval = period / limit  # интервал между событиями при равномерной нагрузке
+        self.tolerance = period - self.interval  # запас на всплеск
+        self.max_keys = max_keys
+        self.clock = clock
+        # Порядок вставки = порядок последнего обновления: просроченные ключи в начале
+        self._tat: "OrderedDict[Hashable, float]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._tat)
+
+    def _evict(self, now: float):
+        while self._tat:
+            key, tat = next(iter(self._tat.items()))
+            if tat > now and len(self._tat) <= self.max_keys:
+                break
+            del self._tat[key]
+
+    def _update(self, key: Hashable, tat: float, now: float):
+        self._tat[key] = tat
+        self._tat.move_to_end(key)
+        self._evict(now)
+
+    def delay(self, key: Hashable, now: Optional[float] = None) -> float:
+        """Сколько секунд ждать до следующего разрешенного события (0 — можно сейчас)"""
+        now = self.clock() if now is None else now
+        with self._lock:
+            tat = self._tat.get(key, now)
+        return max(0.0, tat - self.tolerance - now)
+
+    def consume(self, key: Hashable, now: Optional[float] = None):
+        """Учитывает событие без проверки (после delay() == 0)"""
+        now = self.clock() if now is None else now
+        with self._lock:
+            tat = max(self._tat.get(key, now), now)
+            self._update(key, tat + self.interval, now)
+
+    def acquire(self, key: Hashable, now: Optional[float] = None) -> bool:
+        """Проверяет лимит и, если он не превышен, учитывает событие"""
+        now = self.clock() if now is None else now
+        with self._lock:
+            tat = max(self._tat.get(key, now), now)
+            if tat - self.tolerance > now:
+                return False
+            self._update(key, tat + self.interval, now)
+            return True
+
+    def block(self, key: Hashable, seconds: float, now: Optional[float] = None):
+        """Запрещает события по ключу на seconds (например, после RetryAfter)"""
+        now = self.clock() if now is None else now
+        with self._lock:
+            tat = max(self._tat.get(key, now), now + seconds + self.tolerance)
+            self._update(key, tat, now)
+
+
+class ChannelRateLimits:
+    """Набор RateLimiter по каналам; лимиты — {канал: (limit, period)} из BotConfig"""
+
+    def __init__(self, limits: Dict[str, Tuple[float, float]], max_keys: int = 1_000_000):
+        self.limiters = {
+            channel: RateLimiter(limit, period, max_keys=max_keys)
+            for channel, (limit, period) in limits.items()
+        }
+
+    def acquire(self, channel: str, recipient: Hashable) -> bool:
+        limiter = self.limiters.get(channel)
+        return limiter.acquire(recipient) if limiter is not None else True
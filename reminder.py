@@ -0,0 +1,17 @@
+from core.base import Base
+from sqlalchemy import Column, Integer, String, DateTime, Index
+import datetime
+
+class Reminder(Base):
+    __tablename__ = 'reminders'
+    __table_args__ = (Index('ix_reminders_due', 'status', 'due_at'),)
+    id = Column(Integer, primary_key=True)
+    order_id = Column(Integer, nullable=False, index=True)
+    user_id = Column(Integer, nullable=False)  # Telegram id получателя
+    audience = Column(String, nullable=False)  # customer / performer
+    kind = Column(String, nullable=False)  # 24h / 2h
+    due_at = Column(DateTime, nullable=False)  # локальное время, как у заказов
+    show_at = Column(DateTime, nullable=False)
+    status = Column(String, default='pending')  # pending / sent / cancelled / expired
+    sent_at = Column(DateTime)
+    created_at = Column(DateTime, default=datetime.datetime.utcnow)
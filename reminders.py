@@ -0,0 +1,241 @@
+import asyncio
+import heapq
+import logging
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Set, Tuple
+from core.config import config
+from core.database import db
+from core.intervals import parse_slot
+from models.order import Order
+from models.reminder import Reminder
+from services.notifications import notifier
+
+logger = logging.getLogger(__name__)
+
+# За сколько до начала шоу напоминать
+REMINDER_OFFSETS = {"24h": timedelta(hours=24), "2h": timedelta(hours=2)}
+KIND_LABELS = {"24h": "через 24 часа", "2h": "через 2 часа"}
+# Клиенту напоминаем и пока заказ ждет замены исполнителя
+CUSTOMER_STATUSES = db.ACTIVE_STATUSES + ("reassigning",)
+
+
+def _recipients(order: dict) -> List[Tuple[str, int]]:
+    status = order.get('status') or 'pending'
+    recipients = []
+    if status in CUSTOMER_STATUSES:
+        recipients.append(("customer", order['user_id']))
+    if status in db.ACTIVE_STATUSES:
+        performer = db.get_performer(name=order['order_performers'])
+        if performer and performer.get('telegram_user_id'):
+            recipients.append(("performer", performer['telegram_user_id']))
+    return recipients
+
+
+def schedule_order(order_id: int) -> int:
+    """
+    Приводит напоминания заказа к его текущему времени, статусу и исполнителю:
+    неизменившиеся остаются, устаревшие отменяются, недостающие создаются.
+    Возвращает число новых напоминаний.
+    """
+    order = db.get_order(order_id)
+    show_at = parse_slot(order['order_date'], order['order_time']) if order else None
+    now = datetime.now()
+    wanted: Dict[Tuple[str, int, str], datetime] = {}
+    if show_at:
+        for audience, user_id in _recipients(order):
+            for kind, offset in REMINDER_OFFSETS.items():
+                if show_at - offset > now:
+                    wanted[(audience, user_id, kind)] = show_at - offset
+
+    with db.session_scope() as session:
+        for reminder in session.query(Reminder).filter_by(order_id=order_id, status='pending'):
+            key = (reminder.audience, reminder.user_id, reminder.kind)
+            if wanted.get(key) == reminder.due_at:
+                del wanted[key]
+            else:
+                reminder.status = 'cancelled'
+        rows = [
+            Reminder(order_id=order_id, user_id=user_id, audience=audience, kind=kind, due_at=due_at, show_at=show_at)
+            for (audience, user_id, kind), due_at in wanted.items()
+        ]
+        session.add_all(rows)
+        session.flush()
+        created = [(row.due_at, row.id) for row in rows]
+
+    scheduler.add(created)
+    return len(created)
+
+
+def _expires_at(reminder: Reminder) -> datetime:
+    """Напоминание актуально до срока следующего (более позднего) напоминания или до начала шоу"""
+    later = [offset for offset in REMINDER_OFFSETS.values() if offset < REMINDER_OFFSETS[reminder.kind]]
+    return reminder.show_at - max(later) if later else reminder.show_at
+
+
+def _render(reminder: Reminder, order: Order) -> str:
+    label = KIND_LABELS.get(reminder.kind, "")
+    if reminder.audience == "performer":
+        title = f"⏰ Напоминание: заказ #{order.id} {label}"
+    else:
+        title = f"⏰ Напоминание: ваше шоу {label}"
+    return (
+        f"{title}\n\n"
+        f"📅 {order.order_date} в {order.order_time}\n"
+        f"📍 {order.order_location or '—'}\n"
+        f"🎪 {order.order_program or '—'}"
+    )
+
+
+class ReminderScheduler:
+    """
+    Источник истины — таблица reminders с индексом (status, due_at). В памяти
+    держится куча только тех напоминаний, что наступают в ближайшие window
+    секунд; окно подгружается по мере движения времени. Работа планировщика
+    пропорциональна числу наступающих напоминаний, а не числу заказов.
+    """
+
+    def __init__(self, window: float = None, batch_size: int = None):
+        self.window = timedelta(seconds=window or config.REMINDER_WINDOW)
+        self.batch_size = batch_size or config.REMINDER_BATCH_SIZE
+        self._heap: List[Tuple[datetime, int]] = []
+        self._queued: Set[int] = set()
+        self._loaded_until: Optional[datetime] = None
+        self._wakeup: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+        self.fired = 0
+
+    def start(self):
+        if self._task:
+            return
+        self._wakeup = asyncio.Event()
+        self._task = asyncio.create_task(self._run(), name="reminders")
+        logger.info("Reminder scheduler started")
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    def wake(self):
+        if self._wakeup:
+            self._wakeup.set()
+
+    def _push(self, due_at: datetime, reminder_id: int):
+        if reminder_id not in self._queued:
+            self._queued.add(reminder_id)
+            heapq.heappush(self._heap, (due_at, reminder_id))
+
+    def add(self, reminders: List[Tuple[datetime, int]]):
+        """Новые напоминания сразу попадают в кучу, если наступают в уже загруженном окне"""
+        if self._loaded_until is None:
+            return
+        for due_at, reminder_id in reminders:
+            if due_at <= self._loaded_until:
+                self._push(due_at, reminder_id)
+        self.wake()
+
+    def load_window(self, now: datetime = None) -> int:
+        """
+        Подгружает напоминания до now + window. Первая загрузка берет и просроченные
+        (пропущенные, пока бот был остановлен), следующие — только новый отрезок окна.
+        """
+        now = now or datetime.now()
+        until = now + self.window
+        with db.session_scope() as session:
+            query = session.query(Reminder.due_at, Reminder.id).filter(
+                Reminder.status == 'pending', Reminder.due_at <= until
+            )
+            if self._loaded_until is not None:
+                query = query.filter(Reminder.due_at > self._loaded_until)
+            rows = query.all()
+        for due_at, reminder_id in rows:
+            self._push(due_at, reminder_id)
+        self._loaded_until = until
+        return len(rows)
+
+    def fire_due(self, now: datetime = None) -> int:
+        """Отправляет пачку наступивших напоминаний через outbox уведомлений. Возвращает их число."""
+        now = now or datetime.now()
+        ids = []
+        while self._heap and self._heap[0][0] <= now and len(ids) < self.batch_size:
+            _, reminder_id = heapq.heappop(self._heap)
+            self._queued.discard(reminder_id)
+            ids.append(reminder_id)
+        if not ids:
+            return 0
+
+        with db.session_scope() as session:
+            # Отмененные после загрузки в кучу отсеиваются здесь
+            reminders = session.query(Reminder).filter(Reminder.id.in_(ids), Reminder.status == 'pending').all()
+            orders = {
+                order.id: order
+                for order in session.query(Order).filter(Order.id.in_({r.order_id for r in reminders}))
+            }
+            messages, sent_ids, expired_ids = [], [], []
+            for reminder in reminders:
+                order = orders.get(reminder.order_id)
+                # Пропущенное при простое напоминание заменяется следующим
+                if order is None or now >= _expires_at(reminder):
+                    expired_ids.append(reminder.id)
+                    continue
+                messages.append((reminder.user_id, _render(reminder, order)))
+                sent_ids.append(reminder.id)
+
+        # Сначала outbox, затем отметка: при сбое между ними напоминание повторится, но не потеряется
+        if messages:
+            notifier.send_notifications(messages)
+        with db.session_scope() as session:
+            if sent_ids:
+                session.query(Reminder).filter(Reminder.id.in_(sent_ids)).update(
+                    {Reminder.status: 'sent', Reminder.sent_at: datetime.utcnow()}, synchronize_session=False
+                )
+            if expired_ids:
+                session.query(Reminder).filter(Reminder.id.in_(expired_ids)).update(
+                    {Reminder.status: 'expired'}, synchronize_session=False
+                )
+        self.fired += len(sent_ids)
+        if sent_ids:
+            logger.info(f"Sent {len(sent_ids)} reminders")
+        return len(ids)
+
+    def _next_wakeup(self, now: datetime) -> float:
+        reload_at = self._loaded_until - self.window / 2
+        next_at = min(self._heap[0][0], reload_at) if self._heap else reload_at
+        return max(0.0, (next_at - now).total_seconds())
+
+    async def _run(self):
+        while True:
+            try:
+                now = datetime.now()
+                if self._loaded_until is None or now >= self._loaded_until - self.window / 2:
+                    self.load_window(now)
+                if self.fire_due(now):
+                    continue
+                timeout = self._next_wakeup(now)
+            except Exception as e:
+                logger.error(f"Reminder cycle failed: {e}", exc_info=True)
+                timeout = 60
+            self._wakeup.clear()
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=timeout)
+            except asyncio.TimeoutError:
+                pass
+
+
+def backfill() -> int:
+    """Однократно создает напоминания для уже существующих заказов (при первом запуске)"""
+    with db.session_scope() as session:
+        if session.query(Reminder.id).first():
+            return 0
+        order_ids = [
+            order_id for order_id, in
+            session.query(Order.id).filter(Order.status.in_(CUSTOMER_STATUSES))
+        ]
+    created = sum(schedule_order(order_id) for order_id in order_ids)
+    if created:
+        logger.info(f"Backfilled {created} reminders for {len(order_ids)} orders")
+    return created
+
+
+scheduler = ReminderScheduler()
@@ -0,0 +1,13 @@
+from core.base import Base
+from sqlalchemy import Column, Integer, String, DateTime
+import datetime
+
+class ReplacementOffer(Base):
+    __tablename__ = 'replacement_offers'
+    id = Column(Integer, primary_key=True)
+    order_id = Column(Integer, nullable=False, index=True)
+    performer = Column(String, nullable=False)
+    chat_id = Column(Integer, nullable=False)
+    message_id = Column(Integer)
+    status = Column(String, default='sent')  # sent / accepted / declined / withdrawn / expired
+    created_at = Column(DateTime, default=datetime.datetime.utcnow)
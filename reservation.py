@@ -0,0 +1,17 @@
+from core.base import Base
+from sqlalchemy import Column, Integer, String, DateTime, UniqueConstraint
+import datetime
+
+class Reservation(Base):
+    __tablename__ = 'reservations'
+    __table_args__ = (UniqueConstraint('performer', 'slot_date', 'slot_time'),)
+    id = Column(Integer, primary_key=True)
+    performer = Column(String, nullable=False, index=True)
+    slot_date = Column(String, nullable=False)
+    slot_time = Column(String, nullable=False)
+    program = Column(String)
+    user_id = Column(Integer, nullable=False)
+    status = Column(String, default='hold')  # hold / booked
+    order_id = Column(Integer, unique=True)
+    expires_at = Column(DateTime)  # только для hold
+    created_at = Column(DateTime, default=datetime.datetime.utcnow)
@@ -1,5 +1,7 @@
 import logging
 import os
+import asyncio
+from typing import Dict
 from telegram import Update, InlineKeyboardMarkup, InlineKeyboardButton, ReplyKeyboardRemove
 from telegram.ext import (
     ContextTypes, 
@@ -11,7 +13,8 @@ from telegram.ext import (
 from core.config import config, states
 from core.database import db
 from services.notifications import notifier
-from models.support_ticket import SupportTicket  # Импорт модели
+from services.outbound import outbound
+from services.media import media_pipeline
 
 logger = logging.getLogger(__name__)
 
@@ -96,121 +99,21 @@ async def handle_support_confirm(update: Update, context: ContextTypes.DEFAULT_T
                 photo = update.message.photo[-1]
                 file = await photo.get_file()
                 
-                # =====================================================================
-                # ШАГ 1: СКАЧИВАЕМ ФОТО В ПАМЯТЬ И СОЗДАЕМ БАЙТОВЫЙ МАССИВ
-                # =====================================================================
-                photo_bytes = await file.download_as_bytearray()
-                original_size = len(photo_bytes)  # Сохраняем оригинальный размер для логов
+                # Скачивание, сжатие и сохранение выполняются вне event loop
+                stored = await media_pipeline.process_telegram_file(file)
+                photo_sha256, photo_path = stored or (None, None)
                 
-                # =====================================================================
-                # ШАГ 2: СЖАТИЕ ИЗОБРАЖЕНИЯ (ЕСЛИ УСТАНОВЛЕНА BIBLIOTHEK PILLOW)
-                # =====================================================================
-                try:
-                    # Пытаемся импортировать Pillow (если установлен)
-                    from PIL import Image
-                    import io
-                    
-                    # Открываем изображение из байтов
-                    img = Image.open(io.BytesIO(photo_bytes))
-                    
-                    # Уменьшаем размер, если изображение слишком большое
-                    MAX_WIDTH, MAX_HEIGHT = 1920, 1080
-                    if img.width > MAX_WIDTH or img.height > MAX_HEIGHT:
-                        # Сохраняем пропорции
-                        img.thumbnail((MAX_WIDTH, MAX_HEIGHT), Image.LANCZOS)
-                        logger.info(f"Resized image to {img.width}x{img.height}")
-                    
-                    # Конвертируем в JPEG, если это другой формат
-                    if img.format != 'JPEG':
-                        img = img.convert('RGB')
-                    
-                    # Сжимаем с качеством 85%
-                    output_buffer = io.BytesIO()
-                    img.save(output_buffer, format='JPEG', quality=85, optimize=True)
-                    compressed_bytes = output_buffer.getvalue()
-                    
-                    # Используем сжатые байты, если они действительно меньше
-                    if len(compressed_bytes) < original_size:
-                        photo_bytes = compressed_bytes
-                        logger.info(f"Compressed image: {original_size} -> {len(compressed_bytes)} bytes")
-                    else:
-                        logger.info("Compressed image not smaller, using original")
-                        
-                except ImportError:
-                    logger.warning("Pillow not installed, skipping compression")
-                except Exception as compression_error:
-                    logger.warning(f"Image compression failed: {compression_error}")
-                # =====================================================================
-                
-                # =====================================================================
-                # ШАГ 3: СОХРАНЕНИЕ ФОТО (S3 ИЛИ ЛОКАЛЬНО)
-                # =====================================================================
-                photo_path = None
-                
-                # Вариант 1: Загрузка в AWS S3 (если настроены ключи)
-                if config.S3_ENABLED:
-                    try:
-                        import boto3
-                        
-                        # Создаем клиент S3
-                        s3_client = boto3.client(
-                            's3',
-                            region_name=config.S3_REGION,
-                            aws_access_key_id=config.AWS_ACCESS_KEY,
-                            aws_secret_access_key=config.AWS_SECRET_KEY
-                        )
-                        
-                        # Генерируем уникальный ключ для файла
-                        s3_key = f"support/{ticket_id}.jpg"
-                        
-                        # Загружаем напрямую из памяти в S3
-                        s3_client.upload_fileobj(
-                            io.BytesIO(photo_bytes),
-                            config.S3_BUCKET,
-                            s3_key,
-                            ExtraArgs={
-                                'ContentType': 'image/jpeg',
-                                'ACL': 'private'
-                            }
-                        )
-                        
-                        photo_path = s3_key
-                        logger.info(f"Uploaded to S3: s3://{config.S3_BUCKET}/{s3_key}")
-                        
-                    except Exception as s3_error:
-                        logger.error(f"S3 upload failed: {s3_error}")
-                
-                # Вариант 2: Локальное сохранение (если S3 не настроен или произошла ошибка)
-                if not photo_path:
-                    try:
-                        # Создаем директорию для вложений, если ее нет
-                        os.makedirs("support_attachments", exist_ok=True)
-                        file_path = os.path.join("support_attachments", f"{ticket_id}.jpg")
-                        
-                        # Сохраняем файл на диск
-                        with open(file_path, 'wb') as f:
-                            f.write(photo_bytes)
-                        
-                        photo_path = file_path
-                        logger.info(f"Saved locally: {file_path}")
-                        
-                    except Exception as file_error:
-                        logger.error(f"Local file save failed: {file_error}")
-                # =====================================================================
-                
-                # =====================================================================
-                # ШАГ 4: ОБНОВЛЕНИЕ ТИКЕТА В БАЗЕ ДАННЫХ
-                # =====================================================================
+                # file_id позволяет пересылать скриншот операторам без повторной загрузки
+                db.set_ticket_photo(
+                    ticket_id,
+                    photo_path=photo_path,
+                    photo_file_id=photo.file_id,
+                    photo_sha256=photo_sha256
+                )
                 if photo_path:
-                    with db.session_scope() as session:
-                        ticket = session.query(SupportTicket).get(ticket_id)
-                        if ticket:
-                            ticket.photo_path = photo_path
-                            session.commit()
-                            logger.info(f"Updated ticket {ticket_id} with photo path")
+                    logger.info(f"Updated ticket {ticket_id} with photo path")
                 else:
-                    logger.error("Failed to save photo for ticket {ticket_id}")
-                # =====================================================================
+                    logger.error(f"Failed to save photo for ticket {ticket_id}")
             else:
                 logger.warning("Photo message without actual photo")
             
@@ -240,27 +143,61 @@ async def finalize_support_request(context: ContextTypes.DEFAULT_TYPE, ticket_id
         )
         
         # Добавляем информацию о фото
-        if ticket.get('photo_path'):
+        has_photo = bool(ticket.get('photo_file_id') or ticket.get('photo_path'))
+        if has_photo:
             message += "\n\n📸 К сообщению прикреплен скриншот"
         
-        for operator_id in config.SUPPORT_OPERATORS:
-            try:
-                await context.bot.send_message(
-                    chat_id=operator_id,
-                    text=message,
-                    parse_mode="HTML"
-                )
-                
-                # Если есть фото, отправляем его
-                if ticket.get('photo_path'):
-                    with open(ticket['photo_path'], 'rb') as photo_file:
-                        await context.bot.send_photo(
-                            chat_id=operator_id,
-                            photo=photo_file,
-                            caption=f"Скриншот для тикета #{ticket_id}"
-                        )
-            except Exception as e:
-                logger.error(f"Error sending request to operator {operator_id}: {e}")
+        async def send_photo(operator_id):
+            # Тикет перечитывается: file_id мог сохраниться после отправки другому оператору
+            await send_ticket_photo(context.bot, operator_id, db.get_support_ticket(ticket_id) or ticket)
+        
+        # Тикеты копятся в сводку оператора; скриншот отправляется следом за ней
+        await asyncio.gather(*[
+            notifier.digest.add(
+                context.bot, operator_id, message, parse_mode="HTML",
+                followup=(lambda op=operator_id: send_photo(op)) if has_photo else None
+            )
+            for operator_id in config.SUPPORT_OPERATORS
+        ])
         
     except Exception as e:
-        logger.error(f"Error in finalize_support_request: {e}", exc_info=True)
\ No newline at end of file
+        logger.error(f"Error in finalize_support_request: {e}", exc_info=True)
+
+# Первая загрузка скриншота тикета: остальные получатели ждут ее file_id
+_photo_uploads: Dict[int, asyncio.Lock] = {}
+
+async def send_ticket_photo(bot, chat_id: int, ticket: dict):
+    """
+    Отправляет скриншот тикета. Повторно используется file_id Telegram,
+    файл загружается только если file_id еще неизвестен (и file_id сохраняется).
+    Одновременные отправки одного тикета ждут первую загрузку, а не загружают файл сами.
+    """
+    caption = f"Скриншот для тикета #{ticket['id']}"
+    if not ticket.get('photo_file_id'):
+        lock = _photo_uploads.setdefault(ticket['id'], asyncio.Lock())
+        try:
+            async with lock:
+                # Пока ждали, файл мог загрузить другой получатель
+                stored = db.get_support_ticket(ticket['id'])
+                if stored and stored.get('photo_file_id'):
+                    ticket['photo_file_id'] = stored['photo_file_id']
+                else:
+                    return await _upload_ticket_photo(bot, chat_id, ticket, caption)
+        finally:
+            if _photo_uploads.get(ticket['id']) is lock:
+                _photo_uploads.pop(ticket['id'])
+    return await outbound.send(bot, "send_photo", chat_id, photo=ticket['photo_file_id'], caption=caption)
+
+async def _upload_ticket_photo(bot, chat_id: int, ticket: dict, caption: str):
+    if not ticket.get('photo_path') or not os.path.exists(ticket['photo_path']):
+        logger.warning(f"Photo for ticket {ticket['id']} is not available")
+        return None
+    
+    loop = asyncio.get_running_loop()
+    with open(ticket['photo_path'], 'rb') as photo_file:
+        photo_bytes = await loop.run_in_executor(None, photo_file.read)
+    sent = await outbound.send(bot, "send_photo", chat_id, photo=photo_bytes, caption=caption)
+    if sent and sent.photo:
+        ticket['photo_file_id'] = sent.photo[-1].file_id
+        db.set_ticket_photo(ticket['id'], photo_file_id=ticket['photo_file_id'])
+    return sent
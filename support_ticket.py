@@ -9,6 +9,8 @@ class SupportTicket(Base):
     user_name = Column(String)  # Может быть NULL
     username = Column(String)   # Может быть NULL
     message = Column(String, nullable=False)
-    created_at = Column(DateTime, default=datetime.datetime.utcnow)
+    created_at = Column(DateTime, default=datetime.datetime.utcnow, index=True)
     resolved = Column(Boolean, default=False)
-    photo_path = Column(String) 
\ No newline at end of file
+    photo_path = Column(String) 
+    photo_file_id = Column(String)  # file_id Telegram для повторной отправки без загрузки
+    photo_sha256 = Column(String(64), index=True)  # ссылка на attachments.sha256
\ No newline at end of file
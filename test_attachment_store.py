@@ -0,0 +1,105 @@
+# test_attachment_store.py
+# Хранилище вложений: сборщик мусора не удаляет вложение, на которое снова
+# сослались после выбора кандидатов, и убирает скриншоты старого формата.
+import os
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+os.environ.setdefault("DATABASE_NAME", os.path.join(tempfile.mkdtemp(), "attachments_test.db"))
+
+from core.database import db
+from models.attachment import Attachment
+from models.support_ticket import SupportTicket
+from services.attachment_store import AttachmentStore
+
+
+def write_file(path: str, content: bytes) -> str:
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'wb') as f:
+        f.write(content)
+    return path
+
+
+def orphan(store: AttachmentStore, content: bytes) -> str:
+    """Вложение без ссылок, осиротевшее два часа назад"""
+    sha256, _ = store.acquire(write_file(os.path.join(tempfile.mkdtemp(), "upload"), content))
+    store.release(sha256)
+    with db.session_scope() as session:
+        session.get(Attachment, sha256).orphaned_at = datetime.utcnow() - timedelta(hours=2)
+    return sha256
+
+
+class RacingStore(AttachmentStore):
+    """acquire того же файла успевает между выбором кандидатов и их удалением"""
+
+    def __init__(self, root: str, reacquire: bytes):
+        super().__init__(root)
+        self.reacquire = None
+        self.pending = reacquire
+
+    def _lock_for(self, sha256):
+        if self.reacquire is not None:
+            content, self.reacquire = self.reacquire, None
+            self.acquire(write_file(os.path.join(tempfile.mkdtemp(), "upload"), content))
+        return super()._lock_for(sha256)
+
+    def collect_garbage(self, *args, **kwargs):
+        self.reacquire, self.pending = self.pending, None
+        return super().collect_garbage(*args, **kwargs)
+
+
+def test_garbage_collection_skips_reacquired_attachment():
+    root = tempfile.mkdtemp()
+    content = os.urandom(2048)
+    store = RacingStore(root, reacquire=content)
+    sha256 = orphan(store, content)
+    path = store.local_path(sha256)
+
+    assert store.collect_garbage() == 0
+    assert os.path.exists(path)
+    with db.session_scope() as session:
+        attachment = session.get(Attachment, sha256)
+        assert attachment.refcount == 1 and attachment.orphaned_at is None
+
+    # Без гонки осиротевшее вложение удаляется вместе с файлом
+    other = orphan(store, os.urandom(2048))
+    assert store.collect_garbage() == 1
+    assert not os.path.exists(store.local_path(other))
+    with db.session_scope() as session:
+        assert session.get(Attachment, other) is None
+
+
+def test_legacy_photos_are_swept_by_age():
+    root = tempfile.mkdtemp()
+    store = AttachmentStore(root)
+    old_ticket = db.create_support_ticket(user_id=1, message="old")
+    new_ticket = db.create_support_ticket(user_id=1, message="new")
+    old_path = write_file(os.path.join(root, f"{old_ticket}.jpg"), b"old")
+    new_path = write_file(os.path.join(root, f"{new_ticket}.jpg"), b"new")
+    with db.session_scope() as session:
+        ticket = session.get(SupportTicket, old_ticket)
+        ticket.photo_path = old_path
+        ticket.created_at = datetime.utcnow() - timedelta(days=40)
+        session.get(SupportTicket, new_ticket).photo_path = new_path
+
+    stale = time.time() - 40 * 86400
+    # Файл без тикета (тикет давно удален) и свежее вложение в шардах
+    stray = write_file(os.path.join(root, "999999.jpg"), b"stray")
+    os.utime(stray, (stale, stale))
+    os.utime(new_path, (stale, stale))
+    sha256, sharded = store.acquire(write_file(os.path.join(tempfile.mkdtemp(), "upload"), os.urandom(512)))
+
+    assert store.sweep_legacy(max_age_days=30) == 2
+    assert not os.path.exists(old_path) and not os.path.exists(stray)
+    assert os.path.exists(new_path)  # тикет свежий, хотя файл старый
+    assert os.path.exists(sharded)
+    with db.session_scope() as session:
+        assert session.get(SupportTicket, old_ticket).photo_path is None
+        assert session.get(SupportTicket, new_ticket).photo_path == new_path
+
+
+if __name__ == "__main__":
+    test_garbage_collection_skips_reacquired_attachment()
+    test_legacy_photos_are_swept_by_age()
+    print("✅ Attachment store test passed!")
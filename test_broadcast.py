@@ -0,0 +1,89 @@
+# test_broadcast.py
+# Рассылка: после падения процесса захваченные, но не подтвержденные получатели
+# не получают сообщение повторно и учитываются; текст команды может идти с новой строки.
+import asyncio
+import os
+import tempfile
+import types
+
+os.environ.setdefault("DATABASE_NAME", os.path.join(tempfile.mkdtemp(), "broadcast_test.db"))
+
+from core.config import config
+from core.database import db
+from handlers import admin_handlers
+from models.broadcast_campaign import BroadcastDelivery
+from services import broadcast
+from services.outbound import outbound
+
+
+class FakeBot:
+    def __init__(self):
+        self.sent = []
+
+    async def send_message(self, chat_id, text, **kwargs):
+        self.sent.append(chat_id)
+
+
+def test_resume_does_not_resend_stale_claims():
+    for user_id in range(70_001, 70_011):
+        db.save_order({'user_id': user_id, 'order_date': "01.01.2032", 'order_time': "12:00"})
+    campaign_id = db.create_broadcast("Новогодняя акция", created_by=1)
+
+    # Процесс упал после захвата порции, не дойдя до контрольной точки
+    crashed = db.claim_broadcast_batch(campaign_id, limit=4)
+    assert len(crashed) == 4
+
+    bot = FakeBot()
+
+    async def scenario():
+        await broadcast.run_broadcast(bot, campaign_id)
+        await outbound.stop()
+
+    asyncio.run(scenario())
+    # В общей базе тестов есть и другие клиенты — они тоже получают рассылку
+    assert set(range(70_001, 70_011)) - set(crashed) <= set(bot.sent)
+    assert not set(crashed) & set(bot.sent)
+
+    campaign = db.get_broadcast(campaign_id)
+    assert campaign['status'] == 'done'
+    assert campaign['sent'] == len(bot.sent) and campaign['failed'] == 4
+    with db.session_scope() as session:
+        statuses = dict(session.query(BroadcastDelivery.user_id, BroadcastDelivery.status)
+                        .filter_by(campaign_id=campaign_id))
+    assert all(statuses[user_id] == 'unknown' for user_id in crashed)
+    assert db.expire_broadcast_claims(campaign_id) == 0
+
+
+def test_broadcast_text_on_next_line():
+    replies, started = [], []
+
+    class Message:
+        def __init__(self, text):
+            self.text = text
+
+        async def reply_text(self, text, **kwargs):
+            replies.append(text)
+            return types.SimpleNamespace(chat_id=1, message_id=len(replies))
+
+    admins, config.ADMIN_IDS = config.ADMIN_IDS, [1]
+    start, broadcast.start_broadcast = broadcast.start_broadcast, lambda app, campaign_id: started.append(campaign_id)
+    try:
+        update = types.SimpleNamespace(effective_user=types.SimpleNamespace(id=1),
+                                       message=Message("/broadcast\nСкидки до конца недели"))
+        context = types.SimpleNamespace(application=None)
+        asyncio.run(admin_handlers.broadcast_command(update, context))
+        assert len(started) == 1
+        assert db.get_broadcast(started[0])['message'] == "Скидки до конца недели"
+
+        update.message = Message("/broadcast")
+        asyncio.run(admin_handlers.broadcast_command(update, context))
+        assert replies[-1].startswith("Использование") and len(started) == 1
+    finally:
+        config.ADMIN_IDS = admins
+        broadcast.start_broadcast = start
+
+
+if __name__ == "__main__":
+    test_resume_does_not_resend_stale_claims()
+    test_broadcast_text_on_next_line()
+    print("✅ Broadcast test passed!")
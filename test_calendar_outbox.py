@@ -0,0 +1,364 @@
+# test_calendar_outbox.py
+# Проверка calendar_outbox против локальной заглушки Google Calendar API:
+# пачки, идемпотентность (409), повтор с backoff и удаление.
+import json
+import os
+import re
+import tempfile
+import threading
+from datetime import datetime, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+os.environ.setdefault("DATABASE_NAME", os.path.join(tempfile.mkdtemp(), "calendar_test.db"))
+
+import httplib2
+from googleapiclient.discovery import build
+
+from core.database import db
+from models.calendar_outbox import CalendarOutbox
+from models.performer import Performer
+from services import calendar_sync, google_calendar
+from services.assignment import pick_performers
+
+
+class FakeCalendar:
+    """Минимальная имитация Calendar API: календарь на каждого исполнителя, batch и syncToken"""
+
+    def __init__(self):
+        self.calendars = {}
+        self.version = 0
+        self.batches = 0
+        self.list_calls = 0
+        self.fail_next = 0  # сколько следующих batch-запросов вернуть с 503
+        self.expire_tokens = False
+        self.lock = threading.Lock()
+
+    def events(self, user_id):
+        return self.calendars.setdefault(int(user_id), {})
+
+    def touch(self, event):
+        self.version += 1
+        event["_seq"] = self.version
+
+    @staticmethod
+    def public(event):
+        return {k: v for k, v in event.items() if not k.startswith("_")}
+
+    def handle_part(self, method, path, body):
+        match = re.search(r"^/(\d+)/calendar/v3/freeBusy", path)
+        if match:
+            busy = [
+                {"start": e["start"]["dateTime"], "end": e["end"]["dateTime"]}
+                for e in self.events(match.group(1)).values() if e["status"] != "cancelled"
+            ]
+            return 200, {"kind": "calendar#freeBusy", "calendars": {"primary": {"busy": busy}}}
+        match = re.search(r"^/(\d+)/calendar/v3/calendars/primary/events(?:/([^/?]+))?", path)
+        events, event_id = self.events(match.group(1)), match.group(2)
+        if method == "POST":
+            event = json.loads(body)
+            if event["id"] in events:
+                return 409, {"error": {"code": 409, "message": "The requested identifier already exists."}}
+            event.setdefault("status", "confirmed")
+            events[event["id"]] = event
+            self.touch(event)
+            return 200, self.public(event)
+        if method == "PATCH":
+            if event_id not in events:
+                return 404, {"error": {"code": 404, "message": "Not Found"}}
+            events[event_id].update(json.loads(body))
+            self.touch(events[event_id])
+            return 200, self.public(events[event_id])
+        if method == "DELETE":
+            event = events.get(event_id)
+            if not event or event["status"] == "cancelled":
+                return 410, {"error": {"code": 410, "message": "Deleted"}}
+            event["status"] = "cancelled"
+            self.touch(event)
+            return 204, None
+        return 400, {"error": {"code": 400, "message": "Bad request"}}
+
+    def list(self, path, query):
+        self.list_calls += 1
+        if query.get("syncToken") and self.expire_tokens:
+            self.expire_tokens = False
+            return 410, {"error": {"code": 410, "message": "Sync token is no longer valid"}}
+        since = int(query.get("syncToken", 0))
+        events = self.events(re.search(r"^/(\d+)/", path).group(1))
+        items = [self.public(e) for e in events.values() if e["_seq"] > since]
+        return 200, {"items": items, "nextSyncToken": str(self.version)}
+
+
+def make_server(calendar: FakeCalendar):
+    class Handler(BaseHTTPRequestHandler):
+        def log_message(self, *args):
+            pass
+
+        def do_GET(self):
+            url = urlparse(self.path)
+            query = {k: v[0] for k, v in parse_qs(url.query).items()}
+            with calendar.lock:
+                status, response = calendar.list(url.path, query)
+            data = json.dumps(response).encode()
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json; charset=UTF-8")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def do_POST(self):
+            length = int(self.headers["Content-Length"])
+            payload = self.rfile.read(length).decode()
+            with calendar.lock:
+                calendar.batches += 1
+                if calendar.fail_next:
+                    calendar.fail_next -= 1
+                    self.send_response(503)
+                    self.send_header("Content-Length", "0")
+                    self.end_headers()
+                    return
+
+                boundary = re.search(r'boundary="?([^";]+)"?', self.headers["Content-Type"]).group(1)
+                payload = payload.replace("\r\n", "\n")
+                parts = [p for p in payload.split(f"--{boundary}") if "Content-ID" in p]
+                out_boundary = "batch_response"
+                chunks = []
+                for part in parts:
+                    content_id = re.search(r"Content-ID: <(.+?)>", part).group(1)
+                    request = part.split("\n\n", 1)[1]
+                    request_line, rest = request.split("\n", 1)
+                    method, path, _ = request_line.split(" ")
+                    body = rest.split("\n\n", 1)[1] if "\n\n" in rest else ""
+                    status, response = calendar.handle_part(method, path, body.strip())
+                    response_body = json.dumps(response) if response is not None else ""
+                    chunks.append(
+                        f"--{out_boundary}\r\n"
+                        "Content-Type: application/http\r\n"
+                        f"Content-ID: <response-{content_id}>\r\n\r\n"
+                        f"HTTP/1.1 {status} X\r\n"
+                        "Content-Type: application/json; charset=UTF-8\r\n\r\n"
+                        f"{response_body}\r\n"
+                    )
+                data = ("".join(chunks) + f"--{out_boundary}--\r\n").encode()
+
+            self.send_response(200)
+            self.send_header("Content-Type", f"multipart/mixed; boundary={out_boundary}")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+calendar = FakeCalendar()
+server = make_server(calendar)
+base_url = f"http://127.0.0.1:{server.server_port}"
+worker = calendar_sync.CalendarSyncWorker(
+    service_factory=lambda user_id: build(
+        "calendar", "v3",
+        http=httplib2.Http(),
+        static_discovery=True,
+        client_options={"api_endpoint": f"{base_url}/{user_id}/calendar/v3/"}
+    ),
+    batch_uri=f"{base_url}/batch/calendar/v3",
+    batch_size=50
+)
+
+PERFORMERS = {777: "Календарный Исполнитель", 778: "Второй Исполнитель"}
+with db.session_scope() as session:
+    for user_id, name in PERFORMERS.items():
+        if not session.query(Performer).filter_by(telegram_user_id=user_id).first():
+            session.add(Performer(performer_name=name, telegram_user_id=user_id, google_tokens="{}"))
+
+
+def _make_orders(count, month):
+    # Один заказ в день, чтобы интервалы исполнителя не пересекались
+    return [
+        db.save_order({
+            'user_id': 100 + i,
+            'user_name': f"Клиент {i}",
+            'order_date': f"{i + 1:02d}.{month:02d}.2031",
+            'order_time': "12:00",
+            'order_location': "Тестовый адрес",
+            'order_performers': "Календарный Исполнитель",
+            'order_program': "Тесла шоу",
+        })
+        for i in range(count)
+    ]
+
+
+def _drain():
+    while worker.process_due():
+        pass
+
+
+def _row(order_id):
+    with db.session_scope() as session:
+        row = session.query(CalendarOutbox).filter_by(order_id=order_id).order_by(CalendarOutbox.id.desc()).first()
+        return {c.name: getattr(row, c.name) for c in row.__table__.columns}
+
+
+def test_inserts_are_batched_and_idempotent():
+    order_ids = _make_orders(10, 1)
+    for order_id in order_ids:
+        calendar_sync.enqueue(order_id, 'insert')
+        calendar_sync.enqueue(order_id, 'update')  # схлопывается с insert
+
+    batches_before = calendar.batches
+    _drain()
+    assert calendar.batches - batches_before == 1
+    assert all(_row(o)['status'] == 'done' for o in order_ids)
+    assert len(calendar.events(777)) == len(order_ids)
+
+    # Повторная вставка того же заказа не создает дубликат (409 -> patch)
+    count = len(calendar.events(777))
+    calendar_sync.enqueue(order_ids[0], 'insert')
+    _drain()
+    assert len(calendar.events(777)) == count
+    assert _row(order_ids[0])['status'] == 'done'
+
+
+def test_transient_failure_is_retried_with_backoff():
+    order_id = _make_orders(1, 2)[0]
+    calendar_sync.enqueue(order_id, 'insert')
+    calendar.fail_next = 1
+    _drain()
+    row = _row(order_id)
+    assert row['status'] == 'pending' and row['attempts'] == 1
+    assert row['next_attempt_at'] > datetime.utcnow()
+
+    with db.session_scope() as session:
+        session.get(CalendarOutbox, row['id']).next_attempt_at = datetime.utcnow() - timedelta(seconds=1)
+    _drain()
+    assert _row(order_id)['status'] == 'done'
+
+
+def test_cancelled_order_is_deleted_once():
+    order_id = _make_orders(1, 3)[0]
+    calendar_sync.sync_order(order_id)
+    _drain()
+    event_id = _row(order_id)['event_id']
+    assert calendar.events(777)[event_id]['status'] == 'confirmed'
+
+    db.update_order_status(order_id, 'cancelled')
+    calendar_sync.sync_order(order_id)
+    _drain()
+    assert calendar.events(777)[event_id]['status'] == 'cancelled'
+    calendar_sync.enqueue(order_id, 'delete')  # повторное удаление -> 410 -> done
+    _drain()
+    assert _row(order_id)['status'] == 'done'
+    assert db.get_order(order_id)['calendar_event_id'] is None
+
+
+def test_reschedule_and_reassignment_follow_the_order():
+    order_id = _make_orders(1, 4)[0]
+    calendar_sync.sync_order(order_id)
+    _drain()
+    event_id = google_calendar.event_id_for(order_id)
+
+    db.update_order_time(order_id, "18:00")
+    calendar_sync.sync_order(order_id)
+    _drain()
+    assert calendar.events(777)[event_id]['start']['dateTime'].endswith("T18:00:00")
+
+    # Исполнитель отказался: событие уходит из его календаря и появляется у нового
+    db.update_order_status(order_id, 'reassigning')
+    calendar_sync.sync_order(order_id)
+    _drain()
+    assert calendar.events(777)[event_id]['status'] == 'cancelled'
+    assert db.claim_order(order_id, PERFORMERS[778])
+    calendar_sync.sync_order(order_id)
+    _drain()
+    assert calendar.events(778)[event_id]['status'] == 'confirmed'
+    assert calendar.events(777)[event_id]['status'] == 'cancelled'
+
+
+def test_reconciliation_fixes_drift_with_incremental_sync():
+    worker.reconcile()
+    _drain()
+    calls = calendar.list_calls
+    assert worker.reconcile() == 0
+    assert calendar.list_calls - calls == len(PERFORMERS)  # один запрос на календарь
+
+    moved, deleted = _make_orders(2, 5)
+    for order_id in (moved, deleted):
+        calendar_sync.sync_order(order_id)
+    _drain()
+    worker.reconcile()
+
+    # Правки вручную в Google Calendar
+    with calendar.lock:
+        event = calendar.events(777)[google_calendar.event_id_for(moved)]
+        event['start']['dateTime'] = "2031-05-01T20:00:00+03:00"
+        calendar.touch(event)
+        event = calendar.events(777)[google_calendar.event_id_for(deleted)]
+        event['status'] = 'cancelled'
+        calendar.touch(event)
+
+    assert worker.reconcile() == 2
+    _drain()
+    assert calendar.events(777)[google_calendar.event_id_for(moved)]['start']['dateTime'].endswith("T12:00:00")
+    assert calendar.events(777)[google_calendar.event_id_for(deleted)]['status'] == 'confirmed'
+
+    # Устаревший syncToken -> полная синхронизация без лишних исправлений
+    calendar.expire_tokens = True
+    assert worker.reconcile() == 0
+
+
+def test_free_busy_import_blocks_private_engagements():
+    name = PERFORMERS[777]
+    day = (datetime.now() + timedelta(days=3)).strftime("%d.%m.%Y")
+    iso_day = datetime.strptime(day, "%d.%m.%Y").strftime("%Y-%m-%d")
+    order_id = db.save_order({
+        'user_id': 900,
+        'order_date': day,
+        'order_time': "12:00",
+        'order_performers': name,
+        'order_program': "Тесла шоу",
+    })
+    calendar_sync.sync_order(order_id)
+    _drain()
+
+    # Личное событие исполнителя 16:00-17:00 по Москве
+    with calendar.lock:
+        private = {
+            "id": "private1", "status": "confirmed",
+            "start": {"dateTime": f"{iso_day}T13:00:00Z"},
+            "end": {"dateTime": f"{iso_day}T14:00:00Z"},
+        }
+        calendar.events(777)["private1"] = private
+        calendar.touch(private)
+
+    batches = calendar.batches
+    assert worker.refresh_busy() == len(PERFORMERS)
+    assert calendar.batches - batches == 1  # все исполнители одним batch-запросом
+
+    assert not db.is_performer_available(name, day, "15:00")
+    assert db.is_performer_available(name, day, "19:00")
+    assert name not in pick_performers(day, "15:00")
+    assert db.hold_slot(name, day, "15:00", 901) is None
+
+    # Своя бронь бота вычтена из free/busy: после отмены слот свободен сразу
+    db.update_order_status(order_id, 'cancelled')
+    assert db.is_performer_available(name, day, "12:00")
+
+    # Устаревшие данные free/busy не блокируют запись
+    ttl = db.schedule.external.ttl
+    db.schedule.external.ttl = timedelta(0)
+    db.availability_cache.clear()
+    try:
+        assert db.is_performer_available(name, day, "15:00")
+    finally:
+        db.schedule.external.ttl = ttl
+
+
+if __name__ == "__main__":
+    test_inserts_are_batched_and_idempotent()
+    test_transient_failure_is_retried_with_backoff()
+    test_cancelled_order_is_deleted_once()
+    test_reschedule_and_reassignment_follow_the_order()
+    test_reconciliation_fixes_drift_with_incremental_sync()
+    test_free_busy_import_blocks_private_engagements()
+    print("✅ Calendar outbox test passed!")
@@ -0,0 +1,73 @@
+# test_digest.py
+# Сводки уведомлений: некритичные события копятся по получателю и уходят
+# одним сообщением, срочные идут сразу, длинные сводки делятся по пределу Telegram.
+import asyncio
+
+from services.notifications import DigestBuffer, MAX_MESSAGE_LENGTH
+from services.outbound import outbound
+
+
+class FakeBot:
+    def __init__(self):
+        self.sent = []
+
+    async def send_message(self, chat_id, text, **kwargs):
+        self.sent.append((chat_id, text))
+
+
+def test_events_coalesce_per_recipient_and_urgent_bypasses():
+    bot = FakeBot()
+    digest = DigestBuffer(window=0.2, max_items=50)
+
+    async def scenario():
+        for i in range(3):
+            await digest.add(bot, 101, f"Новый заказ #{i}")
+        await digest.add(bot, 102, "Заказ на сегодня!", urgent=True)
+        assert bot.sent == [(102, "Заказ на сегодня!")]
+        assert digest.pending(101) == 3
+        await asyncio.sleep(0.3)
+        await outbound.stop()
+
+    asyncio.run(scenario())
+    assert len(bot.sent) == 2
+    chat_id, text = bot.sent[1]
+    assert chat_id == 101 and "событий — 3" in text
+    assert all(f"Новый заказ #{i}" in text for i in range(3))
+
+
+def test_full_buffer_flushes_early_and_runs_followups():
+    bot = FakeBot()
+    digest = DigestBuffer(window=60, max_items=2)
+    photos = []
+
+    async def photo():
+        photos.append(len(bot.sent))  # скриншот — после сводки
+
+    async def scenario():
+        await digest.add(bot, 201, "Тикет #1", followup=photo)
+        await digest.add(bot, 201, "Тикет #2")
+        await digest.add(bot, 202, "Тикет #3")
+        await digest.flush_all()  # остановка бота: одиночное событие уходит как есть
+        await outbound.stop()
+
+    asyncio.run(scenario())
+    assert [chat for chat, _ in bot.sent] == [201, 202]
+    assert "Тикет #1" in bot.sent[0][1] and "Тикет #2" in bot.sent[0][1]
+    assert bot.sent[1] == (202, "Тикет #3")
+    assert photos == [1]
+
+
+def test_long_digest_is_split():
+    texts = [f"Заказ #{i}: " + "x" * 900 for i in range(10)]
+    messages = DigestBuffer.render(texts)
+    assert len(messages) > 1
+    assert all(len(m) <= MAX_MESSAGE_LENGTH for m in messages)
+    assert sum(m.count("Заказ #") for m in messages) == 10
+    assert messages[0].startswith(f"📬 Сводка (1/{len(messages)})")
+
+
+if __name__ == "__main__":
+    test_events_coalesce_per_recipient_and_urgent_bypasses()
+    test_full_buffer_flushes_early_and_runs_followups()
+    test_long_digest_is_split()
+    print("✅ Digest test passed!")
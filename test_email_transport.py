@@ -0,0 +1,137 @@
+# test_email_transport.py
+# Пул SMTP-сессий и пакетная отправка против локального aiosmtpd-сервера.
+import asyncio
+import socket
+from email.mime.text import MIMEText
+
+import pytest
+
+# Тестовая зависимость из requirements-dev.txt
+Controller = pytest.importorskip("aiosmtpd.controller").Controller
+
+from services.email_transport import EmailTransport
+
+
+class Sink:
+    def __init__(self):
+        self.messages = []
+
+    async def handle_RCPT(self, server, session, envelope, address, rcpt_options):
+        if address.startswith("bad"):
+            return "550 5.1.1 No such user"
+        envelope.rcpt_tos.append(address)
+        return "250 OK"
+
+    async def handle_DATA(self, server, session, envelope):
+        self.messages.append(envelope)
+        return "250 OK"
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def start_server(port: int) -> Controller:
+    controller = Controller(Sink(), hostname="127.0.0.1", port=port, auth_require_tls=False)
+    controller.start()
+    return controller
+
+
+def make_message(i: int) -> MIMEText:
+    msg = MIMEText(f"<b>Заказ #{i}</b>", "html")
+    msg["Subject"] = f"Заказ #{i}"
+    msg["From"] = "bot@example.com"
+    msg["To"] = f"client{i}@example.com"
+    return msg
+
+
+def make_transport(port: int) -> EmailTransport:
+    return EmailTransport(host="127.0.0.1", port=port, user="", password="", pool_size=2, batch_size=10)
+
+
+def test_batches_reuse_pooled_sessions():
+    port = free_port()
+    server = start_server(port)
+    transport = make_transport(port)
+
+    async def scenario():
+        results = await asyncio.gather(*(transport.send(make_message(i)) for i in range(50)))
+        await transport.stop()
+        return results
+
+    try:
+        assert all(asyncio.run(scenario()))
+    finally:
+        server.stop()
+    assert len(server.handler.messages) == 50
+    assert transport.sent == 50 and transport.failed == 0
+    assert transport.pool.connects <= transport.pool_size  # не по соединению на письмо
+
+
+def test_reconnects_after_server_restart():
+    port = free_port()
+    server = start_server(port)
+    transport = make_transport(port)
+
+    async def scenario():
+        nonlocal server
+        assert await transport.send(make_message(1))
+        # Сервер разорвал все сессии; пул об этом еще не знает
+        server.stop()
+        server = start_server(port)
+        ok = await transport.send(make_message(2))
+        await transport.stop()
+        return ok
+
+    try:
+        assert asyncio.run(scenario())
+    finally:
+        server.stop()
+    assert [env.rcpt_tos for env in server.handler.messages] == [["client2@example.com"]]
+    assert transport.pool.connects == 2
+
+
+def test_refused_recipient_does_not_drop_rest_of_batch():
+    port = free_port()
+    server = start_server(port)
+    # Одна сессия: все письма идут одной пачкой по одному соединению
+    transport = EmailTransport(host="127.0.0.1", port=port, user="", password="", pool_size=1, batch_size=10)
+    messages = [make_message(i) for i in range(4)]
+    messages[1].replace_header("To", "bad@example.com")
+
+    async def scenario():
+        results = await asyncio.gather(*(transport.send(msg) for msg in messages))
+        await transport.stop()
+        return results
+
+    try:
+        assert asyncio.run(scenario()) == [True, False, True, True]
+    finally:
+        server.stop()
+    delivered = [env.rcpt_tos for env in server.handler.messages]
+    assert delivered == [["client0@example.com"], ["client2@example.com"], ["client3@example.com"]]
+    assert transport.sent == 3 and transport.failed == 1
+    # Отказ по получателю — не обрыв: сессия не переоткрывалась
+    assert transport.pool.connects == 1
+
+
+def test_unreachable_server_fails_fast():
+    transport = make_transport(free_port())
+
+    async def scenario():
+        results = await asyncio.gather(*(transport.send(make_message(i)) for i in range(5)))
+        await transport.stop()
+        return results
+
+    assert not any(asyncio.run(scenario()))
+    assert transport.failed == 5
+
+
+if __name__ == "__main__":
+    test_batches_reuse_pooled_sessions()
+    test_reconnects_after_server_restart()
+    test_refused_recipient_does_not_drop_rest_of_batch()
+    test_unreachable_server_fails_fast()
+    print("✅ Email transport test passed!")
@@ -0,0 +1,115 @@
+# test_logging_setup.py
+# Логирование через очередь: JSON с контекстом обновления, выборка шумных
+# логгеров и отбрасывание записей вместо блокировки при переполнении очереди.
+import json
+import logging
+import os
+import tempfile
+import threading
+
+os.environ.setdefault("DATABASE_NAME", os.path.join(tempfile.mkdtemp(), "logging_test.db"))
+
+from core import logging_setup
+from core.tracing import tracer
+
+
+class Lines(logging.Handler):
+    def __init__(self, gate: threading.Event = None):
+        super().__init__()
+        self.lines = []
+        self.gate = gate
+
+    def emit(self, record):
+        if self.gate is not None:
+            self.gate.wait(5)
+        self.lines.append(self.format(record))
+
+
+def _setup(handler, **env):
+    saved = {key: os.environ.get(key) for key in env}
+    os.environ.update(env)
+    try:
+        logging_setup.setup_logging(handlers=[handler])
+    finally:
+        for key, value in saved.items():
+            if value is None:
+                os.environ.pop(key, None)
+            else:
+                os.environ[key] = value
+
+
+class FakeUser:
+    id = 42
+
+
+class FakeUpdate:
+    update_id = 1001
+    effective_user = FakeUser()
+
+
+def test_json_lines_carry_update_context():
+    handler = Lines()
+    _setup(handler, LOG_FORMAT="json", LOG_SAMPLE_RATES="")
+    log = logging.getLogger("bot.test_json")
+    try:
+        trace, token = tracer.start("order:ASK_DATE", "handler", FakeUpdate())
+        log.info("inside %s", "handler", extra={"sql": "SELECT ?"})
+        try:
+            raise ValueError("boom")
+        except ValueError:
+            log.exception("failed")
+        tracer.finish(trace, token)
+        log.info("outside")
+    finally:
+        logging_setup.stop_logging()
+
+    entries = [json.loads(line) for line in handler.lines if '"bot.test_json"' in line]
+    inside, failed, outside = entries
+    assert inside["message"] == "inside handler"
+    assert inside["level"] == "INFO"
+    assert inside["update_id"] == 1001 and inside["user_id"] == 42
+    assert inside["state"] == "order:ASK_DATE"
+    assert inside["sql"] == "SELECT ?"
+    assert "ValueError: boom" in failed["exc"]
+    assert "update_id" not in outside and "state" not in outside
+
+
+def test_sampling_keeps_every_nth_below_warning():
+    handler = Lines()
+    _setup(handler, LOG_FORMAT="text", LOG_SAMPLE_RATES='{"bot.noisy": 5}')
+    try:
+        for i in range(10):
+            logging.getLogger("bot.noisy.send").info(f"sent {i}")
+        logging.getLogger("bot.noisy").warning("rate limited")
+        logging.getLogger("bot.quiet").info("kept")
+    finally:
+        logging_setup.stop_logging()
+
+    sent = [line for line in handler.lines if "sent" in line]
+    assert len(sent) == 2 and sent[0].endswith("sent 0") and sent[1].endswith("sent 5")
+    assert any("rate limited" in line for line in handler.lines)
+    assert any(line.endswith("kept") for line in handler.lines)
+
+
+def test_full_queue_drops_instead_of_blocking():
+    gate = threading.Event()
+    handler = Lines(gate)
+    _setup(handler, LOG_FORMAT="text", LOG_QUEUE_SIZE="3", LOG_SAMPLE_RATES="")
+    log = logging.getLogger("bot.test_queue")
+    try:
+        for i in range(50):
+            log.warning(f"record {i}")  # писатель занят — вызовы не ждут его
+        stats = logging_setup.stats()
+        assert stats["dropped"] >= 40
+        assert stats["queued"] <= 3
+    finally:
+        gate.set()
+        logging_setup.stop_logging()
+    assert 1 <= len([line for line in handler.lines if "record" in line]) <= 10
+
+
+if __name__ == "__main__":
+    test_json_lines_carry_update_context()
+    test_sampling_keeps_every_nth_below_warning()
+    test_full_queue_drops_instead_of_blocking()
+    print("✅ Logging setup test passed!")
@@ -0,0 +1,121 @@
+# test_metrics.py
+# Метрики: формат Prometheus, обертки обработчиков, время SQL, попадания в кэши,
+# процессные метрики psutil и HTTP-эндпоинт.
+import asyncio
+import os
+import socket
+import tempfile
+import time
+import urllib.request
+
+os.environ.setdefault("DATABASE_NAME", os.path.join(tempfile.mkdtemp(), "metrics_test.db"))
+
+from telegram.ext import ApplicationBuilder, CommandHandler, ConversationHandler, MessageHandler, filters
+
+from core import metrics
+from core.database import db
+
+
+def test_histogram_and_counter_exposition():
+    registry = metrics.MetricsRegistry()
+    requests = registry.counter("demo_requests_total", "Demo requests")
+    latency = registry.histogram("demo_seconds", "Demo latency", buckets=(0.1, 1.0))
+    requests.inc(kind='a"b')
+    requests.inc(2, kind='a"b')
+    for value in (0.05, 0.5, 0.5, 3.0):
+        latency.observe(value, handler="x")
+    text = registry.render()
+    assert 'demo_requests_total{kind="a\\"b"} 3' in text
+    assert 'demo_seconds_bucket{handler="x",le="0.1"} 1' in text
+    assert 'demo_seconds_bucket{handler="x",le="1.0"} 3' in text
+    assert 'demo_seconds_bucket{handler="x",le="+Inf"} 4' in text
+    assert 'demo_seconds_count{handler="x"} 4' in text
+    assert latency.quantile(0.5, handler="x") == 1.0
+
+
+def test_handlers_are_instrumented():
+    async def hello(update, context):
+        return "ok"
+
+    async def broken(update, context):
+        raise RuntimeError("boom")
+
+    application = ApplicationBuilder().token("1:x").build()
+    application.add_handler(CommandHandler("hello", hello))
+    application.add_handler(ConversationHandler(
+        entry_points=[CommandHandler("broken", broken)],
+        states={1: [MessageHandler(filters.TEXT, hello)]},
+        fallbacks=[]
+    ))
+    metrics.instrument_application(application)
+    metrics.instrument_application(application)  # повторный вызов не оборачивает дважды
+
+    command, conversation = application.handlers[0]
+    name = "test_metrics.test_handlers_are_instrumented.<locals>.hello"
+    before = metrics.handler_updates.value(handler=name, outcome="ok")
+    assert asyncio.run(command.callback(None, None)) == "ok"
+    assert asyncio.run(conversation.states[1][0].callback(None, None)) == "ok"
+    try:
+        asyncio.run(conversation.entry_points[0].callback(None, None))
+    except RuntimeError:
+        pass
+    assert metrics.handler_updates.value(handler=name, outcome="ok") == before + 2
+    broken_name = name.replace("hello", "broken")
+    assert metrics.handler_updates.value(handler=broken_name, outcome="error") == 1
+    assert metrics.handler_latency.quantile(0.95, handler=name) is not None
+
+
+def test_db_timings_cache_ratios_and_endpoint():
+    order_id = db.save_order({
+        'user_id': 900, 'user_name': "Метрики", 'order_date': "01.06.2033", 'order_time': "12:00",
+        'order_location': "Адрес", 'order_performers': "Метрический Исполнитель", 'order_program': "Шоу",
+    })
+    db.order_cache.pop(order_id, None)
+    hits, misses = db.order_cache.hits, db.order_cache.misses
+    selects_before = sum(c for labels, _, _, c in metrics.db_queries.items() if dict(labels)["operation"] == "SELECT")
+    db.get_order(order_id)
+    db.get_order(order_id)
+    assert (db.order_cache.hits - hits, db.order_cache.misses - misses) == (1, 1)
+    selects = sum(c for labels, _, _, c in metrics.db_queries.items() if dict(labels)["operation"] == "SELECT")
+    assert selects > selects_before
+
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        port = sock.getsockname()[1]
+    metrics.start_http_server("127.0.0.1", port)
+    try:
+        with urllib.request.urlopen(f"http://127.0.0.1:{port}/metrics") as response:
+            assert response.headers["Content-Type"].startswith("text/plain; version=0.0.4")
+            body = response.read().decode()
+    finally:
+        metrics.stop_http_server()
+    assert "process_resident_memory_bytes " in body
+    assert 'bot_cache_hit_ratio{cache="order_cache"}' in body
+    assert 'bot_db_query_duration_seconds_count{operation="SELECT"}' in body
+
+    stats = metrics.snapshot()
+    assert stats["process"]["rss_bytes"] > 0
+    assert set(stats["caches"]) == {"order_cache", "performer_cache", "availability_cache"}
+
+
+def test_process_cpu_percent_survives_other_readers():
+    def value(body: str, name: str) -> float:
+        return float(next(line.split()[1] for line in body.splitlines() if line.startswith(name + " ")))
+
+    metrics.registry.render()
+    deadline = time.monotonic() + 0.3
+    while time.monotonic() < deadline:
+        pass  # процесс занят на 100% одного ядра
+    metrics.snapshot()  # /status читает процесс между сборами
+    body = metrics.registry.render()
+    assert value(body, "process_cpu_percent") > 20
+    assert body.count("# TYPE process_cpu_percent gauge") == 1
+    assert value(body, "process_resident_memory_bytes") > 0
+
+
+if __name__ == "__main__":
+    test_histogram_and_counter_exposition()
+    test_handlers_are_instrumented()
+    test_db_timings_cache_ratios_and_endpoint()
+    test_process_cpu_percent_survives_other_readers()
+    print("✅ Metrics test passed!")
@@ -0,0 +1,144 @@
+# test_notification_outbox.py
+# Outbox уведомлений: одновременная отправка по каналам, повтор только неудачных
+# каналов, dead-letter после исчерпания попыток и повторная постановка админом.
+import asyncio
+import os
+import tempfile
+import time
+
+os.environ.setdefault("DATABASE_NAME", os.path.join(tempfile.mkdtemp(), "notification_test.db"))
+
+from core.config import config
+from core.database import db
+from models.notification_outbox import NotificationDelivery, NotificationDeadLetter
+from services.notifications import NotificationManager
+
+config.NOTIFICATION_RETRY_DELAY = 0  # повторы созревают сразу
+
+
+class FakeChannels(NotificationManager):
+    """Каналы с задержкой сети; failures — сколько раз канал еще откажет"""
+
+    def __init__(self, failures=None, latency=0.0, hang=()):
+        super().__init__()
+        self.failures = dict(failures or {})
+        self.hang = set(hang)
+        self.latency = latency
+        self.calls = []
+
+    async def _deliver(self, channel, user_id, message):
+        self.calls.append(channel)
+        await asyncio.sleep(self.latency)
+        if channel in self.hang:
+            await asyncio.Event().wait()  # ответ так и не приходит
+        if self.failures.get(channel, 0):
+            self.failures[channel] -= 1
+            raise ConnectionError(f"{channel} unavailable")
+        return True
+
+
+def deliveries(notification_id):
+    with db.session_scope() as session:
+        return {
+            d.channel: (d.status, d.attempts)
+            for d in session.query(NotificationDelivery).filter_by(notification_id=notification_id)
+        }
+
+
+def test_enqueue_returns_immediately_and_channels_fan_out():
+    notifier = FakeChannels(latency=0.2)
+
+    async def scenario():
+        started = time.perf_counter()
+        notification_id = await notifier.send_notification(1, "Заказ подтвержден", channels=["telegram", "sms", "email"])
+        assert time.perf_counter() - started < 0.1  # обработчик не ждет доставки
+        assert deliveries(notification_id) == {c: ("pending", 0) for c in ("telegram", "sms", "email")}
+
+        started = time.perf_counter()
+        assert await notifier.process_due() == 3
+        assert time.perf_counter() - started < 0.4  # каналы параллельно, а не 3 × 0.2 с
+        return notification_id
+
+    notification_id = asyncio.run(scenario())
+    assert deliveries(notification_id) == {c: ("sent", 1) for c in ("telegram", "sms", "email")}
+
+
+def test_only_failed_channel_is_retried():
+    notifier = FakeChannels(failures={"sms": 2})
+
+    async def scenario():
+        notification_id = await notifier.send_notification(2, "Время изменено", channels=["telegram", "sms"])
+        while await notifier.process_due():
+            pass
+        return notification_id
+
+    notification_id = asyncio.run(scenario())
+    assert notifier.calls.count("telegram") == 1
+    assert notifier.calls.count("sms") == 3
+    assert deliveries(notification_id) == {"telegram": ("sent", 1), "sms": ("sent", 3)}
+
+
+def test_dead_letter_and_replay():
+    notifier = FakeChannels(failures={"email": 4})
+
+    async def scenario():
+        notification_id = await notifier.send_notification(3, "Напоминание", channels=["email"], max_attempts=2)
+        while await notifier.process_due():
+            pass
+        assert deliveries(notification_id) == {"email": ("dead", 2)}
+        letters = [l for l in notifier.dead_letters() if l['notification_id'] == notification_id]
+        assert len(letters) == 1 and "email unavailable" in letters[0]['last_error']
+
+        # Отказ после повторной постановки снова попадает в dead-letter
+        assert notifier.replay(letters[0]['id']) == 1
+        assert notifier.replay(letters[0]['id']) == 0
+        while await notifier.process_due():
+            pass
+        assert deliveries(notification_id) == {"email": ("dead", 2)}
+
+        retry = [l for l in notifier.dead_letters() if l['notification_id'] == notification_id]
+        assert notifier.replay(retry[0]['id']) == 1
+        while await notifier.process_due():
+            pass
+        return notification_id
+
+    notification_id = asyncio.run(scenario())
+    assert deliveries(notification_id) == {"email": ("sent", 1)}
+    with db.session_scope() as session:
+        letters = session.query(NotificationDeadLetter).filter_by(notification_id=notification_id).all()
+        assert len(letters) == 2 and all(l.replayed_at for l in letters)
+
+
+def test_hung_channel_times_out_without_blocking_others():
+    notifier = FakeChannels(hang={"sms"})
+    timeouts, config.NOTIFICATION_CHANNEL_TIMEOUTS = config.NOTIFICATION_CHANNEL_TIMEOUTS, {"sms": 0.3}
+
+    async def scenario():
+        first = await notifier.send_notification(4, "Заказ создан", channels=["telegram", "sms"], max_attempts=2)
+        second = await notifier.send_notification(5, "Заказ создан", channels=["email"], max_attempts=2)
+        started = time.perf_counter()
+        await asyncio.wait_for(notifier.process_due(), 2)
+        assert time.perf_counter() - started < 1
+        assert deliveries(first) == {"telegram": ("sent", 1), "sms": ("pending", 1)}
+        assert deliveries(second) == {"email": ("sent", 1)}
+
+        # Повтор зависшего канала идет обычным путем до dead-letter
+        while await notifier.process_due():
+            pass
+        return first
+
+    try:
+        notification_id = asyncio.run(scenario())
+    finally:
+        config.NOTIFICATION_CHANNEL_TIMEOUTS = timeouts
+    assert deliveries(notification_id) == {"telegram": ("sent", 1), "sms": ("dead", 2)}
+    letters = [l for l in notifier.dead_letters() if l['notification_id'] == notification_id]
+    assert len(letters) == 1 and "timed out" in letters[0]['last_error']
+
+
+if __name__ == "__main__":
+    test_enqueue_returns_immediately_and_channels_fan_out()
+    test_only_failed_channel_is_retried()
+    test_dead_letter_and_replay()
+    test_hung_channel_times_out_without_blocking_others()
+    print("✅ Notification outbox test passed!")
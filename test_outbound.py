@@ -0,0 +1,53 @@
+# test_outbound.py
+# Остановка очереди исходящих: отправленное до остановки доходит, а отложенные
+# по RetryAfter и зависшие вызовы отменяются по тайм-ауту, а не держат выключение.
+import asyncio
+import time
+
+from telegram.error import RetryAfter
+
+from services.outbound import OutboundScheduler
+
+
+class FloodedBot:
+    """Чат 1 отвечает сразу, чат 2 всегда получает RetryAfter, чат 3 не отвечает вовсе"""
+
+    def __init__(self):
+        self.delivered = []
+
+    async def send_message(self, chat_id, text, **kwargs):
+        if chat_id == 2:
+            raise RetryAfter(60)
+        if chat_id == 3:
+            await asyncio.Event().wait()
+        self.delivered.append(chat_id)
+        return text
+
+
+def test_stop_cancels_deferred_and_hung_calls_after_timeout():
+    bot = FloodedBot()
+    scheduler = OutboundScheduler(global_rate=100, chat_rate=100, workers=2, max_retries=3)
+
+    async def scenario():
+        ok = scheduler.submit(bot, "send_message", 1, text="готово")
+        flooded = scheduler.submit(bot, "send_message", 2, text="повтор через минуту")
+        hung = scheduler.submit(bot, "send_message", 3, text="без ответа")
+        assert await ok == "готово"
+
+        started = time.monotonic()
+        await scheduler.stop(timeout=0.3)
+        assert time.monotonic() - started < 1
+        assert flooded.cancelled() and hung.cancelled()
+        assert not scheduler._deferred
+
+        # После остановки планировщик снова запускается по первому вызову
+        assert await scheduler.send(bot, "send_message", 1, text="снова") == "снова"
+        await scheduler.stop(timeout=0.3)
+
+    asyncio.run(scenario())
+    assert bot.delivered == [1, 1]
+
+
+if __name__ == "__main__":
+    test_stop_cancels_deferred_and_hung_calls_after_timeout()
+    print("✅ Outbound test passed!")
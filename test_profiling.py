@@ -0,0 +1,100 @@
+# test_profiling.py
+# Профилирование SQL: агрегация по нормализованному тексту, лог медленных запросов,
+# EXPLAIN QUERY PLAN при первом медленном выполнении, команда /sqltop.
+import asyncio
+import logging
+import os
+import tempfile
+import types
+
+os.environ.setdefault("DATABASE_NAME", os.path.join(tempfile.mkdtemp(), "profiling_test.db"))
+
+from sqlalchemy import create_engine, text
+
+from core.config import config
+from core.database import db
+from core.metrics import instrument_engine
+from core.profiling import QueryProfiler, normalize, profiler, slow_logger
+from handlers import admin_handlers
+
+
+class Records(logging.Handler):
+    def __init__(self):
+        super().__init__()
+        self.messages = []
+
+    def emit(self, record):
+        self.messages.append(record.getMessage())
+
+
+def test_normalize():
+    assert normalize("SELECT * FROM orders WHERE id IN (?, ?, ?)\n  AND status = 'done' LIMIT 5") == \
+        "SELECT * FROM orders WHERE id IN (?, ...) AND status = ? LIMIT ?"
+    assert normalize("SELECT anon_1.id FROM t1 AS anon_1") == "SELECT anon_1.id FROM t1 AS anon_1"
+
+
+def test_slow_queries_are_logged_and_explained_once():
+    engine = create_engine("sqlite://")
+    local = QueryProfiler(slow_threshold=0)
+    instrument_engine(engine, profiler=local)
+    records = Records()
+    slow_logger.addHandler(records)
+    try:
+        with engine.begin() as conn:
+            conn.execute(text("CREATE TABLE tickets (id INTEGER PRIMARY KEY, user_id INTEGER, status TEXT)"))
+            conn.execute(text("CREATE INDEX ix_tickets_status ON tickets (status)"))
+            conn.execute(text("INSERT INTO tickets (user_id, status) VALUES (:u, :s)"),
+                         [{"u": i, "s": "open"} for i in range(50)])
+            for user_id in (1, 2, 3):
+                rows = conn.execute(text("SELECT * FROM tickets WHERE user_id = :u"), {"u": user_id}).fetchall()
+                assert len(rows) == 1  # EXPLAIN не сбивает результат исходного запроса
+            conn.execute(text("SELECT * FROM tickets WHERE status = :s"), {"s": "open"}).fetchall()
+    finally:
+        slow_logger.removeHandler(records)
+
+    by_statement = {row["statement"]: row for row in local.top(20)}
+    scan = by_statement["SELECT * FROM tickets WHERE user_id = ?"]
+    assert scan["count"] == 3 and scan["slow"] == 3
+    assert scan["full_scans"] and scan["full_scans"][0].startswith("SCAN tickets")
+    indexed = by_statement["SELECT * FROM tickets WHERE status = ?"]
+    assert indexed["full_scans"] == [] and any("USING INDEX" in step for step in indexed["plan"])
+
+    assert sum("Slow query" in m and "user_id = ?" in m and "params=" in m for m in records.messages) == 3
+    assert sum(m.startswith("Full table scan") for m in records.messages) == 1  # план снят один раз
+    assert local.top(1, "count")[0]["count"] >= 3
+
+
+def test_database_queries_and_sqltop_command():
+    # Метрики и профилировщик делят одну пару обработчиков событий движка
+    assert len(db.engine.dispatch.before_cursor_execute) == 1
+    assert len(db.engine.dispatch.after_cursor_execute) == 1
+    db.get_order(10_000)
+    assert any("FROM orders" in row["statement"] for row in profiler.top(50))
+
+    replies = []
+
+    class Message:
+        def __init__(self, text):
+            self.text = text
+
+        async def reply_text(self, text, **kwargs):
+            replies.append(text)
+
+    admins, config.ADMIN_IDS = config.ADMIN_IDS, [1]
+    try:
+        update = types.SimpleNamespace(effective_user=types.SimpleNamespace(id=1), message=Message("/sqltop 3 count"))
+        asyncio.run(admin_handlers.sqltop_command(update, None))
+        assert replies[-1].startswith("🗄 Топ SQL по count:") and "<code>" in replies[-1]
+
+        update.message = Message("/sqltop reset")
+        asyncio.run(admin_handlers.sqltop_command(update, None))
+        assert profiler.top() == []
+    finally:
+        config.ADMIN_IDS = admins
+
+
+if __name__ == "__main__":
+    test_normalize()
+    test_slow_queries_are_logged_and_explained_once()
+    test_database_queries_and_sqltop_command()
+    print("✅ SQL profiling test passed!")
@@ -0,0 +1,68 @@
+# test_ratelimit.py
+# Проверка GCRA-ограничителя: всплеск, восстановление, вытеснение ключей, блокировка.
+from core.ratelimit import RateLimiter, ChannelRateLimits
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_burst_then_steady_rate():
+    clock = Clock()
+    limiter = RateLimiter(5, 3600, clock=clock)
+    assert all(limiter.acquire("a") for _ in range(5))
+    assert not limiter.acquire("a")
+    assert limiter.acquire("b")  # другие ключи не затронуты
+
+    clock.now += 3600 / 5 - 1
+    assert not limiter.acquire("a")
+    clock.now += 1
+    assert limiter.acquire("a")
+    assert not limiter.acquire("a")
+
+
+def test_idle_keys_are_evicted():
+    clock = Clock()
+    limiter = RateLimiter(1, 10, clock=clock)
+    for i in range(1000):
+        limiter.acquire(i)
+    assert len(limiter) == 1000
+    clock.now += 10
+    limiter.acquire("fresh")
+    assert len(limiter) == 1
+
+    bounded = RateLimiter(1, 10, max_keys=100, clock=clock)
+    for i in range(1000):
+        bounded.acquire(i)
+    assert len(bounded) == 100
+
+
+def test_block_and_delay():
+    clock = Clock()
+    limiter = RateLimiter(1, 1, clock=clock)
+    assert limiter.delay("chat") == 0
+    limiter.consume("chat")
+    assert limiter.delay("chat") == 1
+    limiter.block("chat", 30)
+    assert limiter.delay("chat") == 30
+    clock.now += 30
+    assert limiter.acquire("chat")
+
+
+def test_channel_limits():
+    limits = ChannelRateLimits({"sms": (1, 60)})
+    assert limits.acquire("sms", "+7900")
+    assert not limits.acquire("sms", "+7900")
+    assert limits.acquire("telegram", 1) and limits.acquire("telegram", 1)  # без лимита
+
+
+if __name__ == "__main__":
+    test_burst_then_steady_rate()
+    test_idle_keys_are_evicted()
+    test_block_and_delay()
+    test_channel_limits()
+    print("✅ Rate limiter test passed!")
@@ -0,0 +1,141 @@
+# test_reminders.py
+# Напоминания о шоу: пересчет при изменении заказа, загрузка в кучу только
+# ближайшего окна, пакетная отправка через outbox уведомлений, переживание перезапуска.
+import os
+import tempfile
+from datetime import timedelta
+
+os.environ.setdefault("DATABASE_NAME", os.path.join(tempfile.mkdtemp(), "reminders_test.db"))
+
+from core.database import db
+from core.intervals import parse_slot
+from models.notification_outbox import NotificationOutbox
+from models.performer import Performer
+from models.reminder import Reminder
+from services import reminders
+
+PERFORMER = "Напоминающий Исполнитель"
+PERFORMER_USER_ID = 880
+
+with db.session_scope() as session:
+    if not session.query(Performer).filter_by(telegram_user_id=PERFORMER_USER_ID).first():
+        session.add(Performer(performer_name=PERFORMER, telegram_user_id=PERFORMER_USER_ID))
+
+
+def _make_order(day: int, user_id: int = 500) -> int:
+    return db.save_order({
+        'user_id': user_id,
+        'user_name': "Клиент",
+        'order_date': f"{day:02d}.03.2032",
+        'order_time': "18:00",
+        'order_location': "Тестовый адрес",
+        'order_performers': PERFORMER,
+        'order_program': "Тесла шоу",
+    })
+
+
+def _pending(order_id):
+    with db.session_scope() as session:
+        return sorted(
+            (r.audience, r.kind, r.due_at)
+            for r in session.query(Reminder).filter_by(order_id=order_id, status='pending')
+        )
+
+
+def _outbox_for(user_id):
+    with db.session_scope() as session:
+        return [n.message for n in session.query(NotificationOutbox).filter_by(user_id=user_id)]
+
+
+def test_reminders_follow_order_changes():
+    order_id = _make_order(1)
+    assert reminders.schedule_order(order_id) == 4
+    show_at = parse_slot("01.03.2032", "18:00")
+    assert _pending(order_id) == sorted(
+        (audience, kind, show_at - offset)
+        for audience in ("customer", "performer")
+        for kind, offset in reminders.REMINDER_OFFSETS.items()
+    )
+    assert reminders.schedule_order(order_id) == 0  # без изменений — ничего не пересоздается
+
+    db.update_order_time(order_id, "20:00")
+    assert reminders.schedule_order(order_id) == 4
+    assert all(due.hour in (18, 20) for _, _, due in _pending(order_id))
+
+    # Исполнитель отказался: клиенту напоминаем, исполнителю — нет
+    db.update_order_status(order_id, "reassigning")
+    reminders.schedule_order(order_id)
+    assert {audience for audience, _, _ in _pending(order_id)} == {"customer"}
+
+    db.update_order_status(order_id, "cancelled")
+    reminders.schedule_order(order_id)
+    assert _pending(order_id) == []
+
+
+def test_scheduler_loads_only_the_window_and_fires_in_batches():
+    scheduler = reminders.ReminderScheduler(window=3600, batch_size=2)
+    reminders.scheduler = scheduler  # schedule_order добавляет в кучу этого планировщика
+    far_order = _make_order(20, user_id=501)
+    reminders.schedule_order(far_order)
+    order_id = _make_order(10, user_id=502)
+    show_at = parse_slot("10.03.2032", "18:00")
+
+    now = show_at - timedelta(hours=24, minutes=30)
+    scheduler.load_window(now)
+    assert scheduler._heap == []  # ни один заказ не ближе окна
+
+    # Напоминания в уже загруженном окне попадают в кучу сразу
+    reminders.schedule_order(order_id)
+    now = show_at - timedelta(hours=24, minutes=10)
+    scheduler.load_window(now)
+    assert sorted(r for _, r in scheduler._heap) == sorted(
+        r.id for r in _reminders(order_id) if r.kind == "24h"
+    )
+
+    assert scheduler.fire_due(now) == 0
+    now = show_at - timedelta(hours=24)
+    assert scheduler.fire_due(now) == 2  # клиент и исполнитель одной пачкой
+    assert scheduler._heap == []
+    customer_messages = _outbox_for(502)
+    assert len(customer_messages) == 1 and "через 24 часа" in customer_messages[0]
+    assert any(f"заказ #{order_id} через 24 часа" in m for m in _outbox_for(PERFORMER_USER_ID))
+
+
+def test_restart_picks_up_overdue_and_skips_past_shows():
+    order_id = _make_order(15, user_id=503)
+    reminders.schedule_order(order_id)
+    show_at = parse_slot("15.03.2032", "18:00")
+
+    # Бот был выключен с суток до шоу: устаревшее 24h-напоминание заменяется 2h
+    restarted = reminders.ReminderScheduler(window=3600)
+    reminders.scheduler = restarted
+    now = show_at - timedelta(minutes=30)
+    restarted.load_window(now)
+    assert restarted.fire_due(now) >= 4  # и недоотправленные из предыдущих тестов
+    assert len(_outbox_for(503)) == 1 and "через 2 часа" in _outbox_for(503)[0]
+    assert {(r.kind, r.status) for r in _reminders(order_id)} == {("24h", "expired"), ("2h", "sent")}
+
+    # После начала шоу напоминать поздно
+    late_order = _make_order(16, user_id=504)
+    reminders.schedule_order(late_order)
+    late = reminders.ReminderScheduler(window=3600)
+    reminders.scheduler = late
+    now = parse_slot("16.03.2032", "18:00") + timedelta(hours=1)
+    late.load_window(now)
+    assert late.fire_due(now) == 4
+    assert _outbox_for(504) == []
+    assert {r.status for r in _reminders(late_order)} == {"expired"}
+
+
+def _reminders(order_id):
+    with db.session_scope() as session:
+        rows = session.query(Reminder).filter_by(order_id=order_id).all()
+        session.expunge_all()
+        return rows
+
+
+if __name__ == "__main__":
+    test_reminders_follow_order_changes()
+    test_scheduler_loads_only_the_window_and_fires_in_batches()
+    test_restart_picks_up_overdue_and_skips_past_shows()
+    print("✅ Reminders test passed!")
@@ -0,0 +1,147 @@
+# test_replacement_offers.py
+# Замена исполнителя: заказ, который никто не принял (все отказались или
+# предложения истекли), возвращается в ожидание назначения, админ получает уведомление.
+import asyncio
+import os
+import tempfile
+import types
+from itertools import count
+
+os.environ.setdefault("DATABASE_NAME", os.path.join(tempfile.mkdtemp(), "replacement_test.db"))
+
+from core.config import config
+from core.database import db
+from handlers import performer_handlers
+from models.notification_outbox import NotificationOutbox
+from models.performer import Performer
+from services.notifications import notifier
+from services.outbound import outbound
+
+ADMIN_ID = 990_001
+PERFORMERS = {990_101: "Отказавшийся Исполнитель", 990_102: "Первый Кандидат", 990_103: "Второй Кандидат"}
+
+with db.session_scope() as session:
+    for user_id, name in PERFORMERS.items():
+        if not session.query(Performer).filter_by(telegram_user_id=user_id).first():
+            session.add(Performer(performer_name=name, telegram_user_id=user_id))
+db.performer_cache.clear()
+
+
+class FakeBot:
+    def __init__(self):
+        self.edited = []
+        self._message_ids = count(1)
+
+    async def send_message(self, chat_id, text, **kwargs):
+        return types.SimpleNamespace(message_id=next(self._message_ids))
+
+    async def edit_message_text(self, chat_id, message_id, text, **kwargs):
+        self.edited.append((chat_id, text))
+
+
+class FakeQuery:
+    def __init__(self, data):
+        self.data = data
+        self.text = None
+
+    async def answer(self):
+        pass
+
+    async def edit_message_text(self, text, **kwargs):
+        self.text = text
+
+
+def _press(context, user_id, data, handler):
+    query = FakeQuery(data)
+    update = types.SimpleNamespace(callback_query=query, effective_user=types.SimpleNamespace(id=user_id))
+    return handler(update, context), query
+
+
+def _rejected_order(day: int) -> int:
+    return db.save_order({
+        'user_id': 990_500 + day, 'order_date': f"{day:02d}.05.2032", 'order_time': "12:00",
+        'order_location': "Тестовый адрес", 'order_performers': PERFORMERS[990_101],
+        'order_program': "Тесла шоу",
+    })
+
+
+def _admin_messages():
+    with db.session_scope() as session:
+        return [n.message for n in session.query(NotificationOutbox).filter_by(user_id=ADMIN_ID)]
+
+
+def _run(scenario):
+    admins, config.ADMIN_IDS = config.ADMIN_IDS, [ADMIN_ID]
+
+    async def wrapped():
+        try:
+            return await scenario()
+        finally:
+            await notifier.stop()
+            await outbound.stop()
+
+    try:
+        return asyncio.run(wrapped())
+    finally:
+        config.ADMIN_IDS = admins
+
+
+def test_all_declined_returns_order_to_pending():
+    order_id = _rejected_order(1)
+    bot = FakeBot()
+    context = types.SimpleNamespace(bot=bot)
+
+    async def scenario():
+        coro, _ = _press(context, 990_101, f"reject_{order_id}", performer_handlers.handle_performer_response)
+        await coro
+        offers = db.get_replacement_offers(order_id)
+        assert {o['chat_id'] for o in offers} >= {990_102, 990_103}
+        assert db.get_order(order_id)['status'] == 'reassigning'
+
+        for offer in offers:
+            coro, _ = _press(context, offer['chat_id'], f"offer_decline_{order_id}",
+                             performer_handlers.handle_replacement_offer)
+            await coro
+
+        # Поздний отклик на уже возвращенный заказ ничего не меняет
+        coro, query = _press(context, 990_102, f"offer_accept_{order_id}", performer_handlers.handle_replacement_offer)
+        await coro
+        assert query.text.startswith("⌛️")
+
+    _run(scenario)
+    order = db.get_order(order_id)
+    assert order['status'] == 'pending' and order['order_performers'] != PERFORMERS[990_102]
+    assert sum(f"#{order_id}:" in m and "отказались" in m for m in _admin_messages()) == 1
+
+
+def test_expired_offers_return_order_and_are_withdrawn():
+    order_id = _rejected_order(2)
+    bot = FakeBot()
+    context = types.SimpleNamespace(bot=bot)
+    ttl, config.REPLACEMENT_OFFER_TTL = config.REPLACEMENT_OFFER_TTL, 0
+
+    async def scenario():
+        coro, _ = _press(context, 990_101, f"reject_{order_id}", performer_handlers.handle_performer_response)
+        await coro
+        offered = {o['chat_id'] for o in db.get_replacement_offers(order_id)}
+        assert offered
+
+        await performer_handlers.expire_replacement_offers(context)
+        await performer_handlers.expire_replacement_offers(context)  # повторный проход ничего не делает
+        return offered
+
+    try:
+        offered = _run(scenario)
+    finally:
+        config.REPLACEMENT_OFFER_TTL = ttl
+    assert db.get_order(order_id)['status'] == 'pending'
+    assert {o['status'] for o in db.get_replacement_offers(order_id)} == {'expired'}
+    assert {chat for chat, text in bot.edited if f"#{order_id} истекло" in text} == offered
+    assert sum(f"#{order_id}:" in m and "никто не принял" in m for m in _admin_messages()) == 1
+    assert not db.claim_order(order_id, PERFORMERS[990_102])
+
+
+if __name__ == "__main__":
+    test_all_declined_returns_order_to_pending()
+    test_expired_offers_return_order_and_are_withdrawn()
+    print("✅ Replacement offers test passed!")
@@ -0,0 +1,110 @@
+# test_reservations.py
+# Нагрузочная проверка: параллельные клиенты не могут забронировать
+# одного исполнителя на пересекающееся время.
+import os
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+os.environ.setdefault("DATABASE_NAME", os.path.join(tempfile.mkdtemp(), "reservations_test.db"))
+
+from core.database import db, SlotUnavailableError
+
+WORKERS = 32
+PERFORMER = "Нагрузочный Исполнитель"
+
+
+def _run_concurrently(func, count):
+    barrier = threading.Barrier(count)
+
+    def worker(i):
+        barrier.wait()
+        return func(i)
+
+    with ThreadPoolExecutor(max_workers=count) as pool:
+        return list(pool.map(worker, range(count)))
+
+
+def _order(user_id, date, time):
+    return {
+        'user_id': user_id,
+        'order_date': date,
+        'order_time': time,
+        'order_performers': PERFORMER,
+        'order_program': "Тесла шоу",
+    }
+
+
+def test_concurrent_holds_single_winner():
+    holds = _run_concurrently(lambda i: db.hold_slot(PERFORMER, "10.10.2031", "12:00", 1000 + i), WORKERS)
+    winners = [h for h in holds if h]
+    assert len(winners) == 1, winners
+
+    # Пересекающийся слот другого клиента тоже занят
+    assert db.hold_slot(PERFORMER, "10.10.2031", "13:00", 5000) is None
+
+    db.release_hold(winners[0])
+    assert db.hold_slot(PERFORMER, "10.10.2031", "13:00", 5000)
+
+
+def test_concurrent_bookings_single_winner():
+    def book(i):
+        # Половина клиентов бронирует точный слот, половина — пересекающийся
+        time = "15:00" if i % 2 else "15:30"
+        try:
+            return db.save_order(_order(2000 + i, "11.10.2031", time))
+        except SlotUnavailableError:
+            return None
+
+    order_ids = [o for o in _run_concurrently(book, WORKERS) if o]
+    assert len(order_ids) == 1, order_ids
+    assert not db.is_performer_available(PERFORMER, "11.10.2031", "16:00")
+
+
+def test_hold_becomes_booking_and_rejection_frees_slot():
+    hold = db.hold_slot(PERFORMER, "12.10.2031", "10:00", 3000)
+    assert hold
+
+    try:
+        db.save_order(_order(3001, "12.10.2031", "10:00"))
+        raise AssertionError("slot held by another user was booked")
+    except SlotUnavailableError:
+        pass
+
+    order_id = db.save_order(_order(3000, "12.10.2031", "10:00"), reservation_id=hold)
+    assert order_id
+
+    db.update_order_status(order_id, "rejected")
+    assert db.hold_slot(PERFORMER, "12.10.2031", "10:00", 3001)
+
+
+def test_concurrent_reschedules_single_winner():
+    first = db.save_order(_order(4000, "13.10.2031", "10:00"))
+    second = db.save_order(_order(4001, "13.10.2031", "14:00"))
+
+    def reschedule(i):
+        # Оба заказа переносятся на одно и то же время
+        order_id = first if i % 2 else second
+        try:
+            db.update_order_time(order_id, "18:00")
+            return order_id
+        except SlotUnavailableError:
+            return None
+
+    winners = {o for o in _run_concurrently(reschedule, WORKERS) if o}
+    assert len(winners) == 1, winners
+    loser = ({first, second} - winners).pop()
+    assert db.get_order(loser)['order_time'] != "18:00"
+
+    # Сдвиг внутри собственного интервала не конфликтует с самим заказом
+    winner = winners.pop()
+    db.update_order_time(winner, "18:30")
+    assert db.get_order(winner)['order_time'] == "18:30"
+
+
+if __name__ == "__main__":
+    test_concurrent_holds_single_winner()
+    test_concurrent_bookings_single_winner()
+    test_hold_becomes_booking_and_rejection_frees_slot()
+    test_concurrent_reschedules_single_winner()
+    print("✅ Reservation stress test passed!")
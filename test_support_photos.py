@@ -0,0 +1,63 @@
+# test_support_photos.py
+# Скриншот тикета: при одновременной рассылке операторам файл загружается
+# один раз, остальные получают его по file_id Telegram.
+import asyncio
+import os
+import tempfile
+
+os.environ.setdefault("DATABASE_NAME", os.path.join(tempfile.mkdtemp(), "support_photos_test.db"))
+
+from core.database import db
+from handlers.support_handlers import send_ticket_photo
+from services.outbound import outbound
+
+
+class FakePhoto:
+    def __init__(self, file_id):
+        self.file_id = file_id
+
+
+class FakeMessage:
+    def __init__(self, file_id):
+        self.photo = [FakePhoto(file_id)]
+
+
+class FakeBot:
+    def __init__(self):
+        self.uploads = []
+        self.by_file_id = []
+
+    async def send_photo(self, chat_id, photo, caption=None, **kwargs):
+        await asyncio.sleep(0.05)  # загрузка файла в Telegram
+        if isinstance(photo, bytes):
+            self.uploads.append(chat_id)
+        else:
+            self.by_file_id.append((chat_id, photo))
+        return FakeMessage("file-1")
+
+
+def test_concurrent_operators_share_one_upload():
+    path = os.path.join(tempfile.mkdtemp(), "screen.jpg")
+    with open(path, 'wb') as f:
+        f.write(os.urandom(1024))
+    ticket_id = db.create_support_ticket(user_id=1, message="photo")
+    db.set_ticket_photo(ticket_id, photo_path=path)
+    bot = FakeBot()
+
+    async def scenario():
+        operators = [501, 502, 503, 504]
+        await asyncio.gather(*[
+            send_ticket_photo(bot, chat_id, db.get_support_ticket(ticket_id)) for chat_id in operators
+        ])
+        await outbound.stop()
+
+    asyncio.run(scenario())
+    assert len(bot.uploads) == 1
+    assert sorted(chat for chat, _ in bot.by_file_id) == sorted({501, 502, 503, 504} - set(bot.uploads))
+    assert all(file_id == "file-1" for _, file_id in bot.by_file_id)
+    assert db.get_support_ticket(ticket_id)["photo_file_id"] == "file-1"
+
+
+if __name__ == "__main__":
+    test_concurrent_operators_share_one_upload()
+    print("✅ Support photos test passed!")
@@ -0,0 +1,110 @@
+# test_tracing.py
+# Трассировка обновлений: метка «диалог:состояние», разбивка времени на Bot API,
+# базу и прочее, скользящие перцентили и журнал медленных обновлений.
+import asyncio
+import logging
+import os
+import tempfile
+
+os.environ.setdefault("DATABASE_NAME", os.path.join(tempfile.mkdtemp(), "tracing_test.db"))
+
+from telegram.ext import ApplicationBuilder, CallbackQueryHandler, CommandHandler, ConversationHandler
+
+from core import metrics, tracing
+from core.config import states
+from core.database import db
+from core.tracing import LatencyTracker, tracer
+from models.order import Order
+from services.outbound import outbound
+
+
+class Records(logging.Handler):
+    def __init__(self):
+        super().__init__()
+        self.messages = []
+
+    def emit(self, record):
+        self.messages.append(record.getMessage())
+
+
+class SlowBot:
+    async def send_message(self, chat_id, text, **kwargs):
+        await asyncio.sleep(0.05)
+
+
+def _build(callback):
+    async def start(update, context):
+        return states.ASK_DATE
+
+    application = ApplicationBuilder().token("1:x").build()
+    application.add_handler(ConversationHandler(
+        entry_points=[CommandHandler("order", start)],
+        states={states.ASK_DATE: [CallbackQueryHandler(callback)]},
+        fallbacks=[]
+    ))
+    metrics.instrument_application(application)
+    conversation = application.handlers[0][0]
+    return conversation.states[states.ASK_DATE][0].callback
+
+
+def test_update_time_is_split_by_state():
+    leaked = []
+
+    async def calendar_handler(update, context):
+        with db.session_scope() as session:
+            session.query(Order).count()
+        await outbound.send_message(SlowBot(), 42, "Выберите дату")
+        await asyncio.sleep(0.03)
+        # Фоновая задача наследует контекст, но не должна попасть в закрытую трассу
+        leaked.append(asyncio.create_task(asyncio.sleep(0.01)))
+        return states.ASK_TIME
+
+    callback = _build(calendar_handler)
+    tracer.threshold = 0.01
+
+    async def scenario():
+        result = await callback(None, None)
+        await asyncio.gather(*leaked)
+        tracing.add(tracing.DB, 5.0)  # вне обновления — игнорируется
+        await outbound.stop()
+        return result
+
+    records = Records()
+    tracing.slow_logger.addHandler(records)
+    try:
+        assert asyncio.run(scenario()) == states.ASK_TIME
+    finally:
+        tracing.slow_logger.removeHandler(records)
+
+    entry = tracer.slow[-1]
+    assert entry["state"] == "order:ASK_DATE"
+    assert entry["handler"].endswith("calendar_handler")
+    assert entry["api_ms"] >= 45 and entry["api_calls"] == 1
+    assert entry["db_queries"] >= 1 and entry["db_ms"] < 1000
+    assert entry["other_ms"] >= 25
+    assert abs(entry["api_ms"] + entry["db_ms"] + entry["other_ms"] - entry["total_ms"]) < 1
+    assert any('"state": "order:ASK_DATE"' in message for message in records.messages)
+    assert "order:ASK_DATE" in tracer.percentiles()
+
+
+def test_rolling_percentiles():
+    tracker = LatencyTracker(window=100, threshold=10)
+    for i in range(1, 201):
+        trace, token = tracker.start("support:SUPPORT_REQUEST", "handler")
+        trace.started -= i / 1000  # длительность i мс
+        tracker.finish(trace, token)
+    stats = tracker.percentiles()["support:SUPPORT_REQUEST"]
+    assert stats["count"] == 100  # только последние window обновлений
+    assert round(stats["p50"] * 1000) == 150
+    assert round(stats["p95"] * 1000) == 195
+    assert round(stats["p99"] * 1000) == 199
+    assert not tracker.slow
+
+    text = metrics.registry.render()
+    assert 'bot_state_latency_seconds{quantile="0.95",state="order:ASK_DATE"}' in text
+
+
+if __name__ == "__main__":
+    test_update_time_is_split_by_state()
+    test_rolling_percentiles()
+    print("✅ Tracing test passed!")
@@ -0,0 +1,145 @@
+# test_twilio_transport.py
+# Асинхронный клиент Twilio против локальной заглушки REST API:
+# общий пул keep-alive соединений, ограничение одновременных запросов, ошибки API.
+import asyncio
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs
+
+import pytest
+from twilio.base.exceptions import TwilioRestException
+
+from services.twilio_transport import TwilioTransport
+
+ACCOUNT_SID = "AC" + "0" * 32
+
+
+class StubTwilio(ThreadingHTTPServer):
+    """POST /2010-04-01/Accounts/{sid}/Messages.json с задержкой сети latency"""
+
+    def __init__(self, latency: float = 0.01):
+        super().__init__(("127.0.0.1", 0), StubHandler)
+        self.latency = latency
+        self.messages = []
+        self.connections = set()
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.lock = threading.Lock()
+        self.hang = threading.Event()
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self.server_port}"
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # keep-alive
+
+    def log_message(self, *args):
+        pass
+
+    def do_POST(self):
+        stub = self.server
+        form = parse_qs(self.rfile.read(int(self.headers.get("Content-Length", 0))).decode())
+        with stub.lock:
+            stub.connections.add(self.client_address)
+            stub.in_flight += 1
+            stub.max_in_flight = max(stub.max_in_flight, stub.in_flight)
+        time.sleep(stub.latency)
+        with stub.lock:
+            stub.in_flight -= 1
+        to = form["To"][0]
+        if to == "+1":
+            stub.hang.wait()  # сервер принял запрос и не отвечает
+            return
+        if to == "+0":
+            status, payload = 400, {"code": 21211, "message": "Invalid 'To' Phone Number", "status": 400}
+        else:
+            with stub.lock:
+                stub.messages.append(form)
+                sid = f"SM{len(stub.messages):032d}"
+            status, payload = 201, {"sid": sid, "to": to, "from": form["From"][0], "body": form["Body"][0],
+                                    "status": "queued", "account_sid": ACCOUNT_SID}
+        data = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+
+def make_transport(stub: StubTwilio, concurrency: int) -> TwilioTransport:
+    return TwilioTransport(ACCOUNT_SID, "token", concurrency=concurrency, timeout=5, base_url=stub.url)
+
+
+def test_messages_share_a_bounded_connection_pool():
+    stub = StubTwilio()
+    transport = make_transport(stub, concurrency=10)
+
+    async def scenario():
+        try:
+            return await asyncio.gather(*(
+                transport.send(to=f"+7900000{i:04d}", body=f"Заказ #{i}", from_="+15550000000")
+                for i in range(100)
+            ))
+        finally:
+            await transport.close()
+
+    results = asyncio.run(scenario())
+    stub.shutdown()
+    assert len({message.sid for message in results}) == 100
+    assert len(stub.messages) == 100
+    assert stub.max_in_flight <= 10
+    assert len(stub.connections) <= 10  # соединения переиспользуются, а не открываются на каждое сообщение
+
+
+def test_whatsapp_addresses_and_api_errors():
+    stub = StubTwilio(latency=0)
+    transport = make_transport(stub, concurrency=2)
+
+    async def scenario():
+        try:
+            message = await transport.send(to="whatsapp:+79001234567", body="Привет", from_="whatsapp:+15550000000")
+            assert message.status == "queued"
+            with pytest.raises(TwilioRestException) as error:
+                await transport.send(to="+0", body="Привет", from_="+15550000000")
+            assert error.value.status == 400
+        finally:
+            await transport.close()
+
+    asyncio.run(scenario())
+    stub.shutdown()
+    assert stub.messages[0]["To"] == ["whatsapp:+79001234567"]
+
+
+def test_hung_request_times_out_and_frees_its_slot():
+    stub = StubTwilio(latency=0)
+    transport = TwilioTransport(ACCOUNT_SID, "token", concurrency=1, timeout=0.5, base_url=stub.url)
+
+    async def scenario():
+        try:
+            started = time.monotonic()
+            with pytest.raises(asyncio.TimeoutError):
+                await transport.send(to="+1", body="Привет", from_="+15550000000")
+            assert time.monotonic() - started < 2
+            # Единственный слот освобожден: следующее сообщение уходит
+            message = await transport.send(to="+79001234567", body="Привет", from_="+15550000000")
+            assert message.status == "queued"
+        finally:
+            await transport.close()
+
+    try:
+        asyncio.run(scenario())
+    finally:
+        stub.hang.set()
+        stub.shutdown()
+
+
+if __name__ == "__main__":
+    test_messages_share_a_bounded_connection_pool()
+    test_whatsapp_addresses_and_api_errors()
+    test_hung_request_times_out_and_frees_its_slot()
+    print("✅ Twilio transport test passed!")
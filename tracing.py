@@ -0,0 +1,142 @@
+import contextvars
+import json
+import logging
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from typing import Deque, Dict, List, Optional
+from .config import config
+from .logging_setup import bind, unbind
+
+logger = logging.getLogger(__name__)
+# Отдельный логгер, чтобы медленные обновления можно было направить в свой файл
+slow_logger = logging.getLogger("bot.slow_updates")
+
+# Доли времени обработки обновления
+API = "api"
+DB = "db"
+
+
+class Trace:
+    """Время одного обновления: общее и его части — Bot API и база данных"""
+
+    __slots__ = ("tag", "handler", "update_id", "user_id", "started", "api", "db", "api_calls", "db_queries", "done", "log_token")
+
+    def __init__(self, tag: str, handler: str, update_id=None, user_id=None):
+        self.tag = tag
+        self.handler = handler
+        self.update_id = update_id
+        self.user_id = user_id
+        self.started = time.perf_counter()
+        self.api = 0.0
+        self.db = 0.0
+        self.api_calls = 0
+        self.db_queries = 0
+        self.done = False
+        self.log_token = None
+
+    def add(self, kind: str, seconds: float):
+        if kind == API:
+            self.api += seconds
+            self.api_calls += 1
+        else:
+            self.db += seconds
+            self.db_queries += 1
+
+
+_current: contextvars.ContextVar[Optional[Trace]] = contextvars.ContextVar("trace", default=None)
+
+
+def add(kind: str, seconds: float):
+    """Добавляет время к трассе текущего обновления (если она есть)"""
+    trace = _current.get()
+    # Фоновые задачи, созданные из обработчика, наследуют контекст — после завершения трасса закрыта
+    if trace is not None and not trace.done:
+        trace.add(kind, seconds)
+
+
+@contextmanager
+def span(kind: str):
+    """Замер участка (в том числе с await внутри) как времени Bot API или базы"""
+    if _current.get() is None:
+        yield
+        return
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        add(kind, time.perf_counter() - started)
+
+
+def _percentile(ordered: List[float], q: float) -> float:
+    # Метод ближайшего ранга
+    index = max(0, min(len(ordered) - 1, int(q * len(ordered) + 0.999999) - 1))
+    return ordered[index]
+
+
+class LatencyTracker:
+    """
+    Скользящие p50/p95/p99 времени обработки по состоянию диалога (последние
+    window обновлений на состояние) и журнал медленных обновлений с разбивкой
+    на Bot API, базу данных и прочее.
+    """
+
+    def __init__(self, window: int = None, threshold: float = None):
+        self.window = window or config.TRACE_WINDOW
+        self.threshold = config.TRACE_SLOW_THRESHOLD if threshold is None else threshold
+        self._samples: Dict[str, Deque[float]] = {}
+        self.slow: Deque[dict] = deque(maxlen=100)
+        self._lock = threading.Lock()
+
+    def start(self, tag: str, handler: str, update=None):
+        user = getattr(update, "effective_user", None)
+        trace = Trace(tag, handler, getattr(update, "update_id", None), getattr(user, "id", None))
+        # Логи внутри обработчика получают update_id, user_id и состояние диалога
+        trace.log_token = bind(update_id=trace.update_id, user_id=trace.user_id, state=tag)
+        return trace, _current.set(trace)
+
+    def finish(self, trace: Trace, token, error: Exception = None) -> dict:
+        total = time.perf_counter() - trace.started
+        trace.done = True
+        _current.reset(token)
+        unbind(trace.log_token)
+        with self._lock:
+            samples = self._samples.get(trace.tag)
+            if samples is None:
+                samples = self._samples[trace.tag] = deque(maxlen=self.window)
+            samples.append(total)
+        entry = {
+            "event": "slow_update",
+            "state": trace.tag,
+            "handler": trace.handler,
+            "update_id": trace.update_id,
+            "user_id": trace.user_id,
+            "total_ms": round(total * 1000, 1),
+            "api_ms": round(trace.api * 1000, 1),
+            "db_ms": round(trace.db * 1000, 1),
+            "other_ms": round(max(0.0, total - trace.api - trace.db) * 1000, 1),
+            "api_calls": trace.api_calls,
+            "db_queries": trace.db_queries,
+            "error": repr(error) if error else None,
+        }
+        if total >= self.threshold:
+            self.slow.append(entry)
+            slow_logger.warning(json.dumps(entry, ensure_ascii=False), extra={"trace": entry})
+        return entry
+
+    def percentiles(self) -> Dict[str, dict]:
+        with self._lock:
+            snapshot = {tag: sorted(samples) for tag, samples in self._samples.items()}
+        return {
+            tag: {
+                "count": len(ordered),
+                "p50": _percentile(ordered, 0.50),
+                "p95": _percentile(ordered, 0.95),
+                "p99": _percentile(ordered, 0.99),
+            }
+            for tag, ordered in snapshot.items() if ordered
+        }
+
+
+tracer = LatencyTracker()
@@ -0,0 +1,70 @@
+import asyncio
+import logging
+from typing import Optional
+from aiohttp import ClientSession, TCPConnector
+from twilio.http.async_http_client import AsyncTwilioHttpClient
+from twilio.rest import Client
+from core.config import config
+from core.security import decrypt_data
+
+logger = logging.getLogger(__name__)
+
+
+class TwilioTransport:
+    """
+    SMS и WhatsApp через асинхронный HTTP-клиент Twilio. Все запросы идут
+    через одну aiohttp-сессию с пулом keep-alive соединений; одновременно
+    выполняется не более concurrency запросов, остальные ждут в цикле событий,
+    не занимая потоков.
+    """
+
+    def __init__(self, account_sid: str = None, token: str = None, concurrency: int = None,
+                 timeout: float = None, base_url: str = None):
+        self.account_sid = account_sid or config.TWILIO_SID
+        self._token = token
+        self.concurrency = concurrency or config.TWILIO_CONCURRENCY
+        self.timeout = timeout or config.TWILIO_TIMEOUT
+        self.base_url = base_url  # адрес REST API (локальная заглушка в тестах)
+        self.client: Optional[Client] = None
+        self.http_client: Optional[AsyncTwilioHttpClient] = None
+        self._semaphore: Optional[asyncio.Semaphore] = None
+
+    @property
+    def configured(self) -> bool:
+        return bool(self.account_sid and (self._token or config.TWILIO_TOKEN))
+
+    def _get_client(self) -> Client:
+        """Клиент создается в работающем цикле событий: к нему привязана aiohttp-сессия"""
+        if self.client is None:
+            token = self._token if self._token is not None else decrypt_data(config.TWILIO_TOKEN)
+            self.http_client = AsyncTwilioHttpClient(pool_connections=False)
+            # Тайм-аут сессии не действует: клиент Twilio передает timeout=None в каждый запрос,
+            # поэтому предел времени задается в send
+            self.http_client.session = ClientSession(connector=TCPConnector(limit=self.concurrency))
+            self.client = Client(self.account_sid, token, http_client=self.http_client)
+            if self.base_url:
+                self.client.api.base_url = self.base_url
+            self._semaphore = asyncio.Semaphore(self.concurrency)
+            logger.info(f"Twilio async client initialized (concurrency {self.concurrency})")
+        return self.client
+
+    async def send(self, to: str, body: str, from_: str):
+        """
+        Создает сообщение; ошибки Twilio (TwilioRestException) пробрасываются вызывающему.
+        Запрос дольше timeout секунд прерывается с asyncio.TimeoutError и освобождает слот;
+        ожидание свободного слота в тайм-аут не входит.
+        """
+        client = self._get_client()
+        async with self._semaphore:
+            return await asyncio.wait_for(
+                client.messages.create_async(body=body, from_=from_, to=to), self.timeout
+            )
+
+    async def close(self):
+        if self.http_client:
+            await self.http_client.close()
+        self.client = None
+        self.http_client = None
+
+
+twilio_transport = TwilioTransport()